@@ -0,0 +1,511 @@
+"""
+Continuous batching scheduler for model inference
+Concurrent prompts share one running batch: new sequences join the batch
+as soon as they arrive and finished ones leave it without stalling the others
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple
+
+import torch
+
+from . import kv_cache
+from .config import settings
+from .inference import InferenceExecutor, InferenceQueueFull
+from .speculative import PromptLookupDrafter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationRequest:
+    """A prompt waiting for, or undergoing, generation"""
+    prompt_ids: List[int]
+    max_new_tokens: int
+    future: asyncio.Future
+    # Precomputed cache that prompt_ids continue from, if any
+    prefix: Optional[kv_cache.PrefixCache] = None
+    # Where to keep the final cache for the next turn of the conversation
+    session_key: Optional[str] = None
+    generated: List[int] = field(default_factory=list)
+    finished: bool = False
+    # Receives each generated token id, then None once the request is done
+    stream: Optional[asyncio.Queue] = None
+
+
+def token_distribution(logits: torch.Tensor, temperature: float, top_p: float) -> torch.Tensor:
+    """Temperature and nucleus filtered next-token probabilities for each row of `logits`"""
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    if top_p < 1.0:
+        sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+        cumulative = sorted_probs.cumsum(dim=-1)
+        sorted_probs[(cumulative - sorted_probs) > top_p] = 0.0
+        probs = torch.zeros_like(probs).scatter_(-1, sorted_idx, sorted_probs)
+    return probs
+
+
+def sample_next_tokens(logits: torch.Tensor, temperature: float, top_p: float) -> torch.Tensor:
+    """Pick the next token for each row of `logits` with temperature and nucleus sampling"""
+    if temperature <= 0:
+        return logits.argmax(dim=-1)
+    probs = token_distribution(logits, temperature, top_p)
+    return torch.multinomial(probs, num_samples=1).squeeze(-1)
+
+
+def verify_draft(logits: torch.Tensor, draft: List[int], temperature: float, top_p: float) -> List[int]:
+    """
+    Speculative sampling against a deterministic draft
+
+    `logits` holds the model's predictions after the last accepted token and
+    after each draft token. Draft tokens are kept while the model agrees with
+    them; the returned tokens are the accepted draft followed by one token
+    sampled from the model, so the output follows the same distribution as
+    plain decoding.
+    """
+    if temperature <= 0:
+        targets = logits.argmax(dim=-1).tolist()
+        accepted = 0
+        while accepted < len(draft) and draft[accepted] == targets[accepted]:
+            accepted += 1
+        return draft[:accepted] + [targets[accepted]]
+
+    probs = token_distribution(logits, temperature, top_p)
+    for i, token in enumerate(draft):
+        # The draft proposes `token` with certainty, so it is kept with probability p(token)
+        if torch.rand(()) < probs[i, token]:
+            continue
+        residual = probs[i].clone()
+        residual[token] = 0.0
+        return draft[:i] + [int(torch.multinomial(residual / residual.sum(), num_samples=1))]
+    return draft + [int(torch.multinomial(probs[len(draft)], num_samples=1))]
+
+
+class ContinuousBatcher:
+    """
+    Async request queue in front of the model
+
+    Prompts submitted within `batch_window_ms` of each other are prefilled
+    together; while a batch is running, newly queued prompts are prefilled
+    and merged into it between two decoding steps. Model calls run on the
+    inference executor's thread; futures and streams are only touched from
+    the event loop. With a `drafter`, each decoding step verifies the
+    drafted continuation of every sequence in the same forward pass. A
+    sequence whose text comes to contain `stop` leaves the batch at once;
+    the returned text still holds it.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_batch_size: int = None,
+        batch_window_ms: int = None,
+        temperature: float = None,
+        top_p: float = None,
+        session_cache=None,
+        executor: InferenceExecutor = None,
+        max_queue_size: int = None,
+        drafter: PromptLookupDrafter = None,
+        stop: str = None,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.session_cache = session_cache
+        self.drafter = drafter
+        self.stop = stop
+        self.executor = executor or InferenceExecutor()
+        self.max_queue_size = max_queue_size or settings.INFERENCE_QUEUE_SIZE
+        self.max_batch_size = max_batch_size or settings.MAX_BATCH_SIZE
+        self.batch_window = (settings.BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms) / 1000
+        self.temperature = settings.TEMPERATURE if temperature is None else temperature
+        self.top_p = settings.TOP_P if top_p is None else top_p
+
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_token_id
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Running batch state
+        self._active: List[GenerationRequest] = []
+        self._past: Optional[kv_cache.LegacyCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+
+        # Produced on the inference thread, delivered on the event loop
+        self._new_tokens: List[Tuple[GenerationRequest, int]] = []
+        self._done: List[Tuple[GenerationRequest, str]] = []
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def has_capacity(self) -> bool:
+        """Whether a new request would be accepted right now"""
+        return self._queue is None or not self._queue.full()
+
+    async def submit(self, prompt: str, max_new_tokens: int = None) -> str:
+        """Queue a prompt and wait for its generated continuation"""
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+        return await self.submit_ids(prompt_ids, max_new_tokens)
+
+    async def submit_ids(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int = None,
+        prefix: kv_cache.PrefixCache = None,
+        session_key: str = None,
+    ) -> str:
+        """
+        Queue already tokenised prompt ids and wait for the generated text;
+        with a `prefix`, prompt_ids are the tokens that follow it
+        """
+        request = await self._enqueue(prompt_ids, max_new_tokens, prefix=prefix, session_key=session_key)
+        return await request.future
+
+    async def stream(self, prompt: str, max_new_tokens: int = None) -> AsyncIterator[str]:
+        """Queue a prompt and yield decoded text as tokens are generated"""
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+        async for text in self.stream_ids(prompt_ids, max_new_tokens):
+            yield text
+
+    async def stream_ids(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int = None,
+        prefix: kv_cache.PrefixCache = None,
+        session_key: str = None,
+    ) -> AsyncIterator[str]:
+        """Queue already tokenised prompt ids and yield decoded text deltas"""
+        request = await self._enqueue(prompt_ids, max_new_tokens, prefix=prefix, session_key=session_key, stream=True)
+        token_ids, emitted = [], ""
+        try:
+            while True:
+                token = await request.stream.get()
+                if token is None:
+                    break
+                token_ids.append(token)
+                # Decode the whole sequence so word boundaries come out right, and
+                # hold back text ending in an incomplete multi-byte character
+                text = self.tokenizer.decode(token_ids, skip_special_tokens=True)
+                if len(text) > len(emitted) and not text.endswith("\ufffd"):
+                    yield text[len(emitted):]
+                    emitted = text
+            # Re-raises a generation error if the batch failed
+            await request.future
+        finally:
+            if not request.future.done():
+                # Consumer stopped early: let the scheduler drop the sequence
+                request.future.cancel()
+
+    def precompute_prefix(self, prompt_ids: List[int]) -> kv_cache.PrefixCache:
+        """Run prefill once over a fixed prompt prefix and keep its cache"""
+        with torch.inference_mode():
+            outputs = self.model(
+                input_ids=torch.tensor([prompt_ids], dtype=torch.long, device=self.device),
+                use_cache=True,
+            )
+        return kv_cache.PrefixCache(list(prompt_ids), kv_cache.to_legacy(outputs.past_key_values))
+
+    async def _enqueue(
+        self,
+        prompt_ids: List[int],
+        max_new_tokens: int = None,
+        prefix: kv_cache.PrefixCache = None,
+        session_key: str = None,
+        stream: bool = False,
+    ) -> GenerationRequest:
+        self._ensure_running()
+        request = GenerationRequest(
+            prompt_ids=list(prompt_ids),
+            max_new_tokens=max_new_tokens or settings.MAX_NEW_TOKENS,
+            prefix=prefix,
+            session_key=session_key,
+            future=asyncio.get_running_loop().create_future(),
+            stream=asyncio.Queue() if stream else None,
+        )
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            raise InferenceQueueFull()
+        return request
+
+    async def close(self):
+        """Stop the scheduler loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._task.get_loop() is not loop:
+            # Started from another (now gone) event loop
+            self._task, self._queue = None, None
+            self._reset()
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = loop.create_task(self._run())
+
+    async def _collect(self) -> List[GenerationRequest]:
+        """Gather the requests to add to the batch on this iteration"""
+        pending = []
+        free_slots = self.max_batch_size - len(self._active)
+
+        if not self._active:
+            # Idle: block for the first request, then keep the window open for concurrent ones
+            pending.append(await self._queue.get())
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.batch_window
+            while len(pending) < free_slots:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        else:
+            # Running: join whatever is already waiting without delaying the batch
+            while len(pending) < free_slots and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+
+        return [request for request in pending if not request.future.done()]
+
+    async def _run(self):
+        while True:
+            pending = await self._collect()
+            try:
+                new_tokens, done = await self.executor.run(self._iterate, pending)
+            except Exception as e:
+                logger.error(f"Erreur du batch de génération : {e}")
+                self._fail_all(pending, e)
+                continue
+            self._deliver(new_tokens, done)
+
+    def _iterate(self, pending: List[GenerationRequest]):
+        """One scheduler iteration, run on the inference thread"""
+        with torch.inference_mode():
+            if pending:
+                self._admit(pending)
+            if self._active:
+                self._step()
+        new_tokens, done = self._new_tokens, self._done
+        self._new_tokens, self._done = [], []
+        return new_tokens, done
+
+    def _deliver(self, new_tokens: List[Tuple[GenerationRequest, int]], done: List[Tuple[GenerationRequest, str]]):
+        """Pass an iteration's results to the waiting callers"""
+        for request, token in new_tokens:
+            request.stream.put_nowait(token)
+        for request, text in done:
+            if not request.future.done():
+                request.future.set_result(text)
+            if request.stream is not None:
+                request.stream.put_nowait(None)
+
+    def _admit(self, requests: List[GenerationRequest]):
+        """Prefill new prompts together and merge them into the running batch"""
+        length = max(len(request.prompt_ids) for request in requests)
+        input_ids = torch.full((len(requests), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(requests), length), dtype=torch.long)
+        for row, request in enumerate(requests):
+            input_ids[row, length - len(request.prompt_ids):] = torch.tensor(request.prompt_ids)
+            attention_mask[row, length - len(request.prompt_ids):] = 1
+
+        # Requests continuing a precomputed prefix only prefill their own tokens
+        past, past_mask = self._prefix_batch(requests)
+        input_ids = input_ids.to(self.device)
+        attention_mask = torch.cat([past_mask, attention_mask.to(self.device)], dim=1)
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=kv_cache.position_ids(attention_mask)[:, -length:],
+            past_key_values=kv_cache.to_model_cache(past),
+            use_cache=True,
+        )
+        next_tokens = sample_next_tokens(outputs.logits[:, -1, :], self.temperature, self.top_p)
+        past = kv_cache.to_legacy(outputs.past_key_values)
+
+        if self._active:
+            self._past, self._attention_mask = kv_cache.merge(
+                [(self._past, self._attention_mask), (past, attention_mask)]
+            )
+            self._next_tokens = torch.cat([self._next_tokens, next_tokens.unsqueeze(-1)], dim=0)
+        else:
+            self._past, self._attention_mask = past, attention_mask
+            self._next_tokens = next_tokens.unsqueeze(-1)
+
+        self._active.extend(requests)
+        self._record(requests, next_tokens)
+        self._retire()
+
+    def _prefix_batch(self, requests: List[GenerationRequest]):
+        """Stack the requests' prefix caches, left-padded to a common length"""
+        prefixes = [request.prefix for request in requests]
+        if all(prefix is None for prefix in prefixes):
+            return None, torch.zeros((len(requests), 0), dtype=torch.long, device=self.device)
+
+        template = next(prefix.past for prefix in prefixes if prefix is not None)
+        rows = []
+        for prefix in prefixes:
+            if prefix is None:
+                rows.append((kv_cache.empty_like(template), torch.zeros((1, 0), dtype=torch.long, device=self.device)))
+            else:
+                rows.append((prefix.past, torch.ones((1, len(prefix.token_ids)), dtype=torch.long, device=self.device)))
+        return kv_cache.merge(rows)
+
+    def _step(self):
+        """Decode one token for every sequence of the running batch"""
+        if self.drafter is not None:
+            drafts = [self.drafter.draft(self._context(request)) for request in self._active]
+            if any(drafts):
+                self._speculative_step(drafts)
+                return
+
+        attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((len(self._active), 1))], dim=1
+        )
+        outputs = self.model(
+            input_ids=self._next_tokens,
+            attention_mask=attention_mask,
+            position_ids=self._attention_mask.sum(dim=-1, keepdim=True),
+            past_key_values=kv_cache.to_model_cache(self._past),
+            use_cache=True,
+        )
+        self._past = kv_cache.to_legacy(outputs.past_key_values)
+        self._attention_mask = attention_mask
+
+        next_tokens = sample_next_tokens(outputs.logits[:, -1, :], self.temperature, self.top_p)
+        self._next_tokens = next_tokens.unsqueeze(-1)
+        self._record(self._active, next_tokens)
+        self._retire()
+
+    def _speculative_step(self, drafts: List[List[int]]):
+        """
+        Feed each sequence's pending token followed by its draft, keep the
+        accepted part and cut the cache positions of rejected tokens, so the
+        cache grows with the accepted tokens only
+        """
+        batch_size = len(self._active)
+        width = 1 + max(len(draft) for draft in drafts)
+        input_ids = torch.full((batch_size, width), self.pad_token_id, dtype=torch.long)
+        new_mask = torch.zeros((batch_size, width), dtype=torch.long)
+        input_ids[:, 0] = self._next_tokens[:, 0].cpu()
+        for row, draft in enumerate(drafts):
+            input_ids[row, 1:1 + len(draft)] = torch.tensor(draft, dtype=torch.long)
+            new_mask[row, :1 + len(draft)] = 1
+
+        new_mask = new_mask.to(self.device)
+        attention_mask = torch.cat([self._attention_mask, new_mask], dim=1)
+        start = self._attention_mask.sum(dim=-1, keepdim=True)
+        outputs = self.model(
+            input_ids=input_ids.to(self.device),
+            attention_mask=attention_mask,
+            position_ids=start + torch.arange(width, device=self.device),
+            past_key_values=kv_cache.to_model_cache(self._past),
+            use_cache=True,
+        )
+        self._past = kv_cache.to_legacy(outputs.past_key_values)
+
+        next_tokens, lengths = [], []
+        for row, (request, draft) in enumerate(zip(self._active, drafts)):
+            tokens = verify_draft(outputs.logits[row, :1 + len(draft)], draft, self.temperature, self.top_p)
+            kept = self._append(request, tokens)
+            self.drafter.record(len(draft), min(kept, len(tokens) - 1), kept)
+            # The pending token and the kept tokens except the last one stay in the cache
+            lengths.append(self._attention_mask.shape[1] + kept)
+            next_tokens.append(tokens[kept - 1])
+
+        self._past, self._attention_mask = kv_cache.truncate(self._past, attention_mask, lengths)
+        self._next_tokens = torch.tensor(next_tokens, dtype=torch.long, device=self.device).unsqueeze(-1)
+        self._retire()
+
+    def _context(self, request: GenerationRequest) -> List[int]:
+        """Every token of a sequence, the pending one included"""
+        prefix_ids = request.prefix.token_ids if request.prefix is not None else []
+        return prefix_ids + request.prompt_ids + request.generated
+
+    def _record(self, requests: List[GenerationRequest], next_tokens: torch.Tensor):
+        """Append one sampled token to each request"""
+        for request, token in zip(requests, next_tokens.tolist()):
+            self._append(request, [token])
+
+    def _append(self, request: GenerationRequest, tokens: List[int]) -> int:
+        """Append sampled tokens to a request until it finishes; returns how many were used"""
+        for used, token in enumerate(tokens, start=1):
+            if token == self.eos_token_id:
+                request.finished = True
+                return used
+            request.generated.append(token)
+            if request.stream is not None:
+                self._new_tokens.append((request, token))
+            if len(request.generated) >= request.max_new_tokens or self._stopped(request):
+                request.finished = True
+                return used
+        return len(tokens)
+
+    def _stopped(self, request: GenerationRequest) -> bool:
+        """Whether the last token completed the stop string"""
+        if not self.stop:
+            return False
+        # Each token adds at least one character, so the stop string fits in this many
+        tail = request.generated[-len(self.stop):]
+        return self.stop in self.tokenizer.decode(tail, skip_special_tokens=True)
+
+    def _retire(self):
+        """Answer finished sequences and drop them from the running batch"""
+        finished, remaining = [], []
+        for row, request in enumerate(self._active):
+            # A future that is already done means the caller went away
+            done = request.finished or request.future.done()
+            (finished if done else remaining).append(row)
+
+        if not finished:
+            return
+
+        for row in finished:
+            request = self._active[row]
+            # Also kept when the caller stopped early: the tokens seen so far are still valid
+            self._save_session(row, request)
+            self._done.append((request, self.tokenizer.decode(request.generated, skip_special_tokens=True)))
+
+        if remaining:
+            self._past, self._attention_mask = kv_cache.select(self._past, self._attention_mask, remaining)
+            self._next_tokens = self._next_tokens[remaining]
+            self._active = [self._active[row] for row in remaining]
+        else:
+            self._reset()
+
+    def _save_session(self, row: int, request: GenerationRequest):
+        """Hand the finished sequence's cache to the session store"""
+        if self.session_cache is None or request.session_key is None:
+            return
+        # The last sampled token was never fed to the model, so the cache may stop short of it
+        seen = int(self._attention_mask[row].sum())
+        prefix_ids = request.prefix.token_ids if request.prefix is not None else []
+        token_ids = (prefix_ids + request.prompt_ids + request.generated)[:seen]
+        self.session_cache.put(
+            request.session_key, token_ids, kv_cache.compact_row(self._past, self._attention_mask, row)
+        )
+
+    def _fail_all(self, pending: List[GenerationRequest], error: Exception):
+        retired = [request for request, _ in self._done]
+        for request in self._active + pending + retired:
+            if not request.future.done():
+                request.future.set_exception(error)
+            if request.stream is not None:
+                request.stream.put_nowait(None)
+        self._new_tokens, self._done = [], []
+        self._reset()
+
+    def _reset(self):
+        self._active = []
+        self._past = None
+        self._attention_mask = None
+        self._next_tokens = None
@@ -1,12 +1,33 @@
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+import asyncio
+import hashlib
 import json
 import logging
+import time
+from datetime import datetime
 
-from .models import Conversation
+from .models import Conversation, ConversationSummary
 from .language_adapter import LanguageAdapter
+from .batching import ContinuousBatcher
+from .kv_cache import PrefixCache
+from .session_cache import SessionKVCache
+from .inference import InferenceExecutor, InferenceQueueFull, ModelNotReady
+from .quantization import quantize_model
+from .speculative import PromptLookupDrafter, knowledge_texts
+from .response_cache import ResponseCache, cache_key
+from .semantic_cache import MessageEmbedder, SemanticCache
+from .knowledge_index import KnowledgeIndex
+from .knowledge_store import search_knowledge, to_prompt
+from .database import SessionLocal
+from .persistence import ConversationWriter
+from .keywords import keyword_engine
+from .emergency import EmergencyAlert, detect_emergency
+from .prompt_builder import PromptBuilder
+from .summary import ConversationSummarizer
 from .config import settings
 
 logger = logging.getLogger(__name__)
@@ -14,69 +35,488 @@ logger = logging.getLogger(__name__)
 from transformers import AutoTokenizer, AutoModelForCausalLM
 
 class MedicalChatbot:
+    # The model continues the dialogue on its own past this marker
+    STOP_MARKER = "<|user|>"
+    FALLBACK_RESPONSE = "Je suis désolé, je n’ai pas compris. Veuillez réessayer."
+
+    # Model loading states
+    NOT_LOADED = "not_loaded"
+    LOADING = "loading"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
     def __init__(self):
         self.model = None
         self.tokenizer = None
-        self.model_loaded = False
+        self.prompt_builder = None
+        self.batcher = None
+        self.executor = InferenceExecutor()
+        self.prefix_caches = {}
+        self.session_cache = None
+        self.response_cache = ResponseCache() if settings.RESPONSE_CACHE_ENABLED else None
+        self.semantic_cache = None
+        self.embedder = None
+        # With the database backend, workers query the shared FTS index instead of each holding the knowledge base
+        use_index = settings.RETRIEVAL_ENABLED and settings.KNOWLEDGE_BACKEND == "memory"
+        self.knowledge_index = self._load_knowledge_index() if use_index else None
+        self.summarizer = self._load_summarizer() if settings.SUMMARY_ENABLED else None
+        self.conversation_writer = ConversationWriter() if settings.WRITE_BEHIND_ENABLED else None
+        self.status = self.NOT_LOADED
+        self.load_error = None
+        self.load_time = None
+        self.warmup_latency = None
+        self._load_task = None
+        self.language_adapter = LanguageAdapter()
+        self.medical_prompts = {
+            "diagnostic": "Tu es un assistant médical bienveillant adapté au contexte africain. Aide l'utilisateur à décrire ses symptômes, pose des questions de suivi et recommande une consultation si nécessaire.",
+            "medication": "Tu es un assistant médical bienveillant adapté au contexte africain. Donne des informations prudentes sur les médicaments, leur posologie et leurs précautions, sans remplacer l'avis d'un médecin.",
+            "care": "Tu es un assistant médical bienveillant adapté au contexte africain. Donne des conseils de soins simples et respectueux des pratiques locales, et indique quand consulter.",
+        }
+
+    @property
+    def model_loaded(self) -> bool:
+        return self.status == self.READY
+
+    def start_background_load(self) -> asyncio.Task:
+        """Load and warm up the model in the background, once"""
+        if self._load_task is None:
+            self.status = self.LOADING
+            self._load_task = asyncio.get_running_loop().create_task(self.load_model())
+        return self._load_task
 
     async def load_model(self):
+        self.status = self.LOADING
+        self.load_error = None
         try:
-            model_path = "C:\\Users\\JUNIOR\\Desktop\\personnel\\aicell\\CODE2CARE_AICELLGI\\tinyllama-lora-checkpoint"  # 🔁 Mets ici ton chemin exact
-            print(f"📦 Chargement du modèle depuis : {model_path}")
-            self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_path,
-                trust_remote_code=True,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,  # ou torch.float16 si tu forces FP16
-                device_map="auto"
-            )
-            self.model.eval()
-            self.model_loaded = True
-            print("✅ Modèle chargé avec succès.")
+            start = time.perf_counter()
+            # Reading and quantizing weights blocks for a long time: keep it off the event loop
+            await self.executor.run(self._load_weights)
+            self.load_time = time.perf_counter() - start
+
+            self.status = self.WARMING
+            if settings.WARMUP_ENABLED:
+                await self._warm_up()
+            self.status = self.READY
+            print(f"✅ Modèle chargé en {self.load_time:.1f} s, prêt.")
         except Exception as e:
             print("❌ Erreur de chargement du modèle :", str(e))
-            self.model_loaded = False
+            self.load_error = str(e)
+            self.status = self.FAILED
+
+    def _load_weights(self):
+        model_path = settings.MODEL_NAME
+        print(f"📦 Chargement du modèle depuis : {model_path}")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+        self.prompt_builder = PromptBuilder(self.tokenizer)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            trust_remote_code=True,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,  # ou torch.float16 si tu forces FP16
+            device_map="auto"
+        )
+        self.model.eval()
+        self.model = quantize_model(self.model, settings.QUANTIZATION)
+        self.session_cache = SessionKVCache() if settings.SESSION_CACHE_ENABLED else None
+        self.batcher = ContinuousBatcher(
+            self.model, self.tokenizer, session_cache=self.session_cache, executor=self.executor,
+            drafter=self._build_drafter() if settings.SPECULATIVE_DECODING else None, stop=self.STOP_MARKER
+        )
+        self._precompute_prefix_caches()
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self._load_embedder()
+
+    def _load_embedder(self):
+        """Embedding model of the semantic cache; the chatbot works without it"""
+        try:
+            embedder = MessageEmbedder()
+            embedder.load()
+        except Exception as e:
+            logger.warning(f"Cache sémantique désactivé, modèle d'embedding indisponible : {e}")
+            return
+        self.embedder = embedder
+        self.semantic_cache = SemanticCache()
 
+    def _load_knowledge_index(self) -> Optional[KnowledgeIndex]:
+        """Retrieval index over the knowledge base; prompts go without it if the file is unusable"""
+        index = KnowledgeIndex()
+        try:
+            index.load()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Base de connaissances indisponible, réponses sans contexte médical : {e}")
+            return None
+        return index
+
+    def _load_summarizer(self) -> Optional[ConversationSummarizer]:
+        """Summaries need the knowledge base entities; sessions go without them if the file is unusable"""
+        summarizer = ConversationSummarizer()
+        try:
+            summarizer.load()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Résumés de conversation désactivés : {e}")
+            return None
+        return summarizer
+
+    def knowledge_context(self, message: str, language: str) -> List[str]:
+        """
+        Prompt blocks with the knowledge base entries relevant to the message,
+        from all of them down to the best one only, for the token budget to pick from.
+        Blocks on the index reload or the FTS query: run it in a worker thread
+        """
+        if not settings.RETRIEVAL_ENABLED:
+            return []
+        if settings.KNOWLEDGE_BACKEND == "database":
+            lines = self._search_knowledge_lines(message)
+        elif self.knowledge_index is not None:
+            self.knowledge_index.reload_if_changed()
+            lines = self.knowledge_index.retrieve(message, language, settings.KNOWLEDGE_TOP_K)
+        else:
+            return []
+        return ["Informations médicales :\n" + "\n".join(lines[:size]) for size in range(len(lines), 0, -1)]
+
+    def _search_knowledge_lines(self, message: str) -> List[str]:
+        db = SessionLocal()
+        try:
+            return [to_prompt(entry) for entry in search_knowledge(db, message, settings.KNOWLEDGE_TOP_K)]
+        except Exception as e:
+            logger.warning(f"Recherche dans la base de connaissances impossible : {e}")
+            return []
+        finally:
+            db.close()
+
+    def _build_drafter(self) -> PromptLookupDrafter:
+        """Draft proposer indexing the knowledge base, whose phrases answers often copy"""
+        drafter = PromptLookupDrafter()
+        for text in knowledge_texts():
+            drafter.add_document(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+        logger.info(f"Décodage spéculatif activé ({drafter.stats()['documents']} textes indexés)")
+        return drafter
+
+    def speculation_stats(self) -> Optional[Dict]:
+        """Acceptance metrics of speculative decoding, None when it is disabled"""
+        if self.batcher is None or self.batcher.drafter is None:
+            return None
+        return self.batcher.drafter.stats()
+
+    async def _warm_up(self):
+        """
+        Run one short generation through the batcher so kernels, allocators
+        and thread pools are primed before real traffic arrives
+        """
+        start = time.perf_counter()
+        prefix = self.prefix_caches.get("diagnostic")
+        prompt_ids = self.prompt_builder.message_ids("user", "Bonjour") + self.prompt_builder.generation_prompt_ids
+        if prefix is None:
+            prompt_ids = self._encode_system_prompt(self.medical_prompts["diagnostic"]) + prompt_ids
+        await self.batcher.submit_ids(prompt_ids, max_new_tokens=settings.WARMUP_TOKENS, prefix=prefix)
+        self.warmup_latency = time.perf_counter() - start
+        logger.info(f"Préchauffage terminé en {self.warmup_latency:.2f} s")
+
+    def readiness(self) -> Dict:
+        return {
+            "status": self.status,
+            "load_time_s": self.load_time,
+            "warmup_latency_s": self.warmup_latency,
+            "error": self.load_error,
+        }
+
+    def _precompute_prefix_caches(self):
+        """
+        Prefill each system prompt once so requests only prefill what follows it.
+        The prompts are the same for every language, so one cache per prompt type
+        """
+        self.prefix_caches = {}
+        if not settings.PREFIX_CACHE_ENABLED:
+            return
+        for prompt_type, system_prompt in self.medical_prompts.items():
+            self.prefix_caches[prompt_type] = self.batcher.precompute_prefix(self._encode_system_prompt(system_prompt))
+        logger.info(f"Cache des prompts système calculé pour : {', '.join(self.prefix_caches)}")
+
+    def _encode_system_prompt(self, system_prompt: str) -> List[int]:
+        return self.prompt_builder.system_ids(system_prompt)
+
+
+    def has_capacity(self) -> bool:
+        """Whether the inference queue can take another request"""
+        return self.batcher is None or self.batcher.has_capacity()
+
+    def detect_emergency(self, message: str, language: str = "fr") -> Optional[EmergencyAlert]:
+        """Emergency signs in the message, answered without the model; None when there are none"""
+        if not settings.EMERGENCY_FAST_PATH_ENABLED:
+            return None
+        return detect_emergency(message, language)
 
     def classify_message_type(self, message: str) -> str:
-        message = message.lower()
-        if any(k in message for k in ['symptômes', 'fièvre', 'douleur']): return "diagnostic"
-        if any(k in message for k in ['médicament', 'traitement', 'pilule']): return "medication"
-        if any(k in message for k in ['soins', 'prendre soin']): return "care"
+        matches = keyword_engine.scan(message)
+        if matches.has("type:diagnostic"): return "diagnostic"
+        if matches.has("type:medication"): return "medication"
+        if matches.has("type:care"): return "care"
         return "diagnostic"
 
-    async def generate_response(self, message: str, language: str = "fr", history: List[Dict] = None, user_context: Dict = None) -> str:
+    def _response_cache_key(self, message: str, language: str, history: List[Dict], user_context: Dict) -> Optional[str]:
+        """
+        Response cache key for a message, or None when the cache cannot be
+        used: past turns and user context make the answer specific to a user
+        """
+        if self.response_cache is None:
+            return None
+        if history or user_context:
+            self.response_cache.record_bypass()
+            return None
+        message_type = self.classify_message_type(message)
+        # Anything else that shapes the answer: prompt, model and generation settings
+        context = "\x1f".join([
+            self.medical_prompts.get(message_type, ""), settings.MODEL_NAME, settings.QUANTIZATION, str(settings.MAX_NEW_TOKENS),
+            str(self.knowledge_index.version if self.knowledge_index is not None else 0)
+        ])
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        return cache_key(message, message_type, language, context_hash)
+
+    def response_cache_stats(self) -> Optional[Dict]:
+        return self.response_cache.stats() if self.response_cache is not None else None
+
+    def semantic_cache_stats(self) -> Optional[Dict]:
+        return self.semantic_cache.stats() if self.semantic_cache is not None else None
+
+    async def _cached_response(self, response_key: Optional[str], message: str, language: str, history: List[Dict], user_context: Dict) -> Optional[str]:
+        """Answer from the exact cache, else from a similar past question, else None"""
+        if response_key is not None:
+            cached = await self.response_cache.get_async(response_key)
+            if cached is not None:
+                return cached
+
+        if self.semantic_cache is None or history or user_context:
+            return None
+        vector = await self.executor.run(self.embedder.embed, message)
+        cached = self.semantic_cache.lookup(vector, language)
+        if cached is not None and response_key is not None:
+            # The paraphrase is answered from the exact cache next time
+            await self.response_cache.put_async(response_key, cached)
+        return cached
+
+    async def remember_answer(self, message: str, language: str, response: str, score: float, history: List[Dict] = None, user_context: Dict = None):
+        """Offer an evaluated answer to the semantic cache; only good, context-free answers are kept"""
+        if self.semantic_cache is None or history or user_context:
+            return
+        if score < settings.SEMANTIC_CACHE_MIN_SCORE or response == self.FALLBACK_RESPONSE:
+            return
+        vector = await self.executor.run(self.embedder.embed, message)
+        match = self.semantic_cache.search(vector, language)
+        # Answers served from the cache, or near duplicates, are already indexed
+        if match is not None and match[2] >= settings.SEMANTIC_CACHE_DEDUP_THRESHOLD:
+            return
+        self.semantic_cache.add(vector, language, message, response)
+
+    async def generate_response(self, message: str, language: str = "fr", history: List[Dict] = None, user_context: Dict = None, session_key: str = None, summary: Dict = None,
+                                adapted_message: str = None, knowledge: List[str] = None) -> str:
+        # Cached answers do not need the model, so they are served even while it loads
+        response_key = self._response_cache_key(message, language, history, user_context)
+        cached = await self._cached_response(response_key, message, language, history, user_context)
+        if cached is not None:
+            return cached
+
         if not self.model_loaded:
-            await self.load_model()
+            raise ModelNotReady(self.status)
 
         try:
-            prompt_type = self.classify_message_type(message)
-            system_prompt = self.medical_prompts.get(prompt_type, self.medical_prompts["diagnostic"])
+            prefix, prompt_ids = await self._build_prompt(
+                message, language, history, user_context, session_key, summary, adapted_message, knowledge
+            )
+            generated = await self.batcher.submit_ids(
+                prompt_ids, max_new_tokens=settings.MAX_NEW_TOKENS, prefix=prefix, session_key=session_key
+            )
+            response = generated.split(self.STOP_MARKER)[0].strip()
+            response = self._post_process_response(response, language)
+            if response_key is not None:
+                await self.response_cache.put_async(response_key, response)
+            return response
+        except InferenceQueueFull:
+            raise
+        except Exception as e:
+            logger.error(f"Erreur de génération : {e}")
+            return self.FALLBACK_RESPONSE
 
-            adapted_message = await self.language_adapter.adapt_message(message, language)
-            context = self._build_context(history, user_context)
+    async def stream_response(self, message: str, language: str = "fr", history: List[Dict] = None, user_context: Dict = None, session_key: str = None, summary: Dict = None,
+                              adapted_message: str = None, knowledge: List[str] = None) -> AsyncIterator[str]:
+        """
+        Yield the response text as it is generated; the disclaimer added by
+        _post_process_response comes as the last chunk
+        """
+        response_key = self._response_cache_key(message, language, history, user_context)
+        cached = await self._cached_response(response_key, message, language, history, user_context)
+        if cached is not None:
+            yield cached
+            return
 
-            full_prompt = f"{system_prompt}\n{context}\nUtilisateur: {adapted_message}\nAssistant:"
-            result = self.pipeline(
-                full_prompt,
-                max_new_tokens=200,
-                pad_token_id=self.tokenizer.eos_token_id
+        if not self.model_loaded:
+            raise ModelNotReady(self.status)
+
+        try:
+            prefix, prompt_ids = await self._build_prompt(
+                message, language, history, user_context, session_key, summary, adapted_message, knowledge
             )
-            response = result[0]["generated_text"].split("Assistant:")[-1].strip()
-            return self._post_process_response(response, language)
         except Exception as e:
             logger.error(f"Erreur de génération : {e}")
-            return "Je suis désolé, je n’ai pas compris. Veuillez réessayer."
-
-    def _build_context(self, history: List[Dict], user_context: Dict) -> str:
-        context = ""
-        if user_context:
-            context += f"Contexte utilisateur : {json.dumps(user_context, ensure_ascii=False)}\n"
-        if history:
-            context += "Historique :\n"
-            for h in history[-3:]:
-                context += f"U: {h['message']}\nA: {h['response']}\n"
-        return context
+            yield self.FALLBACK_RESPONSE
+            return
+
+        text, sent = "", 0
+        tokens = self.batcher.stream_ids(
+            prompt_ids, max_new_tokens=settings.MAX_NEW_TOKENS, prefix=prefix, session_key=session_key
+        )
+        try:
+            async for delta in tokens:
+                text += delta
+                visible = text.lstrip()
+                if self.STOP_MARKER in visible:
+                    text = visible.split(self.STOP_MARKER)[0]
+                    break
+                # Hold back a tail that could be the start of the stop marker
+                safe = len(visible) - self._stop_marker_overlap(visible)
+                if safe > sent:
+                    yield visible[sent:safe]
+                    sent = safe
+        except InferenceQueueFull:
+            raise
+        except Exception as e:
+            logger.error(f"Erreur de génération : {e}")
+            if not sent:
+                yield self.FALLBACK_RESPONSE
+                return
+            # A truncated answer is still shown but never cached
+            response_key = None
+        finally:
+            await tokens.aclose()
+
+        final = self._post_process_response(text.lstrip(), language)
+        if response_key is not None:
+            await self.response_cache.put_async(response_key, final)
+        if len(final) > sent:
+            yield final[sent:]
+
+    async def _build_prompt(self, message: str, language: str, history: List[Dict], user_context: Dict, session_key: str = None, summary: Dict = None,
+                            adapted_message: str = None, knowledge: List[str] = None) -> Tuple[Optional[PrefixCache], List[int]]:
+        """
+        Tokenise the prompt and pick the longest cached prefix for it: the
+        session's previous turn if it is still cached, else the system prompt.
+        `summary` is the stored summary of the history turns before the
+        context window; the turns of the window left out for lack of room
+        are added to it.
+        `adapted_message` and `knowledge` are computed here unless the caller
+        prepared them already.
+        Returns that prefix (or None) and the token ids that follow it
+        """
+        window = self._context_window(history)
+        # The conversation keeps the prompt of its opening message so that
+        # consecutive turns share the system prompt in their cache
+        prompt_type = self.classify_message_type(window[0]["message"] if window else message)
+        if prompt_type not in self.medical_prompts:
+            prompt_type = "diagnostic"
+
+        if adapted_message is None:
+            adapted_message = await self.language_adapter.adapt_message(message, language)
+        if knowledge is None:
+            # Index reloads and the FTS query block: kept off the event loop
+            knowledge = await asyncio.to_thread(self.knowledge_context, message, language)
+        messages = self._build_context(
+            self.medical_prompts[prompt_type], adapted_message, window, user_context, knowledge, summary
+        )
+
+        # Each message's ids are cached: only the new ones are tokenised
+        rest_ids = self.prompt_builder.conversation_ids(messages) + self.prompt_builder.generation_prompt_ids
+
+        prefix = self.prefix_caches.get(prompt_type)
+        system_ids = prefix.token_ids if prefix is not None else self._encode_system_prompt(self.medical_prompts[prompt_type])
+        prompt_ids = system_ids + rest_ids
+
+        if session_key and self.session_cache is not None:
+            session_prefix = self.session_cache.take(session_key, prompt_ids)
+            if session_prefix is not None and (prefix is None or len(session_prefix.token_ids) > len(prefix.token_ids)):
+                prefix = session_prefix
+
+        if prefix is None:
+            return None, prompt_ids
+        return prefix, prompt_ids[len(prefix.token_ids):]
+
+    def _context_window(self, history: List[Dict]) -> List[Dict]:
+        """
+        History turns that may go in the prompt, at least CONTEXT_MIN_TURNS of
+        them as long as they fit in the token budget.
+        The window start only moves every CONTEXT_TURN_STRIDE turns, so each
+        prompt extends the previous one and the session cache stays usable
+        """
+        if not history:
+            return []
+        return history[self._window_start(history):]
+
+    def _window_start(self, history: List[Dict]) -> int:
+        """
+        Index in `history` of the first turn of the context window. It is
+        placed by the position of the turns in the session, their "turn" key,
+        not by the length of `history`, which stops growing at
+        MAX_CONVERSATION_LENGTH
+        """
+        first = history[0].get("turn", 0) if history else 0
+        overflow = max(0, first + len(history) - settings.CONTEXT_MIN_TURNS)
+        return max(0, overflow // settings.CONTEXT_TURN_STRIDE * settings.CONTEXT_TURN_STRIDE - first)
+
+    def summary_text(self, summary: Optional[Dict]) -> str:
+        """Prompt text of a session summary"""
+        if self.summarizer is None:
+            return ""
+        return self.summarizer.render(summary)
+
+    def update_summary(self, summary: Optional[Dict], history: List[Dict]) -> Optional[Dict]:
+        """
+        Summary extended with the turns that left the context window since it
+        was last updated, or None when it is already up to date. The window
+        start moves every CONTEXT_TURN_STRIDE turns, and so does the summary,
+        which keeps the prompt prefix stable between those moves
+        """
+        if self.summarizer is None:
+            return None
+        last_id = summary.get("last_conversation_id", 0) if summary else 0
+        turns = [turn for turn in history[:self._window_start(history)] if turn["id"] > last_id]
+        if not turns:
+            return None
+        updated = self.summarizer.update(summary, turns)
+        updated["last_conversation_id"] = turns[-1]["id"]
+        return updated
+
+    def session_key(self, user_id: str, session_id: str) -> str:
+        return f"{user_id}:{session_id}"
+
+    def _stop_marker_overlap(self, text: str) -> int:
+        """Length of the longest suffix of `text` that is a prefix of the stop marker"""
+        for size in range(min(len(text), len(self.STOP_MARKER) - 1), 0, -1):
+            if self.STOP_MARKER.startswith(text[-size:]):
+                return size
+        return 0
+
+    def _build_context(self, system_prompt: str, message: str, history: List[Dict], user_context: Dict, knowledge: List[str], summary: Dict = None) -> List[Tuple[str, str]]:
+        """
+        Messages following the system prompt, within the prompt token budget.
+        Past turns use the same layout as the current one, so the prompt of a
+        turn is the previous prompt plus the previous answer plus the new
+        message; the knowledge block comes after them for the same reason
+        """
+        # Unset fields only cost tokens
+        fields = {key: value for key, value in (user_context or {}).items() if value not in (None, "", [], {})}
+        context = f"Contexte utilisateur : {json.dumps(fields, ensure_ascii=False)}" if fields else None
+        summarize = None
+        if self.summarizer is not None:
+            summarize = lambda dropped: self.summarizer.render(self.summarizer.update(summary, dropped))
+        return self.prompt_builder.fit(
+            system_prompt, message, history or [], self._prompt_budget(),
+            user_context=context, knowledge=knowledge, summary=self.summary_text(summary), summarize=summarize
+        )
+
+    def _prompt_budget(self) -> int:
+        """Tokens a prompt may take: MAX_TOKENS, leaving room for the answer in the model's context"""
+        max_length = getattr(getattr(self.model, "config", None), "max_position_embeddings", None)
+        if not max_length:
+            return settings.MAX_TOKENS
+        return min(settings.MAX_TOKENS, max_length - settings.MAX_NEW_TOKENS)
 
     def _post_process_response(self, response: str, language: str) -> str:
         disclaimer = {
@@ -86,3 +526,112 @@ class MedicalChatbot:
         if "consulte" not in response.lower():
             response += disclaimer.get(language, disclaimer["fr"])
         return response
+
+    async def get_conversation_history(self, db: AsyncSession, user_id: str, session_id: str,
+                                       include_pending: bool = True) -> Tuple[List[Conversation], int]:
+        """
+        Most recent turns of a session, oldest first, including those still
+        queued for writing unless `include_pending` is False, and the index
+        of the first of them in the whole session
+        """
+        # Taken before the query: rows written meanwhile are in both
+        pending = self.conversation_writer.pending(user_id, session_id) if include_pending and self.conversation_writer is not None else []
+        # The total comes with the rows, so both see the same writes
+        result = (await db.execute(
+            select(Conversation, func.count().over())
+            .where(Conversation.user_id == user_id, Conversation.session_id == session_id)
+            .order_by(Conversation.timestamp.desc(), Conversation.id.desc())
+            .limit(settings.MAX_CONVERSATION_LENGTH)
+        )).all()
+        total = result[0][1] if result else 0
+        stored = {row.id for row, _ in result}
+        queued = [row for row in pending if row.id not in stored]
+        rows = ([row for row, _ in reversed(result)] + queued)[-settings.MAX_CONVERSATION_LENGTH:]
+        return rows, total + len(queued) - len(rows)
+
+    async def get_conversation_page(self, db: AsyncSession, user_id: str, session_id: str, after: Tuple[datetime, int] = None,
+                                    since: datetime = None, limit: int = None) -> Tuple[List[Conversation], bool]:
+        """
+        Turns of a session in (timestamp, id) order, past the `after` key and
+        the `since` time: at most `limit` turns, and whether more follow.
+        Without `since`, room left on the last page goes to the turns still
+        queued for writing, which have no id yet. Syncs by `since` only get
+        written turns, so each turn reaches them once, with its id
+        """
+        limit = limit or settings.HISTORY_PAGE_SIZE
+        # Taken before the query: rows written meanwhile are in both
+        pending = self.conversation_writer.pending(user_id, session_id) if self.conversation_writer is not None else []
+        query = select(Conversation).where(Conversation.user_id == user_id, Conversation.session_id == session_id)
+        if after is not None:
+            query = query.where(tuple_(Conversation.timestamp, Conversation.id) > tuple_(*after))
+        if since is not None:
+            query = query.where(Conversation.timestamp > since)
+        rows = list((await db.scalars(
+            query.order_by(Conversation.timestamp, Conversation.id).limit(limit + 1)
+        )).all())
+        if len(rows) > limit:
+            return rows[:limit], True
+        if since is not None:
+            return rows, False
+        stored = {row.id for row in rows}
+        queued = [
+            row for row in pending
+            if row.id not in stored
+            # Written after the query, but maybe before the previous page's
+            and (after is None or (row.timestamp > after[0] if row.id is None else (row.timestamp, row.id) > after))
+        ]
+        return rows + queued[:limit - len(rows)], False
+
+    async def save_conversation(self, db: AsyncSession, user_id: str, session_id: str, message: str, response: str, language: str, evaluation_score: float) -> Conversation:
+        conversation = Conversation(
+            user_id=user_id,
+            session_id=session_id,
+            message=message,
+            response=response,
+            language=language,
+            evaluation_score=evaluation_score,
+            is_encrypted=settings.ENCRYPT_CONVERSATIONS,
+            # Stamped here, with the microseconds the history cursors compare
+            timestamp=datetime.utcnow()
+        )
+        if self.conversation_writer is not None:
+            # Written later with other rows; visible to get_conversation_history meanwhile
+            return await self.conversation_writer.put(conversation)
+        db.add(conversation)
+        await db.commit()
+        await db.refresh(conversation)
+        return conversation
+
+    async def get_summary(self, db: AsyncSession, user_id: str, session_id: str) -> Optional[ConversationSummary]:
+        return (await db.scalars(select(ConversationSummary).where(
+            ConversationSummary.user_id == user_id,
+            ConversationSummary.session_id == session_id
+        ))).first()
+
+    async def save_summary(self, db: AsyncSession, user_id: str, session_id: str, summary: str, last_conversation_id: int) -> ConversationSummary:
+        row = await self.get_summary(db, user_id, session_id)
+        if row is None:
+            row = ConversationSummary(user_id=user_id, session_id=session_id)
+            db.add(row)
+        row.summary = summary
+        row.last_conversation_id = last_conversation_id
+        row.is_encrypted = settings.ENCRYPT_CONVERSATIONS
+        await db.commit()
+        return row
+
+    async def delete_conversation_history(self, db: AsyncSession, user_id: str, session_id: str):
+        if self.session_cache is not None:
+            self.session_cache.invalidate(self.session_key(user_id, session_id))
+        if self.conversation_writer is not None:
+            self.conversation_writer.discard(user_id, session_id)
+            # Rows of the session already being written land before the delete
+            await self.conversation_writer.flush()
+        await db.execute(delete(Conversation).where(
+            Conversation.user_id == user_id,
+            Conversation.session_id == session_id
+        ))
+        await db.execute(delete(ConversationSummary).where(
+            ConversationSummary.user_id == user_id,
+            ConversationSummary.session_id == session_id
+        ))
+        await db.commit()
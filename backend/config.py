@@ -30,6 +30,21 @@ class Settings:
     
     # Database Configuration
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./medical_chatbot.db")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # connections kept open per engine
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))  # extra connections opened under load, closed once returned
+    DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))  # wait for a free connection before failing
+    DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))  # reopen connections older than this
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"  # check connections before handing them out
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # readers no longer wait for the writer
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # safe with WAL, fsync at checkpoints only
+    SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+    SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))  # page cache per connection
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # wait for a lock instead of failing
+    WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "True").lower() == "true"  # queue conversations and write them in bulk
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "64"))  # rows that trigger a flush
+    WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))  # longest a row waits to be written
+    WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "1024"))  # a full queue is flushed by the request adding to it
+    WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "3"))  # failed batch writes before the rows are written one by one
     
     # API Configuration
     API_HOST = os.getenv("API_HOST", "0.0.0.0")
@@ -40,19 +55,97 @@ class Settings:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
     ALGORITHM = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    # Users allowed on the /admin endpoints, none by default. /token issues a token for any
+    # username, so only list admins once it checks real credentials
+    ADMIN_USERS = [user for user in os.getenv("ADMIN_USERS", "").split(",") if user]
     
     # Language Configuration
     DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "fr")
     SUPPORTED_LANGUAGES = os.getenv("SUPPORTED_LANGUAGES", "fr,en,wolof,hausa,swahili").split(",")
+    LANGUAGE_PROFILES_PATH = os.getenv("LANGUAGE_PROFILES_PATH", "data/language_profiles.json")  # python -m scripts.build_language_profiles
+    LANGUAGE_ID_CACHE_SIZE = int(os.getenv("LANGUAGE_ID_CACHE_SIZE", "10000"))
+    LANGUAGE_ID_MIN_LETTERS = int(os.getenv("LANGUAGE_ID_MIN_LETTERS", "4"))  # shorter messages are not identified
+    TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "local")  # local (offline phrase table), google or none
+    TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "translation_memory.db")
+    TRANSLATION_MIN_COVERAGE = float(os.getenv("TRANSLATION_MIN_COVERAGE", "0.75"))  # share of words the phrase table must know
+    TRANSLATION_PREWARM = os.getenv("TRANSLATION_PREWARM", "True").lower() == "true"
+    # Also keep the translated sentences of patient messages in the translation memory, encrypted
+    # with ENCRYPT_CONVERSATIONS; by default it only holds the pre-warmed knowledge base names
+    TRANSLATION_MEMORY_STORE_MESSAGES = os.getenv("TRANSLATION_MEMORY_STORE_MESSAGES", "False").lower() == "true"
+    MEDICAL_GLOSSARY_PATH = os.getenv("MEDICAL_GLOSSARY_PATH", "data/medical_glossary.json")
     
     # Privacy Configuration
     ENCRYPT_CONVERSATIONS = os.getenv("ENCRYPT_CONVERSATIONS", "True").lower() == "true"
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     MAX_CONVERSATION_LENGTH = int(os.getenv("MAX_CONVERSATION_LENGTH", "50"))
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))  # default page of GET /history
+    HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+    HISTORY_EXPORT_BATCH_SIZE = int(os.getenv("HISTORY_EXPORT_BATCH_SIZE", "500"))  # rows per query of the NDJSON export
     
     # Model Configuration
-    MAX_TOKENS = int(os.getenv("MAX_TOKENS", "512"))
+    MAX_TOKENS = int(os.getenv("MAX_TOKENS", "512"))  # prompt budget, capped by the model's context length
     TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
     TOP_P = float(os.getenv("TOP_P", "0.9"))
+    MAX_NEW_TOKENS = int(os.getenv("MAX_NEW_TOKENS", "200"))
+    QUANTIZATION = os.getenv("QUANTIZATION", "none")  # none, int8 or int4 (CPU only)
+    QUANT_GROUP_SIZE = int(os.getenv("QUANT_GROUP_SIZE", "128"))
+
+    # Batching Configuration
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+    BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "20"))
+    INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+    RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "5"))
+    PREPROCESS_HISTORY_TIMEOUT_MS = int(os.getenv("PREPROCESS_HISTORY_TIMEOUT_MS", "2000"))  # the history is required, past this the request fails
+    PREPROCESS_ADAPT_TIMEOUT_MS = int(os.getenv("PREPROCESS_ADAPT_TIMEOUT_MS", "500"))  # the message is used as written past this
+    PREPROCESS_KNOWLEDGE_TIMEOUT_MS = int(os.getenv("PREPROCESS_KNOWLEDGE_TIMEOUT_MS", "300"))  # the prompt goes without knowledge past this
+    PREPROCESS_GRACE_MS = int(os.getenv("PREPROCESS_GRACE_MS", "50"))  # wait for optional inputs once the history is loaded
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "True").lower() == "true"
+    WARMUP_TOKENS = int(os.getenv("WARMUP_TOKENS", "8"))
+
+    # KV Cache Configuration
+    PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE_ENABLED", "True").lower() == "true"
+    SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "True").lower() == "true"
+    SESSION_CACHE_MAX_MB = int(os.getenv("SESSION_CACHE_MAX_MB", "1024"))
+    CONTEXT_MIN_TURNS = int(os.getenv("CONTEXT_MIN_TURNS", "3"))
+    CONTEXT_TURN_STRIDE = int(os.getenv("CONTEXT_TURN_STRIDE", "5"))
+
+    # Prompt Configuration
+    CHAT_TEMPLATE_PATH = os.getenv("CHAT_TEMPLATE_PATH", "tinyllama-lora-checkpoint/chat_template.jinja")  # used when the tokenizer has no chat template
+    PROMPT_SEGMENT_CACHE_SIZE = int(os.getenv("PROMPT_SEGMENT_CACHE_SIZE", "4096"))
+    SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "True").lower() == "true"  # rolling summary of the turns left out of the prompt
+    SUMMARY_MAX_ITEMS = int(os.getenv("SUMMARY_MAX_ITEMS", "8"))  # entities kept per summary section
+
+    # Emergency Configuration
+    # Danger signs are recognised in French, English, Swahili and Hausa only: no Wolof terms yet (see keywords.py)
+    EMERGENCY_FAST_PATH_ENABLED = os.getenv("EMERGENCY_FAST_PATH_ENABLED", "True").lower() == "true"
+    EMERGENCY_FOLLOWUP_ENABLED = os.getenv("EMERGENCY_FOLLOWUP_ENABLED", "False").lower() == "true"
+
+    # Response Cache Configuration
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+    RESPONSE_CACHE_DISK_PATH = os.getenv("RESPONSE_CACHE_DISK_PATH", "")  # SQLite file, empty to keep the cache in memory only
+
+    # Semantic Cache Configuration
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"
+    EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_DEDUP_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_DEDUP_THRESHOLD", "0.98"))
+    SEMANTIC_CACHE_MIN_SCORE = float(os.getenv("SEMANTIC_CACHE_MIN_SCORE", "0.7"))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+    # Speculative Decoding Configuration
+    SPECULATIVE_DECODING = os.getenv("SPECULATIVE_DECODING", "False").lower() == "true"
+    SPECULATIVE_NUM_TOKENS = int(os.getenv("SPECULATIVE_NUM_TOKENS", "5"))
+    SPECULATIVE_MAX_NGRAM = int(os.getenv("SPECULATIVE_MAX_NGRAM", "3"))
+    SPECULATIVE_MIN_NGRAM = int(os.getenv("SPECULATIVE_MIN_NGRAM", "2"))
+
+    # Knowledge Base Configuration
+    MEDICAL_KNOWLEDGE_PATH = os.getenv("MEDICAL_KNOWLEDGE_PATH", "data/medical_knowledge.json")
+    RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "True").lower() == "true"
+    KNOWLEDGE_BACKEND = os.getenv("KNOWLEDGE_BACKEND", "memory")  # memory (JSON index per worker) or database (FTS5 search)
+    KNOWLEDGE_LOAD_BATCH_SIZE = int(os.getenv("KNOWLEDGE_LOAD_BATCH_SIZE", "500"))
+    KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+    KNOWLEDGE_RELOAD_INTERVAL_SECONDS = int(os.getenv("KNOWLEDGE_RELOAD_INTERVAL_SECONDS", "30"))
 
 settings = Settings()
\ No newline at end of file
@@ -1,25 +1,88 @@
 """
 Database configuration and session management
+The request path uses the async engine (aiosqlite for SQLite, asyncpg for
+PostgreSQL); the sync engine remains for startup, admin endpoints and scripts
 """
 
-from sqlalchemy import create_engine
+from typing import AsyncIterator, Dict, List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
 from .config import settings
 from .models import Base
+from .knowledge_store import create_knowledge_search
+from .migrations import migrate
+
+# Async driver of each backend, used whatever driver DATABASE_URL names
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def async_database_url(url: str) -> str:
+    """Same database as `url`, through the async driver of its backend"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+def pool_options(url: str) -> Dict:
+    """Pool sizing from the settings; in-memory SQLite keeps its single-connection pool"""
+    parsed = make_url(url)
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if parsed.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if parsed.database in (None, "", ":memory:"):
+            return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    )
+    return options
+
+def sqlite_pragmas() -> List[str]:
+    """Production SQLite profile: concurrent readers with one writer, fewer fsyncs, larger caches"""
+    return [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}",
+        # Negative sizes are in KiB
+        f"PRAGMA cache_size={-settings.SQLITE_CACHE_SIZE_MB * 1024}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+    ]
+
+def use_sqlite_profile(engine: Engine):
+    """Apply sqlite_pragmas() to every connection the engine opens"""
+    @event.listens_for(engine, "connect")
+    def apply_profile(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+        cursor.close()
 
 # Create database engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+engine = create_engine(settings.DATABASE_URL, **pool_options(settings.DATABASE_URL))
 
 # Create sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(async_database_url(settings.DATABASE_URL), **pool_options(settings.DATABASE_URL))
+
+if engine.dialect.name == "sqlite":
+    use_sqlite_profile(engine)
+    use_sqlite_profile(async_engine.sync_engine)
+
+# Rows stay readable after commit, the session being closed right after the request
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables, then bring existing ones up to date"""
     Base.metadata.create_all(bind=engine)
+    create_knowledge_search(engine)
+    migrate(engine)
 
 def get_db():
     """Get database session"""
@@ -27,4 +90,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,82 @@
+"""
+Emergency-sign detection
+Messages describing a danger sign get an immediate, templated advice to
+seek care instead of waiting for the language model
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from .keywords import keyword_engine, normalize
+
+# Sign labels shown to the user; languages without labels use the French ones
+EMERGENCY_SIGN_LABELS = {
+    "high_fever": {"fr": "Fièvre très élevée (>39°C)", "en": "Very high fever (>39°C)"},
+    "breathing": {"fr": "Difficultés respiratoires sévères", "en": "Severe breathing difficulties"},
+    "vomiting": {"fr": "Vomissements persistants", "en": "Persistent vomiting"},
+    "dehydration": {"fr": "Signes de déshydratation sévère", "en": "Signs of severe dehydration"},
+    "convulsions": {"fr": "Convulsions", "en": "Convulsions"},
+    "unconscious": {"fr": "Perte de conscience", "en": "Loss of consciousness"},
+}
+
+EMERGENCY_RESPONSES = {
+    "fr": "⚠️ Ce que vous décrivez ({signs}) peut être une urgence médicale. Consultez immédiatement un professionnel de santé : "
+          "rendez-vous au centre de santé ou à l'hôpital le plus proche, ou appelez les secours. N'attendez pas que les symptômes s'aggravent.",
+    "en": "⚠️ What you describe ({signs}) may be a medical emergency. See a health professional immediately: "
+          "go to the nearest health centre or hospital, or call emergency services. Do not wait for the symptoms to get worse.",
+    "swahili": "⚠️ Unachoeleza ({signs}) kinaweza kuwa dharura ya kiafya. Nenda kituo cha afya au hospitali iliyo karibu mara moja, "
+               "au piga simu ya dharura.",
+    "hausa": "⚠️ Abin da kuka bayyana ({signs}) na iya zama gaggawa ta lafiya. Ku je asibiti ko cibiyar lafiya mafi kusa nan take, "
+             "ko ku kira taimakon gaggawa.",
+}
+
+# Words negating a sign named shortly after them in the same clause ("pas de convulsion", "no seizure");
+# languages without a list use the French one, like the labels
+NEGATIONS = {
+    "fr": {"pas", "aucun", "aucune", "sans", "jamais", "ni", "non"},
+    "en": {"no", "not", "never", "without", "none", "don't", "doesn't", "didn't", "isn't", "wasn't", "hasn't", "hadn't", "haven't"},
+}
+# Words between a negation and the sign it negates, at most
+NEGATION_SCOPE = 3
+CLAUSE_BREAKS = {".", ",", ";", ":", "!", "?", "mais", "but"}
+_WORDS = re.compile(r"\w+(?:'\w+)*|[.,;:!?]")
+
+
+@dataclass
+class EmergencyAlert:
+    """Emergency signs found in a message and the answer to give right away"""
+    signs: List[str]
+    labels: List[str]
+    response: str = field(default="")
+
+
+def negated(text: str, start: int, language: str = "fr") -> bool:
+    """Whether a negation of `language` comes shortly before `start` in the normalized text, in the same clause"""
+    cues = NEGATIONS.get(language, NEGATIONS["fr"])
+    for word in reversed(_WORDS.findall(text[:start])[-NEGATION_SCOPE - 1:]):
+        if word in CLAUSE_BREAKS:
+            return False
+        if word in cues:
+            return True
+    return False
+
+
+def detect_emergency(message: str, language: str = "fr") -> Optional[EmergencyAlert]:
+    """
+    Emergency signs mentioned in `message`, in any supported language, or
+    None. A sign only negated in the message ("pas de convulsion") is not
+    reported; negations are only known in French and English
+    """
+    matches = keyword_engine.scan(message)
+    if not any(matches.has(f"emergency:{sign}") for sign in EMERGENCY_SIGN_LABELS):
+        return None
+    text = normalize(message)
+    found = {category for start, category, _ in keyword_engine.occurrences(message, "emergency:") if not negated(text, start, language)}
+    signs = [sign for sign in EMERGENCY_SIGN_LABELS if f"emergency:{sign}" in found]
+    if not signs:
+        return None
+
+    labels = [EMERGENCY_SIGN_LABELS[sign].get(language, EMERGENCY_SIGN_LABELS[sign]["fr"]) for sign in signs]
+    template = EMERGENCY_RESPONSES.get(language, EMERGENCY_RESPONSES["fr"])
+    return EmergencyAlert(signs, labels, template.format(signs=", ".join(labels)))
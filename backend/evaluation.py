@@ -7,6 +7,8 @@ from typing import Dict, List
 from nltk.sentiment import SentimentIntensityAnalyzer
 import nltk
 
+from .keywords import KEYWORD_SETS, KeywordMatches, keyword_engine
+
 # Download required NLTK data
 try:
     nltk.data.find('vader_lexicon')
@@ -22,21 +24,19 @@ class ResponseEvaluator:
         self.sentiment_analyzer = SentimentIntensityAnalyzer()
         
         # Keywords that indicate good medical responses
-        self.positive_indicators = [
-            'consulter', 'médecin', 'professionnel', 'diagnostic',
-            'traitement', 'suivi', 'important', 'attention'
-        ]
+        self.positive_indicators = KEYWORD_SETS['positive']
         
         # Keywords that might indicate problematic responses
-        self.negative_indicators = [
-            'certain', 'sûr', 'définitivement', 'toujours',
-            'jamais', 'impossible', 'pas besoin'
-        ]
+        self.negative_indicators = KEYWORD_SETS['negative']
     
     def evaluate_response(self, user_message: str, bot_response: str) -> Dict:
         """
         Evaluate a bot response across multiple dimensions
         """
+        # One pass over each text feeds every keyword based criterion
+        response_matches = keyword_engine.scan(bot_response)
+        message_matches = keyword_engine.scan(user_message)
+
         evaluation = {
             'score': 0.0,
             'confidence': 0.0,
@@ -47,13 +47,13 @@ class ResponseEvaluator:
         }
         
         # Evaluate empathy
-        evaluation['empathy_score'] = self._evaluate_empathy(bot_response)
+        evaluation['empathy_score'] = self._evaluate_empathy(bot_response, response_matches)
         
         # Evaluate safety
-        evaluation['safety_score'] = self._evaluate_safety(bot_response)
+        evaluation['safety_score'] = self._evaluate_safety(bot_response, response_matches)
         
         # Evaluate cultural appropriateness
-        evaluation['cultural_appropriateness'] = self._evaluate_cultural_appropriateness(bot_response)
+        evaluation['cultural_appropriateness'] = self._evaluate_cultural_appropriateness(bot_response, response_matches)
         
         # Calculate overall score
         evaluation['score'] = (
@@ -63,29 +63,21 @@ class ResponseEvaluator:
         )
         
         # Generate suggestions
-        evaluation['suggestions'] = self._generate_suggestions(user_message, bot_response)
+        evaluation['suggestions'] = self._generate_suggestions(user_message, bot_response, message_matches)
         
         # Set confidence based on score
         evaluation['confidence'] = min(evaluation['score'] + 0.1, 1.0)
         
         return evaluation
     
-    def _evaluate_empathy(self, response: str) -> float:
+    def _evaluate_empathy(self, response: str, matches: KeywordMatches = None) -> float:
         """
         Evaluate empathy level of the response
         """
-        empathy_words = [
-            'comprends', 'désolé', 'inquiet', 'préoccupé',
-            'important', 'prendre soin', 'soutien', 'aide'
-        ]
-        
-        empathy_score = 0.0
-        response_lower = response.lower()
+        matches = matches or keyword_engine.scan(response)
         
         # Check for empathetic language
-        for word in empathy_words:
-            if word in response_lower:
-                empathy_score += 0.1
+        empathy_score = 0.1 * matches.count('empathy')
         
         # Check sentiment
         sentiment = self.sentiment_analyzer.polarity_scores(response)
@@ -94,82 +86,64 @@ class ResponseEvaluator:
         
         return min(empathy_score, 1.0)
     
-    def _evaluate_safety(self, response: str) -> float:
+    def _evaluate_safety(self, response: str, matches: KeywordMatches = None) -> float:
         """
         Evaluate safety of the medical advice
         """
+        matches = matches or keyword_engine.scan(response)
         safety_score = 0.8  # Start with high safety score
-        response_lower = response.lower()
         
         # Check for medical disclaimer
-        if any(word in response_lower for word in ['consulter', 'médecin', 'professionnel']):
+        if matches.has('disclaimer'):
             safety_score += 0.2
         
         # Penalize overconfident statements
-        for negative_indicator in self.negative_indicators:
-            if negative_indicator in response_lower:
-                safety_score -= 0.1
+        safety_score -= 0.1 * matches.count('negative')
         
         # Reward cautious language
-        for positive_indicator in self.positive_indicators:
-            if positive_indicator in response_lower:
-                safety_score += 0.05
+        safety_score += 0.05 * matches.count('positive')
         
         return max(min(safety_score, 1.0), 0.0)
     
-    def _evaluate_cultural_appropriateness(self, response: str) -> float:
+    def _evaluate_cultural_appropriateness(self, response: str, matches: KeywordMatches = None) -> float:
         """
         Evaluate cultural appropriateness for African context
         """
+        matches = matches or keyword_engine.scan(response)
         cultural_score = 0.7  # Base score
-        response_lower = response.lower()
         
         # Check for cultural sensitivity
-        cultural_indicators = [
-            'local', 'traditionnel', 'culturel', 'communauté',
-            'famille', 'respecter', 'comprendre'
-        ]
-        
-        for indicator in cultural_indicators:
-            if indicator in response_lower:
-                cultural_score += 0.1
+        cultural_score += 0.1 * matches.count('cultural')
         
         # Check for inappropriate assumptions
-        inappropriate_terms = [
-            'toujours disponible', 'facilement accessible',
-            'cher', 'coûteux'
-        ]
-        
-        for term in inappropriate_terms:
-            if term in response_lower:
-                cultural_score -= 0.1
+        cultural_score -= 0.1 * matches.count('inappropriate')
         
         return max(min(cultural_score, 1.0), 0.0)
     
-    def _generate_suggestions(self, user_message: str, bot_response: str) -> List[str]:
+    def _generate_suggestions(self, user_message: str, bot_response: str, matches: KeywordMatches = None) -> List[str]:
         """
         Generate follow-up suggestions based on the conversation
         """
         suggestions = []
         
         # Analyze user message to generate relevant suggestions
-        message_lower = user_message.lower()
+        matches = matches or keyword_engine.scan(user_message)
         
-        if 'fièvre' in message_lower or 'température' in message_lower:
+        if matches.has('suggest:fever'):
             suggestions.extend([
                 "Quelle est votre température exacte?",
                 "Avez-vous d'autres symptômes?",
                 "Depuis combien de temps avez-vous de la fièvre?"
             ])
         
-        if 'douleur' in message_lower or 'mal' in message_lower:
+        if matches.has('suggest:pain'):
             suggestions.extend([
                 "Pouvez-vous décrire la douleur?",
                 "Où exactement ressentez-vous la douleur?",
                 "La douleur est-elle constante ou intermittente?"
             ])
         
-        if 'médicament' in message_lower:
+        if matches.has('suggest:medication'):
             suggestions.extend([
                 "Prenez-vous d'autres médicaments?",
                 "Avez-vous des allergies médicamenteuses?",
@@ -0,0 +1,51 @@
+"""
+Dedicated inference executor
+Runs blocking model calls on a worker thread so the event loop keeps
+serving other requests (health checks, authentication, history) meanwhile
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when no more generation requests can be queued"""
+
+    def __init__(self, retry_after: int = None):
+        self.retry_after = settings.RETRY_AFTER_SECONDS if retry_after is None else retry_after
+        super().__init__(f"File d'attente d'inférence pleine, réessayez dans {self.retry_after} s")
+
+
+class ModelNotReady(Exception):
+    """Raised when a generation is requested before the model is loaded and warmed up"""
+
+    def __init__(self, status: str, retry_after: int = None):
+        self.status = status
+        self.retry_after = settings.RETRY_AFTER_SECONDS if retry_after is None else retry_after
+        super().__init__(f"Modèle indisponible (état : {status})")
+
+
+class InferenceExecutor:
+    """
+    Single worker thread owning every forward pass of the model
+
+    One thread is enough: the model already batches concurrent requests and
+    torch parallelises each call over its own intra-op threads.
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    async def run(self, fn: Callable, *args):
+        """Run `fn(*args)` on the inference thread and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,185 @@
+"""
+Multi-pattern keyword engine
+Every keyword list used to classify messages, score responses and pick
+suggestions is compiled into one Aho-Corasick automaton, so a text is
+scanned once whatever the number of keywords
+"""
+
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+# Words that are different words once their accents are dropped ("sûr" / "sur"):
+# their keywords only match with the accent
+ACCENT_AMBIGUOUS = {"sur", "du", "ou", "a", "la", "mur", "cote", "pres", "des"}
+
+KEYWORD_SETS: Dict[str, List[str]] = {
+    # classify_message_type, checked in this order
+    "type:diagnostic": ["symptômes", "fièvre", "douleur"],
+    "type:medication": ["médicament", "traitement", "pilule"],
+    "type:care": ["soins", "prendre soin"],
+    # ResponseEvaluator
+    "empathy": ["comprends", "désolé", "inquiet", "préoccupé", "important", "prendre soin", "soutien", "aide"],
+    "disclaimer": ["consulter", "médecin", "professionnel"],
+    "positive": ["consulter", "médecin", "professionnel", "diagnostic", "traitement", "suivi", "important", "attention"],
+    "negative": ["certain", "sûr", "définitivement", "toujours", "jamais", "impossible", "pas besoin"],
+    "cultural": ["local", "traditionnel", "culturel", "communauté", "famille", "respecter", "comprendre"],
+    "inappropriate": ["toujours disponible", "facilement accessible", "cher", "coûteux"],
+    # Follow-up suggestions
+    "suggest:fever": ["fièvre", "température"],
+    "suggest:pain": ["douleur", "mal"],
+    "suggest:medication": ["médicament"],
+    # Emergency signs of the knowledge base (see emergency.py), in French, English, Swahili and Hausa.
+    # Wolof has no validated terms yet: Wolof messages only trigger the fast path through French words
+    "emergency:high_fever": [
+        "fièvre très élevée", "fièvre très forte", "très forte fièvre", "fièvre à 40", "fièvre à 41",
+        "very high fever", "fever of 40", "homa kali sana", "zazzabi mai tsanani",
+    ],
+    "emergency:breathing": [
+        "difficultés respiratoires", "difficulté respiratoire", "difficulté à respirer", "difficultés à respirer",
+        "du mal à respirer", "n'arrive pas à respirer", "n'arrive plus à respirer", "ne peut plus respirer", "étouffe",
+        "difficulty breathing", "trouble breathing", "can't breathe", "cannot breathe", "struggling to breathe",
+        "shida ya kupumua", "hawezi kupumua", "wahalar numfashi",
+    ],
+    "emergency:vomiting": [
+        "vomissements persistants", "vomit sans arrêt", "vomit tout", "n'arrête pas de vomir",
+        "persistent vomiting", "keeps vomiting", "can't stop vomiting", "anatapika kila kitu", "amai ba tsayawa",
+    ],
+    "emergency:dehydration": [
+        "déshydratation sévère", "déshydratation grave", "yeux enfoncés", "n'urine plus",
+        "severe dehydration", "sunken eyes", "not urinating", "upungufu mkubwa wa maji", "rashin ruwa mai tsanani",
+    ],
+    "emergency:convulsions": [
+        "convulsion", "convulse", "crise d'épilepsie", "seizure", "degedege", "farfadiya",
+    ],
+    "emergency:unconscious": [
+        "perte de conscience", "perdu connaissance", "perd connaissance", "inconscient", "évanoui", "ne se réveille pas",
+        "loss of consciousness", "unconscious", "passed out", "fainted", "won't wake up",
+        "kupoteza fahamu", "amepoteza fahamu", "ya suma", "ta suma",
+    ],
+}
+
+
+def normalize(text: str) -> str:
+    """Case-folded text with composed accents and plain apostrophes"""
+    return unicodedata.normalize("NFC", text).casefold().replace("’", "'")
+
+
+def strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text)
+    return unicodedata.normalize("NFC", "".join(c for c in decomposed if not unicodedata.combining(c)))
+
+
+class KeywordMatches:
+    """Keywords found in one text, grouped by category"""
+
+    def __init__(self, found: Dict[str, FrozenSet[str]]):
+        self._found = found
+
+    def has(self, category: str) -> bool:
+        return category in self._found
+
+    def count(self, category: str) -> int:
+        """Number of distinct keywords of the category found in the text"""
+        return len(self._found.get(category, ()))
+
+    def keywords(self, category: str) -> FrozenSet[str]:
+        return self._found.get(category, frozenset())
+
+    def categories(self) -> List[str]:
+        return list(self._found)
+
+
+class KeywordEngine:
+    """
+    Aho-Corasick automaton over keyword sets
+
+    Matching is case-insensitive and accent-insensitive: each keyword is
+    also inserted without its accents, so "fievre" finds "fièvre". Keywords
+    match anywhere in the text, as the former `keyword in text` checks did.
+    """
+
+    def __init__(self, keyword_sets: Dict[str, Iterable[str]], cache_size: int = 1024):
+        self.keyword_sets = {category: list(words) for category, words in keyword_sets.items()}
+        # State 0 is the root; transitions, failure links and outputs per state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, str]]] = [[]]
+
+        for category, words in self.keyword_sets.items():
+            for word in words:
+                for variant in self._variants(word):
+                    self._insert(variant, (category, word))
+        self._link()
+        # The same message is scanned by several call sites of a request
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    def _variants(self, word: str) -> set:
+        variants = {normalize(word)}
+        stripped = strip_accents(normalize(word))
+        if stripped not in ACCENT_AMBIGUOUS:
+            variants.add(stripped)
+        return variants
+
+    def _insert(self, pattern: str, label: Tuple[str, str]):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        if label not in self._output[state]:
+            self._output[state].append(label)
+
+    def _link(self):
+        """Breadth-first computation of failure links, merging outputs along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + [
+                    label for label in self._output[self._fail[child]] if label not in self._output[child]
+                ]
+
+    def occurrences(self, text: str, prefix: str = "") -> List[Tuple[int, str, str]]:
+        """
+        Every keyword of the categories starting with `prefix` found in the
+        text, as (start in normalize(text), category, keyword), in text order
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        found = []
+        state = 0
+        for end, char in enumerate(normalize(text)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for category, word in output[state]:
+                if category.startswith(prefix):
+                    found.append((end + 1 - len(normalize(word)), category, word))
+        return sorted(found)
+
+    def _scan(self, text: str) -> KeywordMatches:
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Dict[str, set] = {}
+        state = 0
+        for char in normalize(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for category, word in output[state]:
+                found.setdefault(category, set()).add(word)
+        return KeywordMatches({category: frozenset(words) for category, words in found.items()})
+
+
+# Global engine shared by the chatbot and the evaluator
+keyword_engine = KeywordEngine(KEYWORD_SETS)
@@ -0,0 +1,260 @@
+"""
+Retrieval index over the medical knowledge base
+BM25 ranking of conditions, medications and emergency signs, so that only
+the entries relevant to a message are put in the prompt
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "ai", "au", "aux", "avec", "ce", "d", "de", "des", "du", "en", "est", "et", "j", "je", "l", "la",
+    "le", "les", "ma", "mes", "mon", "ou", "pour", "que", "qui", "se", "si", "suis", "sur", "un", "une", "y",
+    "and", "for", "have", "i", "in", "is", "my", "of", "or", "the", "to", "with",
+}
+
+# Posting lists covering at least this share of the documents are stored densely
+DENSE_POSTINGS = 1 / 8
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, so "Fièvre" and "fievre" are the same word"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(fold(text)) if word not in STOPWORDS]
+
+
+@dataclass
+class KnowledgeEntry:
+    """One condition, medication or group of emergency signs"""
+    key: str
+    kind: str  # condition, medication or emergency
+    data: Dict
+
+    def searchable_text(self) -> str:
+        """Fields matched against messages: names, aliases, symptoms, indications, signs"""
+        data = self.data
+        parts = [data.get("name", ""), data.get("condition", "")]
+        parts += list(data.get("languages", {}).values())
+        for field in ("symptoms", "indications", "signs"):
+            parts += data.get(field, [])
+        return " ".join(part for part in parts if part)
+
+    def to_prompt(self, language: str) -> str:
+        """Compact line describing the entry in the prompt"""
+        data = self.data
+        if self.kind == "emergency":
+            return f"- Signes d'urgence : {', '.join(data.get('signs', []))}. {data.get('action', '')}".rstrip()
+
+        name = data.get("name", self.key)
+        alias = data.get("languages", {}).get(language)
+        if alias and alias != name:
+            name = f"{name} ({alias})"
+        if self.kind == "condition":
+            fields = [("symptômes", ", ".join(data.get("symptoms", []))), ("traitement", data.get("treatment")),
+                      ("prévention", data.get("prevention"))]
+        else:
+            fields = [("indications", ", ".join(data.get("indications", []))), ("posologie", data.get("dosage")),
+                      ("précautions", data.get("precautions"))]
+        return f"- {name} : " + " ; ".join(f"{label} : {value}" for label, value in fields if value)
+
+
+def load_entries(knowledge: Dict) -> List[KnowledgeEntry]:
+    entries = []
+    for kind, section in (("condition", "conditions"), ("medication", "medications"), ("emergency", "emergency_signs")):
+        for position, data in enumerate(knowledge.get(section, [])):
+            entry_id = data.get("id") or data.get("condition") or str(position)
+            entries.append(KnowledgeEntry(f"{kind}:{entry_id}", kind, data))
+    return entries
+
+
+class KnowledgeIndex:
+    """
+    Inverted index with BM25 scoring
+
+    Each posting list stores its documents and their precomputed BM25 term
+    weights as NumPy arrays, so a query is a handful of vectorised additions.
+    Lists of terms found in DENSE_POSTINGS of the documents or more hold a
+    weight for every document instead, added without indexing.
+    Entries keep their document number across reloads: a reload re-tokenises
+    only the entries whose content changed and rewrites only the posting
+    lists of their terms. The weights all depend on the collection size and
+    average length, so they are refreshed in one vectorised pass.
+    """
+
+    def __init__(self, path: str = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path or settings.MEDICAL_KNOWLEDGE_PATH
+        self.k1 = k1
+        self.b = b
+        # By document number, None for entries removed since they were numbered
+        self.entries: List[Optional[KnowledgeEntry]] = []
+        self.version = 0
+        # Term -> (documents, weights), or (None, weight by document) when dense
+        self._postings: Dict[str, Tuple[Optional[np.ndarray], np.ndarray]] = {}
+        self._documents: Dict[str, int] = {}
+        # Term counts and length by document, and term -> (documents, counts): what the weights are computed from
+        self._terms: List[Counter] = []
+        self._lengths: List[int] = []
+        self._columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def load(self):
+        """(Re)build the index from the JSON file"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            knowledge = json.load(f)
+        mtime = os.path.getmtime(self.path)
+        self.build(load_entries(knowledge))
+        self._mtime = mtime
+
+    def build(self, entries: List[KnowledgeEntry]):
+        """Index `entries`, reusing what is already indexed for the unchanged ones"""
+        start = time.perf_counter()
+        documents, stored, terms, lengths = dict(self._documents), list(self.entries), list(self._terms), list(self._lengths)
+        columns = dict(self._columns)
+        if len(stored) > 2 * len(entries):
+            # Mostly removed entries: number the documents afresh
+            documents, stored, terms, lengths, columns = {}, [], [], [], {}
+
+        removed: Dict[str, List[int]] = {}
+        added: Dict[str, Tuple[List[int], List[int]]] = {}
+        seen, changed = set(), 0
+        for entry in entries:
+            if entry.key in seen:
+                # The same id twice: the first one is indexed
+                continue
+            seen.add(entry.key)
+            doc = documents.get(entry.key)
+            if doc is None:
+                doc = documents[entry.key] = len(stored)
+                stored.append(None)
+                terms.append(Counter())
+                lengths.append(0)
+            elif stored[doc].data == entry.data:
+                continue
+            for term in terms[doc]:
+                removed.setdefault(term, []).append(doc)
+            stored[doc], terms[doc] = entry, Counter(tokenize(entry.searchable_text()))
+            lengths[doc] = sum(terms[doc].values())
+            changed += 1
+            for term, count in terms[doc].items():
+                docs, counts = added.setdefault(term, ([], []))
+                docs.append(doc)
+                counts.append(count)
+
+        for key in [key for key in documents if key not in seen]:
+            doc = documents.pop(key)
+            for term in terms[doc]:
+                removed.setdefault(term, []).append(doc)
+            stored[doc], terms[doc], lengths[doc] = None, Counter(), 0
+
+        for term in removed.keys() | added.keys():
+            docs, counts = columns.get(term, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+            if term in removed:
+                keep = ~np.isin(docs, removed[term])
+                docs, counts = docs[keep], counts[keep]
+            if term in added:
+                docs = np.concatenate([docs, np.array(added[term][0], dtype=np.int64)])
+                counts = np.concatenate([counts, np.array(added[term][1], dtype=np.float32)])
+            if len(docs):
+                columns[term] = (docs, counts)
+            else:
+                columns.pop(term, None)
+        postings = self._weigh(columns, np.array(lengths, dtype=np.float32), len(documents))
+
+        with self._lock:
+            self.entries, self._postings = stored, postings
+            self._documents, self._terms, self._lengths, self._columns = documents, terms, lengths, columns
+            self.version += 1
+        logger.info(
+            f"Index de connaissances construit : {len(documents)} entrées ({changed} ré-analysées) "
+            f"en {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+    def _weigh(self, columns: Dict[str, Tuple[np.ndarray, np.ndarray]], lengths: np.ndarray,
+               count: int) -> Dict[str, Tuple[Optional[np.ndarray], np.ndarray]]:
+        """BM25 weights of every posting, computed over all posting lists at once"""
+        if not columns:
+            return {}
+        average = float(lengths.sum()) / max(count, 1)
+        norms = self.k1 * (1 - self.b + self.b * lengths / max(average, 1e-6))
+
+        names = list(columns)
+        sizes = np.array([len(columns[term][0]) for term in names], dtype=np.int64)
+        docs = np.concatenate([columns[term][0] for term in names])
+        counts = np.concatenate([columns[term][1] for term in names])
+        idf = np.log(1 + (count - sizes + 0.5) / (sizes + 0.5))
+        weights = (np.repeat(idf, sizes) * counts * (self.k1 + 1) / (counts + norms[docs])).astype(np.float32)
+        postings = {}
+        for term, size, end in zip(names, sizes.tolist(), np.cumsum(sizes).tolist()):
+            docs = columns[term][0]
+            if size >= DENSE_POSTINGS * count:
+                dense = np.zeros(len(lengths), dtype=np.float32)
+                dense[docs] = weights[end - size:end]
+                postings[term] = (None, dense)
+            else:
+                postings[term] = (docs, weights[end - size:end])
+        return postings
+
+    def reload_if_changed(self, min_interval: float = None) -> bool:
+        """Reload when the JSON file was modified, checking at most every `min_interval` seconds"""
+        interval = settings.KNOWLEDGE_RELOAD_INTERVAL_SECONDS if min_interval is None else min_interval
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return False
+        self._checked_at = now
+        try:
+            if os.path.getmtime(self.path) == self._mtime:
+                return False
+            self.load()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Rechargement de la base de connaissances impossible, index conservé : {e}")
+            return False
+        return True
+
+    def search(self, message: str, k: int = None) -> List[Tuple[KnowledgeEntry, float]]:
+        """Top `k` entries for a message with their BM25 score; entries sharing no term are left out"""
+        k = k or settings.KNOWLEDGE_TOP_K
+        with self._lock:
+            entries, postings = self.entries, self._postings
+        matched = [postings[term] for term in set(tokenize(message)) if term in postings]
+        if not matched:
+            return []
+
+        scores = np.zeros(len(entries), dtype=np.float32)
+        for docs, weights in matched:
+            if docs is None:
+                scores += weights
+            else:
+                scores[docs] += weights
+        candidates = np.argpartition(scores, len(scores) - k)[len(scores) - k:] if len(scores) > k else np.arange(len(scores))
+        candidates = candidates[scores[candidates] > 0]
+        # Ties go to the first documents
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(entries[doc], float(scores[doc])) for doc in ranked]
+
+    def retrieve(self, message: str, language: str = "fr", k: int = None) -> List[str]:
+        """Prompt lines of the `k` entries most relevant to a message"""
+        return [entry.to_prompt(language) for entry, _ in self.search(message, k)]
@@ -0,0 +1,210 @@
+"""
+Medical knowledge stored in the database
+Bulk loading of the knowledge base JSON into the MedicalKnowledge table and
+ranked full-text search over it, backed by an SQLite FTS5 index
+"""
+
+import json
+import logging
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, insert, or_, text, tuple_, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .knowledge_index import STOPWORDS, tokenize
+from .models import MedicalKnowledge
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "medical_knowledge_fts"
+FTS_COLUMNS = ("condition", "symptoms", "treatment", "cultural_context")
+STORED_FIELDS = ("category", "condition", "symptoms", "treatment", "cultural_context", "language")
+
+# External content FTS5 table kept in sync with medical_knowledge by triggers
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {', '.join(FTS_COLUMNS)}, content='medical_knowledge', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS medical_knowledge_ai AFTER INSERT ON medical_knowledge BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS medical_knowledge_ad AFTER DELETE ON medical_knowledge BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS medical_knowledge_au AFTER UPDATE ON medical_knowledge BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+
+def uses_fts(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def create_knowledge_search(engine: Engine):
+    """Create the FTS5 index and its triggers (SQLite only), indexing rows that predate it"""
+    if not uses_fts(engine):
+        return
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        for statement in FTS_SCHEMA:
+            connection.execute(text(statement))
+        if not exists:
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def knowledge_rows(knowledge: Dict, language: str = "fr") -> Iterator[Dict]:
+    """MedicalKnowledge rows for the conditions, medications and emergency signs of a knowledge base"""
+    for condition in knowledge.get("conditions", []):
+        yield {
+            "category": "diagnostic",
+            "condition": condition["name"],
+            "symptoms": ", ".join(condition.get("symptoms", [])),
+            "treatment": condition.get("treatment", ""),
+            "cultural_context": condition.get("cultural_context", ""),
+            "language": language,
+        }
+    for medication in knowledge.get("medications", []):
+        yield {
+            "category": "medication",
+            "condition": medication["name"],
+            "symptoms": ", ".join(medication.get("indications", [])),
+            "treatment": ". ".join(part for part in (medication.get("dosage"), medication.get("precautions")) if part),
+            "cultural_context": medication.get("cultural_notes", ""),
+            "language": language,
+        }
+    for group in knowledge.get("emergency_signs", []):
+        yield {
+            "category": "care_instruction",
+            "condition": f"Urgence ({group.get('condition', 'general')})",
+            "symptoms": ", ".join(group.get("signs", [])),
+            "treatment": group.get("action", ""),
+            "cultural_context": "",
+            "language": language,
+        }
+
+
+def _batches(rows: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_load(db: Session, path: str = None, batch_size: int = None) -> Dict[str, int]:
+    """
+    Upsert a knowledge base JSON file into MedicalKnowledge, one transaction
+    per batch. Rows are identified by (category, condition, language)
+    """
+    batch_size = batch_size or settings.KNOWLEDGE_LOAD_BATCH_SIZE
+    with open(path or settings.MEDICAL_KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
+        knowledge = json.load(f)
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for batch in _batches(knowledge_rows(knowledge), batch_size):
+        # Later duplicates of a key win, as they would with row by row upserts
+        batch = list({_key(row): row for row in batch}.values())
+        existing = {
+            (row.category, row.condition, row.language): row
+            for row in db.query(MedicalKnowledge).filter(
+                tuple_(MedicalKnowledge.category, MedicalKnowledge.condition, MedicalKnowledge.language).in_(
+                    [_key(row) for row in batch]
+                )
+            )
+        }
+
+        inserts, updates = [], []
+        for row in batch:
+            current = existing.get(_key(row))
+            if current is None:
+                inserts.append(row)
+            elif any(getattr(current, field) != row[field] for field in STORED_FIELDS):
+                updates.append({"id": current.id, **row})
+            else:
+                counts["unchanged"] += 1
+
+        db.expunge_all()
+        if inserts:
+            db.execute(insert(MedicalKnowledge), inserts)
+        if updates:
+            db.execute(update(MedicalKnowledge), updates)
+        db.commit()
+        counts["inserted"] += len(inserts)
+        counts["updated"] += len(updates)
+
+    logger.info(f"Base de connaissances chargée : {counts}")
+    return counts
+
+
+def _key(row: Dict) -> Tuple[str, str, str]:
+    return row["category"], row["condition"], row["language"]
+
+
+def fts_query(query: str) -> Optional[str]:
+    """FTS5 MATCH expression matching any word of a free-text query"""
+    words = tokenize(query)
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+
+
+def search_knowledge(db: Session, query: str, limit: int = 5, category: str = None, language: str = None) -> List[Dict]:
+    """Entries matching a free-text query, best first"""
+    match = fts_query(query)
+    if match is None:
+        return []
+
+    if uses_fts(db.get_bind()):
+        filters = ""
+        params = {"match": match, "limit": limit}
+        if category:
+            filters += " AND mk.category = :category"
+            params["category"] = category
+        if language:
+            filters += " AND mk.language = :language"
+            params["language"] = language
+        rows = db.execute(text(
+            f"SELECT mk.id, mk.category, mk.condition, mk.symptoms, mk.treatment, mk.cultural_context, mk.language, "
+            f"bm25({FTS_TABLE}) AS rank "
+            f"FROM {FTS_TABLE} JOIN medical_knowledge mk ON mk.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match{filters} ORDER BY rank LIMIT :limit"
+        ), params).mappings().all()
+        # bm25() is lower for better matches
+        return [{**row, "score": -row["rank"]} for row in (dict(row) for row in rows)]
+
+    # Other databases: unranked substring search, accents as typed
+    words = [word for word in re.findall(r"\w+", query.lower()) if word not in STOPWORDS]
+    conditions = [
+        or_(*(getattr(MedicalKnowledge, column).ilike(f"%{word}%") for column in FTS_COLUMNS)) for word in words
+    ]
+    filters = [or_(*conditions)]
+    if category:
+        filters.append(MedicalKnowledge.category == category)
+    if language:
+        filters.append(MedicalKnowledge.language == language)
+    return [
+        {**{field: getattr(row, field) for field in ("id",) + STORED_FIELDS}, "score": 0.0}
+        for row in db.query(MedicalKnowledge).filter(and_(*filters)).limit(limit)
+    ]
+
+
+def to_prompt(entry: Dict) -> str:
+    """Compact line describing a stored entry in the prompt"""
+    label = "indications" if entry["category"] == "medication" else "symptômes"
+    fields = [(label, entry["symptoms"]), ("traitement", entry["treatment"])]
+    return f"- {entry['condition']} : " + " ; ".join(f"{name} : {value}" for name, value in fields if value)
@@ -0,0 +1,163 @@
+"""
+Key/value cache utilities
+Helpers to pad, merge, slice and measure the model's attention caches
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+
+try:
+    import transformers
+    from packaging import version
+    from transformers import DynamicCache
+    # From 4.56 caches hold one layer object per layer instead of legacy tuples
+    LAYERED_CACHE = version.parse(transformers.__version__) >= version.parse("4.56")
+except ImportError:  # older transformers versions only know legacy tuples
+    DynamicCache = None
+    LAYERED_CACHE = False
+
+# One (key, value) pair per layer, each of shape [batch, heads, seq_len, head_dim]
+LegacyCache = Tuple[Tuple[torch.Tensor, torch.Tensor], ...]
+
+
+@dataclass
+class PrefixCache:
+    """Cache computed once for a fixed prompt prefix (batch size 1)"""
+    token_ids: List[int]
+    past: LegacyCache
+
+
+def to_legacy(past_key_values) -> Optional[LegacyCache]:
+    """Convert a model cache object to the legacy tuple format"""
+    if past_key_values is None:
+        return None
+    if isinstance(past_key_values, tuple):
+        return past_key_values
+    if LAYERED_CACHE:
+        return tuple((layer.keys, layer.values) for layer in past_key_values.layers)
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple((k, v) for k, v in past_key_values)
+
+
+def to_model_cache(legacy: Optional[LegacyCache]):
+    """Convert a legacy tuple cache to the object expected by the model"""
+    if legacy is None:
+        return None
+    if LAYERED_CACHE:
+        return DynamicCache(ddp_cache_data=legacy)
+    if DynamicCache is not None:
+        return DynamicCache.from_legacy_cache(legacy)
+    return legacy
+
+
+def seq_length(legacy: LegacyCache) -> int:
+    """Number of cached positions"""
+    return legacy[0][0].shape[2]
+
+
+def empty_like(legacy: LegacyCache) -> LegacyCache:
+    """A zero-length cache with the same layout as `legacy`, batch size 1"""
+    empty = []
+    for key, value in legacy:
+        shape = (1, key.shape[1], 0, key.shape[3])
+        empty.append((key.new_zeros(shape), value.new_zeros(shape)))
+    return tuple(empty)
+
+
+def left_pad(legacy: LegacyCache, attention_mask: torch.Tensor, length: int) -> Tuple[LegacyCache, torch.Tensor]:
+    """Left-pad a cache and its attention mask up to `length` positions"""
+    missing = length - seq_length(legacy)
+    if missing <= 0:
+        return legacy, attention_mask
+
+    padded = []
+    for key, value in legacy:
+        pad_shape = (key.shape[0], key.shape[1], missing, key.shape[3])
+        padded.append((
+            torch.cat([key.new_zeros(pad_shape), key], dim=2),
+            torch.cat([value.new_zeros(pad_shape), value], dim=2),
+        ))
+    mask_pad = attention_mask.new_zeros((attention_mask.shape[0], missing))
+    return tuple(padded), torch.cat([mask_pad, attention_mask], dim=1)
+
+
+def merge(
+    caches: Sequence[Tuple[LegacyCache, torch.Tensor]]
+) -> Tuple[LegacyCache, torch.Tensor]:
+    """
+    Concatenate several (cache, attention_mask) pairs along the batch dimension,
+    left-padding them to a common length
+    """
+    length = max(seq_length(cache) for cache, _ in caches)
+    padded = [left_pad(cache, mask, length) for cache, mask in caches]
+
+    merged = []
+    for layer in range(len(padded[0][0])):
+        merged.append((
+            torch.cat([cache[layer][0] for cache, _ in padded], dim=0),
+            torch.cat([cache[layer][1] for cache, _ in padded], dim=0),
+        ))
+    return tuple(merged), torch.cat([mask for _, mask in padded], dim=0)
+
+
+def select(
+    legacy: LegacyCache, attention_mask: torch.Tensor, indices: List[int]
+) -> Tuple[LegacyCache, torch.Tensor]:
+    """
+    Keep only the given batch rows, dropping leading positions that are padding
+    for every remaining row
+    """
+    index = torch.tensor(indices, dtype=torch.long, device=attention_mask.device)
+    attention_mask = attention_mask.index_select(0, index)
+
+    used = attention_mask.sum(dim=0).nonzero()
+    start = int(used[0]) if len(used) else attention_mask.shape[1]
+
+    selected = tuple(
+        (key.index_select(0, index)[:, :, start:], value.index_select(0, index)[:, :, start:])
+        for key, value in legacy
+    )
+    return selected, attention_mask[:, start:]
+
+
+def truncate(
+    legacy: LegacyCache, attention_mask: torch.Tensor, lengths: List[int]
+) -> Tuple[LegacyCache, torch.Tensor]:
+    """
+    Keep the first `lengths[row]` positions of each batch row, dropping the
+    rest, and left-pad the rows back to a common length
+    """
+    if len(set(lengths)) == 1:
+        length = lengths[0]
+        return tuple((key[:, :, :length], value[:, :, :length]) for key, value in legacy), attention_mask[:, :length]
+    rows = [
+        (tuple((key[row:row + 1, :, :length], value[row:row + 1, :, :length]) for key, value in legacy),
+         attention_mask[row:row + 1, :length])
+        for row, length in enumerate(lengths)
+    ]
+    merged, attention_mask = merge(rows)
+    return select(merged, attention_mask, list(range(len(lengths))))
+
+
+def compact_row(legacy: LegacyCache, attention_mask: torch.Tensor, row: int) -> LegacyCache:
+    """Copy one batch row of a cache, keeping only its non-padding positions"""
+    keep = attention_mask[row].bool()
+    return tuple(
+        (key[row:row + 1, :, keep].clone(), value[row:row + 1, :, keep].clone())
+        for key, value in legacy
+    )
+
+
+def position_ids(attention_mask: torch.Tensor) -> torch.Tensor:
+    """Position ids for a left-padded batch"""
+    return (attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+
+
+def nbytes(legacy: Optional[LegacyCache]) -> int:
+    """Memory held by a cache, in bytes"""
+    if legacy is None:
+        return 0
+    return sum(k.element_size() * k.nelement() + v.element_size() * v.nelement() for k, v in legacy)
@@ -3,21 +3,58 @@ Language adaptation and translation module
 Handles multilingual support and cultural context adaptation
 """
 
-from googletrans import Translator
-from langdetect import detect
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional
 import asyncio
 
+from .config import settings
+from .language_id import language_identifier
+from .translation import Glossary, TranslationService, create_backend
+
 logger = logging.getLogger(__name__)
 
+# Basic medical term translations (would be expanded with proper linguistic resources)
+LOCAL_MEDICAL_TERMS = {
+    "wolof": {
+        "fever": "tang",
+        "headache": "bopp bu yar",
+        "stomach": "biir"
+    },
+    "hausa": {
+        "fever": "zazzabi",
+        "headache": "ciwon kai",
+        "stomach": "ciki"
+    }
+}
+
 class LanguageAdapter:
     """
     Handles language detection, translation, and cultural adaptation
     """
     
     def __init__(self):
-        self.translator = Translator()
+        # Compiled once: knowledge base condition names, the local terms above, then the glossary file
+        self.glossary = Glossary()
+        try:
+            # One entry per English term: its translations name the same concept
+            extra_terms = {}
+            for language, terms in LOCAL_MEDICAL_TERMS.items():
+                for term, translation in terms.items():
+                    extra_terms.setdefault(term, {"en": term})[language] = translation
+            self.glossary.load(extra_terms=extra_terms.values())
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Glossaire médical indisponible : {e}")
+        self.translator = TranslationService(create_backend(glossary=self.glossary))
+        if settings.TRANSLATION_PREWARM:
+            try:
+                self.translator.prewarm()
+            except (OSError, ValueError) as e:
+                logger.warning(f"Préchauffage de la mémoire de traduction impossible : {e}")
+        if not language_identifier.loaded:
+            try:
+                language_identifier.load()
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Profils de langue indisponibles, messages non identifiés : {e}")
         
         # Cultural adaptation patterns for African context
         self.cultural_adaptations = {
@@ -48,20 +85,16 @@ class LanguageAdapter:
         """
         try:
             # Detect source language
-            source_lang = detect(message)
+            source_lang = self.detect_language(message)
             
-            # If message is already in target language, return as-is
-            if source_lang == target_language:
+            # If message is already in target language, or too short to tell, return as-is
+            if source_lang is None or source_lang == target_language:
                 return message
             
             # Translate if needed
             if target_language in ['fr', 'en']:
-                translated = self.translator.translate(
-                    message, 
-                    src=source_lang, 
-                    dest=target_language
-                ).text
-                return translated
+                translated = await self.translator.translate(message, source_lang, target_language)
+                return translated or message
             
             # For local languages, provide basic cultural adaptation
             return self._adapt_to_local_culture(message, target_language)
@@ -70,6 +103,14 @@ class LanguageAdapter:
             logger.error(f"Error adapting message: {str(e)}")
             return message
     
+    def detect_language(self, message: str) -> Optional[str]:
+        """Language of a message among the supported ones, None if it cannot be told"""
+        return language_identifier.detect(message)
+
+    def detect_languages(self, messages: List[str]) -> List[Optional[str]]:
+        """Languages of several messages at once"""
+        return language_identifier.detect_batch(messages)
+
     def _adapt_to_local_culture(self, message: str, language: str) -> str:
         """
         Adapt message to local cultural context
@@ -85,6 +126,9 @@ class LanguageAdapter:
         
         return message
     
+    def translation_stats(self) -> Dict:
+        return self.translator.stats()
+
     def get_cultural_health_advice(self, condition: str, language: str) -> str:
         """
         Get culturally appropriate health advice
@@ -94,45 +138,46 @@ class LanguageAdapter:
         
         return local_remedies.get(condition, "")
     
-    def translate_medical_terms(self, terms: List[str], target_language: str) -> Dict[str, str]:
+    async def translate_medical_terms(self, terms: List[str], target_language: str, source_language: str = "fr") -> Dict[str, str]:
         """
         Translate medical terms to target language
         """
-        translations = {}
-        
-        try:
-            for term in terms:
-                if target_language in ['fr', 'en']:
-                    translation = self.translator.translate(
-                        term, 
-                        dest=target_language
-                    ).text
-                    translations[term] = translation
-                else:
-                    # For local languages, provide basic translations
-                    translations[term] = self._get_local_medical_term(term, target_language)
-            
-        except Exception as e:
-            logger.error(f"Error translating medical terms: {str(e)}")
-        
-        return translations
-    
-    def _get_local_medical_term(self, term: str, language: str) -> str:
+        translations = await self.translate_medical_terms_batch(terms, [target_language], source_language)
+        return translations.get(target_language, {})
+
+    async def translate_medical_terms_batch(self, terms: List[str], target_languages: List[str],
+                                            source_language: str = "fr") -> Dict[str, Dict[str, str]]:
         """
-        Get local language equivalent for medical terms
+        Translate many medical terms into several languages at once
+
+        Terms are deduplicated and looked up in the glossary first; the misses
+        go to the translator in one batch per target language. Untranslated
+        terms are left out for French and English and kept as-is for the
+        local languages.
         """
-        # Basic medical term translations (would be expanded with proper linguistic resources)
-        medical_translations = {
-            "wolof": {
-                "fever": "tang",
-                "headache": "bopp bu yar",
-                "stomach": "biir"
-            },
-            "hausa": {
-                "fever": "zazzabi",
-                "headache": "ciwon kai",
-                "stomach": "ciki"
-            }
-        }
-        
-        return medical_translations.get(language, {}).get(term.lower(), term)
\ No newline at end of file
+        unique = list(dict.fromkeys(term for term in terms if term and term.strip()))
+        translations: Dict[str, Dict[str, str]] = {}
+        misses: Dict[str, List[str]] = {}
+        for language in dict.fromkeys(target_languages):
+            found = translations[language] = {}
+            for term in unique:
+                translation = self.glossary.lookup(term, language)
+                if translation is None:
+                    misses.setdefault(language, []).append(term)
+                else:
+                    found[term] = translation
+
+        async def resolve(language: str, missing: List[str]):
+            try:
+                translated = await self.translator.translate_batch(missing, source_language, language)
+            except Exception as e:
+                logger.error(f"Error translating medical terms: {str(e)}")
+                translated = [None] * len(missing)
+            for term, translation in zip(missing, translated):
+                if translation:
+                    translations[language][term] = translation
+                elif language not in ('fr', 'en'):
+                    translations[language][term] = term
+
+        await asyncio.gather(*(resolve(language, missing) for language, missing in misses.items()))
+        return translations
@@ -0,0 +1,193 @@
+"""
+Character n-gram language identification
+Naive Bayes over character 1- to 3-grams with compact precomputed profiles
+for every supported language, Wolof, Hausa and Swahili included.
+Deterministic, batched and cached by message hash
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZES = (1, 2, 3)
+PROFILE_SIZE = 1500  # n-grams kept per language
+SMOOTHING = 0.5
+
+_NON_LETTERS = re.compile(r"[^\w']+|[\d_]+")
+
+
+def normalize(text: str) -> str:
+    """Lower-case words separated by single spaces, digits and punctuation removed"""
+    return " ".join(_NON_LETTERS.sub(" ", text.casefold().replace("’", "'")).split())
+
+
+def ngrams(text: str) -> List[str]:
+    """Character n-grams of a normalised text, each word padded with spaces"""
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        for size in NGRAM_SIZES:
+            grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1) if padded[i:i + size] != " ")
+    return grams
+
+
+def build_profiles(samples: Dict[str, Iterable[str]], profile_size: int = PROFILE_SIZE) -> Dict:
+    """
+    Language profiles from sample texts: the log-probabilities of each
+    language's most frequent n-grams, and the one of any other n-gram
+    """
+    counts = {language: Counter(g for text in texts for g in ngrams(normalize(text))) for language, texts in samples.items()}
+    vocabulary = len(set().union(*counts.values()))
+    profiles = {}
+    for language, counter in sorted(counts.items()):
+        total = sum(counter.values()) + SMOOTHING * vocabulary
+        profiles[language] = {
+            "unseen": round(math.log(SMOOTHING / total), 3),
+            "ngrams": {g: round(math.log((c + SMOOTHING) / total), 3) for g, c in sorted(counter.most_common(profile_size))},
+        }
+    return {"ngram_sizes": list(NGRAM_SIZES), "languages": profiles}
+
+
+class LanguageIdentifier:
+    """
+    Language of short messages from precomputed n-gram profiles
+
+    Messages with fewer than `min_letters` letters are too short to tell
+    and get None. Results are kept in an LRU keyed by the hash of the
+    normalised message.
+    """
+
+    def __init__(self, path: str = None, cache_size: int = None, min_letters: int = None):
+        self.path = path or settings.LANGUAGE_PROFILES_PATH
+        self.cache_size = cache_size or settings.LANGUAGE_ID_CACHE_SIZE
+        self.min_letters = min_letters if min_letters is not None else settings.LANGUAGE_ID_MIN_LETTERS
+        self.languages: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._weights = None
+        self._unseen = None
+        self._cache: "OrderedDict[bytes, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.load_profiles(json.load(f))
+
+    def load_profiles(self, profiles: Dict):
+        """Lay the profiles out as one (n-gram, language) log-probability matrix"""
+        languages = profiles["languages"]
+        self.languages = list(languages)
+        self._unseen = np.array([languages[language]["unseen"] for language in self.languages], dtype=np.float32)
+        vocabulary = sorted(set().union(*(profile["ngrams"] for profile in languages.values())))
+        self._index = {g: row for row, g in enumerate(vocabulary)}
+        # N-grams absent from a profile get that language's unseen log-probability
+        self._weights = np.tile(self._unseen, (len(vocabulary), 1)).astype(np.float32)
+        for column, language in enumerate(self.languages):
+            for g, log_probability in languages[language]["ngrams"].items():
+                self._weights[self._index[g], column] = log_probability
+        with self._lock:
+            self._cache.clear()
+        logger.info(f"Profils de langue chargés : {', '.join(self.languages)} ({len(vocabulary)} n-grammes)")
+
+    @property
+    def loaded(self) -> bool:
+        return self._weights is not None
+
+    def detect(self, text: str) -> Optional[str]:
+        """Most likely language of `text`, None if it is too short to tell"""
+        return self.detect_batch([text])[0]
+
+    def detect_batch(self, texts: List[str]) -> List[Optional[str]]:
+        """Languages of several texts, scoring the uncached ones in a single matrix lookup"""
+        normalized = [normalize(text) for text in texts]
+        keys = [hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest() for text in normalized]
+        results: List[Optional[str]] = [None] * len(texts)
+        pending: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for position, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[position] = self._cache[key]
+                    self.hits += 1
+                elif key in pending:
+                    pending[key].append(position)
+                    self.hits += 1
+                else:
+                    pending[key] = [position]
+                    self.misses += 1
+        if not pending:
+            return results
+
+        detected = self._classify([normalized[positions[0]] for positions in pending.values()])
+        with self._lock:
+            for (key, positions), language in zip(pending.items(), detected):
+                for position in positions:
+                    results[position] = language
+                self._cache[key] = language
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Mean log-probability of the n-grams of `text` under each language"""
+        grams = ngrams(normalize(text))
+        if not grams:
+            return {}
+        totals = self._score([grams])[0] / len(grams)
+        return {language: float(score) for language, score in zip(self.languages, totals)}
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "languages": self.languages,
+            "entries": len(self._cache),
+            "max_entries": self.cache_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _classify(self, texts: List[str]) -> List[Optional[str]]:
+        if not self.loaded:
+            return [None] * len(texts)
+        known = [i for i, text in enumerate(texts) if sum(c.isalpha() for c in text) >= self.min_letters]
+        results: List[Optional[str]] = [None] * len(texts)
+        if known:
+            best = self._score([ngrams(texts[i]) for i in known]).argmax(axis=1)
+            for i, column in zip(known, best):
+                results[i] = self.languages[column]
+        return results
+
+    def _score(self, grams: List[List[str]]) -> np.ndarray:
+        """Summed log-probabilities, one row per text and one column per language"""
+        rows, offsets, unknown = [], [], []
+        for text_grams in grams:
+            offsets.append(len(rows))
+            indices = [self._index.get(g) for g in text_grams]
+            rows.extend(index for index in indices if index is not None)
+            unknown.append(sum(index is None for index in indices))
+        # Unknown n-grams are unseen by every profile
+        totals = np.outer(np.array(unknown, dtype=np.float32), self._unseen)
+        if rows:
+            # A trailing zero row keeps every offset a valid index for reduceat
+            weights = np.vstack([self._weights[rows], np.zeros((1, len(self.languages)), dtype=np.float32)])
+            sums = np.add.reduceat(weights, offsets, axis=0)
+            counts = np.diff(offsets + [len(rows)])
+            totals += np.where(counts[:, None] > 0, sums, 0)
+        return totals
+
+
+# Global identifier shared by the language adapter and the chatbot
+language_identifier = LanguageIdentifier()
@@ -6,16 +6,27 @@ Handles API endpoints, authentication, and conversation management
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import uvicorn
-from typing import List, Optional
+import asyncio
+import base64
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 
-from .database import get_db, init_db
-from .models import ChatRequest, ChatResponse, ConversationHistory
+from .database import AsyncSessionLocal, get_async_db, get_db, init_db
+from .models import ChatRequest, ChatResponse, Conversation, ConversationHistory
 from .chatbot import MedicalChatbot
+from .inference import InferenceQueueFull, ModelNotReady
+from .emergency import EmergencyAlert
 from .auth import create_access_token, verify_token
 from .privacy import encrypt_message, decrypt_message
 from .evaluation import evaluate_response
+from .knowledge_store import bulk_load, search_knowledge
+from .preprocessing import PreprocessingPipeline, Stage, StageTimeout
 from .config import settings
 
 # Initialize FastAPI app
@@ -37,14 +48,29 @@ app.add_middleware(
 # OAuth2 scheme for authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+logger = logging.getLogger(__name__)
+
 # Initialize chatbot
 chatbot = MedicalChatbot()
+preprocessing = PreprocessingPipeline()
+
+# Fire-and-forget tasks, referenced until they finish
+_background_tasks = set()
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database and load models on startup"""
+    """Initialize database and start loading the model in the background"""
     init_db()
-    await chatbot.load_model()
+    # Liveness answers right away; readiness waits for the model to be warm
+    chatbot.start_background_load()
+    if chatbot.conversation_writer is not None and chatbot.summarizer is not None:
+        chatbot.conversation_writer.on_flush = _refresh_summaries
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write the conversations still queued before exiting"""
+    if chatbot.conversation_writer is not None:
+        await chatbot.conversation_writer.close()
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -56,10 +82,177 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     access_token = create_access_token(data={"sub": form_data.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
+def _unavailable(error) -> HTTPException:
+    """503 telling the client when to retry, for a full queue, a model still loading or a slow history"""
+    if isinstance(error, ModelNotReady):
+        detail = "Le modèle est en cours de chargement, veuillez réessayer dans quelques instants."
+    elif isinstance(error, StageTimeout):
+        detail = "L'historique de la conversation est momentanément indisponible, veuillez réessayer dans quelques instants."
+    else:
+        detail = "Le service est très sollicité, veuillez réessayer dans quelques instants."
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+async def _load_history(db: AsyncSession, user_id: str, session_id: str, include_pending: bool = True,
+                        exclude: Conversation = None) -> List[Dict]:
+    """
+    Session history as plain dicts, decrypted for the prompt, without the
+    `exclude` exchange. "turn" is the position of each in the session
+    """
+    history = []
+    rows, first = await chatbot.get_conversation_history(db, user_id, session_id, include_pending)
+    for turn, item in enumerate(rows, first):
+        if exclude is not None and (item is exclude or (item.id is not None and item.id == exclude.id)):
+            continue
+        history.append({
+            "id": item.id,
+            "turn": turn,
+            "message": decrypt_message(item.message) if settings.ENCRYPT_CONVERSATIONS else item.message,
+            "response": decrypt_message(item.response) if settings.ENCRYPT_CONVERSATIONS else item.response,
+        })
+    return history
+
+async def _load_summary(db: AsyncSession, user_id: str, session_id: str) -> Optional[Dict]:
+    """Stored summary of the session's older turns, decrypted"""
+    row = await chatbot.get_summary(db, user_id, session_id)
+    if row is None:
+        return None
+    summary = json.loads(decrypt_message(row.summary) if row.is_encrypted else row.summary)
+    summary["last_conversation_id"] = row.last_conversation_id
+    return summary
+
+async def _load_context(db: AsyncSession, user_id: str, session_id: str) -> Tuple[List[Dict], Optional[Dict]]:
+    """Session history and its summary"""
+    # One session runs one query at a time
+    history = await _load_history(db, user_id, session_id)
+    return history, await _load_summary(db, user_id, session_id)
+
+async def _prepare(db: AsyncSession, user_id: str, request: ChatRequest) -> Dict:
+    """
+    History, adapted message and knowledge for the prompt, prepared concurrently.
+    Only the history is required, StageTimeout when too slow: the message is
+    used as written and the knowledge left out when their stages are too slow
+    """
+    return await preprocessing.run([
+        Stage(
+            "history", lambda: _load_context(db, user_id, request.session_id),
+            settings.PREPROCESS_HISTORY_TIMEOUT_MS / 1000, critical=True
+        ),
+        Stage(
+            "message", lambda: chatbot.language_adapter.adapt_message(request.message, request.language),
+            settings.PREPROCESS_ADAPT_TIMEOUT_MS / 1000, default=request.message
+        ),
+        Stage(
+            "knowledge", lambda: asyncio.to_thread(chatbot.knowledge_context, request.message, request.language),
+            settings.PREPROCESS_KNOWLEDGE_TIMEOUT_MS / 1000, default=[]
+        ),
+    ])
+
+def _schedule(coroutine):
+    """Run a coroutine in the background, keeping a reference until it finishes"""
+    task = asyncio.get_running_loop().create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _refresh_summary(user_id: str, session_id: str):
+    """Fold the turns that left the prompt window into the session summary"""
+    try:
+        async with AsyncSessionLocal() as db:
+            # Summaries refer to stored turns by id
+            history = await _load_history(db, user_id, session_id, include_pending=False)
+            summary = chatbot.update_summary(await _load_summary(db, user_id, session_id), history)
+            if summary is not None:
+                text = json.dumps(summary, ensure_ascii=False)
+                await chatbot.save_summary(
+                    db, user_id, session_id,
+                    encrypt_message(text) if settings.ENCRYPT_CONVERSATIONS else text,
+                    summary["last_conversation_id"]
+                )
+    except Exception as e:
+        logger.warning(f"Mise à jour du résumé de conversation impossible : {e}")
+
+def _refresh_summaries(rows: List[Conversation]):
+    """Refresh the summaries of the sessions whose exchanges were just written"""
+    for user_id, session_id in dict.fromkeys((row.user_id, row.session_id) for row in rows):
+        _schedule(_refresh_summary(user_id, session_id))
+
+def _summarize_later(user_id: str, session_id: str):
+    """Refresh the session summary after a saved exchange; queued exchanges do it once written"""
+    if chatbot.summarizer is not None and chatbot.conversation_writer is None:
+        _schedule(_refresh_summary(user_id, session_id))
+
+async def _save_exchange(db: AsyncSession, user_id: str, request: ChatRequest, response: str) -> Tuple[Dict, Conversation]:
+    """Evaluate a finished response and store the exchange, returning the evaluation and the stored row"""
+    # Evaluate response quality
+    evaluation = evaluate_response(request.message, response)
+
+    # Save conversation to database (encrypted)
+    encrypted_message = encrypt_message(request.message) if settings.ENCRYPT_CONVERSATIONS else request.message
+    encrypted_response = encrypt_message(response) if settings.ENCRYPT_CONVERSATIONS else response
+
+    conversation = await chatbot.save_conversation(
+        db=db,
+        user_id=user_id,
+        session_id=request.session_id,
+        message=encrypted_message,
+        response=encrypted_response,
+        language=request.language,
+        evaluation_score=evaluation.get('score', 0.8)
+    )
+    return evaluation, conversation
+
+async def _emergency_followup(conversation: Conversation, user_id: str, request: ChatRequest):
+    """Generate the model's fuller answer after an emergency reply and append it to the stored exchange"""
+    try:
+        # Loaded here, so the emergency reply never waits for the database
+        async with AsyncSessionLocal() as db:
+            history = await _load_history(db, user_id, request.session_id, exclude=conversation)
+        followup = await chatbot.generate_response(
+            message=request.message,
+            language=request.language,
+            history=history,
+            user_context=request.user_context,
+            session_key=chatbot.session_key(user_id, request.session_id)
+        )
+    except (InferenceQueueFull, ModelNotReady) as e:
+        logger.info(f"Complément de réponse d'urgence abandonné : {e}")
+        return
+
+    if chatbot.conversation_writer is not None and not await chatbot.conversation_writer.written(conversation):
+        # History deleted before the exchange was written
+        return
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, conversation.id)
+        if conversation is None:
+            # History deleted in the meantime
+            return
+        response = decrypt_message(conversation.response) if settings.ENCRYPT_CONVERSATIONS else conversation.response
+        response = f"{response}\n\n{followup}"
+        conversation.response = encrypt_message(response) if settings.ENCRYPT_CONVERSATIONS else response
+        await db.commit()
+
+async def _answer_emergency(db: AsyncSession, user_id: str, request: ChatRequest, alert: EmergencyAlert) -> ChatResponse:
+    """Store the templated emergency answer and schedule the optional model follow-up"""
+    evaluation, conversation = await _save_exchange(db, user_id, request, alert.response)
+    if settings.EMERGENCY_FOLLOWUP_ENABLED and chatbot.model_loaded:
+        _schedule(_emergency_followup(conversation, user_id, request))
+    _summarize_later(user_id, request.session_id)
+    return ChatResponse(
+        response=alert.response,
+        session_id=request.session_id,
+        language=request.language,
+        confidence=evaluation.get('confidence', 0.8),
+        suggestions=evaluation.get('suggestions', []),
+        emergency_signs=alert.labels
+    )
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme)
 ):
     try:
@@ -70,30 +263,28 @@ async def chat(
         print("📍 Langue :", request.language)
         print("🧠 Contexte utilisateur :", request.user_context)
 
-        history = chatbot.get_conversation_history(db, user_id, request.session_id)
+        # Danger signs are answered right away, without waiting for the model
+        alert = chatbot.detect_emergency(request.message, request.language)
+        if alert is not None:
+            return await _answer_emergency(db, user_id, request, alert)
 
+        prepared = await _prepare(db, user_id, request)
+        history, summary = prepared["history"]
         response = await chatbot.generate_response(
             message=request.message,
             language=request.language,
             history=history,
-            user_context=request.user_context
+            user_context=request.user_context,
+            session_key=chatbot.session_key(user_id, request.session_id),
+            summary=summary,
+            adapted_message=prepared["message"],
+            knowledge=prepared["knowledge"]
         )
         
-        # Evaluate response quality
-        evaluation = evaluate_response(request.message, response)
-        
-        # Save conversation to database (encrypted)
-        encrypted_message = encrypt_message(request.message) if settings.ENCRYPT_CONVERSATIONS else request.message
-        encrypted_response = encrypt_message(response) if settings.ENCRYPT_CONVERSATIONS else response
-        
-        chatbot.save_conversation(
-            db=db,
-            user_id=user_id,
-            session_id=request.session_id,
-            message=encrypted_message,
-            response=encrypted_response,
-            language=request.language,
-            evaluation_score=evaluation.get('score', 0.8)
+        evaluation, _ = await _save_exchange(db, user_id, request, response)
+        _summarize_later(user_id, request.session_id)
+        await chatbot.remember_answer(
+            request.message, request.language, response, evaluation.get('score', 0.0), history, request.user_context
         )
         
         return ChatResponse(
@@ -104,49 +295,259 @@ async def chat(
             suggestions=evaluation.get('suggestions', [])
         )
         
+    except (InferenceQueueFull, ModelNotReady, StageTimeout) as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors du traitement de votre message: {str(e)}"
         )
 
+def _sse(event: str, data: Dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Stream the response as server-sent events: one `token` event per chunk of
+    text, then a `done` event carrying the full ChatResponse once the
+    conversation has been evaluated and saved
+    """
+    user_id = verify_token(token)
+    alert = chatbot.detect_emergency(request.message, request.language)
+    if alert is not None:
+        answer = await _answer_emergency(db, user_id, request, alert)
+
+        async def emergency_events():
+            yield _sse("token", {"text": answer.response})
+            yield _sse("done", answer.dict())
+
+        return StreamingResponse(
+            emergency_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    if not chatbot.model_loaded:
+        raise _unavailable(ModelNotReady(chatbot.status))
+    if not chatbot.has_capacity():
+        raise _unavailable(InferenceQueueFull())
+    try:
+        prepared = await _prepare(db, user_id, request)
+    except StageTimeout as e:
+        raise _unavailable(e)
+    history, summary = prepared["history"]
+
+    async def events():
+        chunks = []
+        try:
+            async for chunk in chatbot.stream_response(
+                message=request.message,
+                language=request.language,
+                history=history,
+                user_context=request.user_context,
+                session_key=chatbot.session_key(user_id, request.session_id),
+                summary=summary,
+                adapted_message=prepared["message"],
+                knowledge=prepared["knowledge"]
+            ):
+                chunks.append(chunk)
+                yield _sse("token", {"text": chunk})
+
+            response = "".join(chunks)
+            evaluation, _ = await _save_exchange(db, user_id, request, response)
+            _summarize_later(user_id, request.session_id)
+            await chatbot.remember_answer(
+                request.message, request.language, response, evaluation.get('score', 0.0), history, request.user_context
+            )
+            yield _sse("done", ChatResponse(
+                response=response,
+                session_id=request.session_id,
+                language=request.language,
+                confidence=evaluation.get('confidence', 0.8),
+                suggestions=evaluation.get('suggestions', [])
+            ).dict())
+        except Exception as e:
+            yield _sse("error", {"detail": f"Erreur lors du traitement de votre message: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _history_item(item: Conversation) -> Dict:
+    """Decrypted copy of a turn: queued rows must still be written encrypted"""
+    return {
+        "id": item.id,
+        "user_id": item.user_id,
+        "session_id": item.session_id,
+        "message": decrypt_message(item.message) if settings.ENCRYPT_CONVERSATIONS else item.message,
+        "response": decrypt_message(item.response) if settings.ENCRYPT_CONVERSATIONS else item.response,
+        "language": item.language,
+        "timestamp": item.timestamp.isoformat(),
+        "evaluation_score": item.evaluation_score,
+        "is_encrypted": item.is_encrypted,
+    }
+
+def _encode_cursor(item: Conversation) -> str:
+    """Opaque key of the last turn of a page"""
+    key = json.dumps([item.timestamp.isoformat(), item.id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Curseur d'historique invalide")
+
+def _utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC"""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+async def _export_history(user_id: str, session_id: str, since: Optional[datetime]):
+    """
+    Every turn as NDJSON, one query per HISTORY_EXPORT_BATCH_SIZE rows, each
+    on its own session: no connection stays checked out while the client reads
+    """
+    after, more = None, True
+    while more:
+        async with AsyncSessionLocal() as db:
+            rows, more = await chatbot.get_conversation_page(
+                db, user_id, session_id, after=after, since=since, limit=settings.HISTORY_EXPORT_BATCH_SIZE
+            )
+        if not rows:
+            return
+        yield "".join(json.dumps(_history_item(item), ensure_ascii=False) + "\n" for item in rows)
+        after = (rows[-1].timestamp, rows[-1].id)
+
 @app.get("/history/{session_id}")
 async def get_conversation_history(
     session_id: str,
-    db: Session = Depends(get_db),
+    limit: int = None,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    format: str = "json",
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme)
 ):
     """
-    Retrieve conversation history for a specific session
+    Retrieve conversation history for a specific session, oldest first
+
+    Pages of `limit` turns: pass the returned `next_cursor` back to get the
+    next one, and `since` to get only the turns after a time. With
+    format=ndjson the whole history is streamed, one turn per line
+
+    Without `since`, the last page ends with the turns still being written:
+    their id is null. Take `since` from the last turn with an id, so they
+    come back once written, with their id
     """
     user_id = verify_token(token)
-    history = chatbot.get_conversation_history(db, user_id, session_id)
-    
-    # Decrypt messages if encryption is enabled
-    if settings.ENCRYPT_CONVERSATIONS:
-        for item in history:
-            item.message = decrypt_message(item.message)
-            item.response = decrypt_message(item.response)
-    
-    return history
+    since = _utc(since)
+    if format == "ndjson":
+        return StreamingResponse(_export_history(user_id, session_id, since), media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Format d'historique non supporté: {format}")
+
+    after = _decode_cursor(cursor) if cursor else None
+    limit = min(max(limit or settings.HISTORY_PAGE_SIZE, 1), settings.HISTORY_MAX_PAGE_SIZE)
+    rows, more = await chatbot.get_conversation_page(db, user_id, session_id, after=after, since=since, limit=limit)
+    return {
+        "items": [_history_item(item) for item in rows],
+        "next_cursor": _encode_cursor(rows[-1]) if more else None,
+    }
 
 @app.delete("/history/{session_id}")
 async def delete_conversation_history(
     session_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: str = Depends(oauth2_scheme)
 ):
     """
     Delete conversation history for privacy
     """
     user_id = verify_token(token)
-    chatbot.delete_conversation_history(db, user_id, session_id)
+    await chatbot.delete_conversation_history(db, user_id, session_id)
     return {"message": "Historique de conversation supprimé"}
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "model_loaded": chatbot.model_loaded}
+    return {
+        "status": "healthy",
+        "model_loaded": chatbot.model_loaded,
+        "model_status": chatbot.status,
+        "speculative_decoding": chatbot.speculation_stats(),
+        "response_cache": chatbot.response_cache_stats(),
+        "semantic_cache": chatbot.semantic_cache_stats(),
+        "translation": chatbot.language_adapter.translation_stats(),
+        "preprocessing": preprocessing.stats(),
+        "conversation_writer": chatbot.conversation_writer.stats() if chatbot.conversation_writer is not None else None
+    }
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once the model is loaded and warmed up, 503 while
+    loading or after a failed load. Reports load time and warm-up latency
+    """
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if chatbot.model_loaded else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=chatbot.readiness()
+    )
+
+def _require_admin(token: str) -> str:
+    """
+    Admin endpoints are off unless ADMIN_USERS is set; they are only as safe
+    as /token, which must then authenticate users for real
+    """
+    user_id = verify_token(token)
+    if user_id not in settings.ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Accès réservé aux administrateurs")
+    return user_id
+
+@app.post("/admin/knowledge/load")
+def load_medical_knowledge(
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Upsert the knowledge base file into the MedicalKnowledge table and its
+    full-text index. Runs in the threadpool: large files take a while
+    """
+    _require_admin(token)
+    try:
+        return bulk_load(db)
+    except (OSError, ValueError, KeyError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chargement de la base de connaissances impossible: {str(e)}"
+        )
+
+@app.get("/admin/knowledge/search")
+def search_medical_knowledge(
+    q: str,
+    limit: int = 10,
+    category: Optional[str] = None,
+    db: Session = Depends(get_db),
+    token: str = Depends(oauth2_scheme)
+):
+    """Ranked full-text search over the stored knowledge base"""
+    _require_admin(token)
+    return {"results": search_knowledge(db, q, limit=min(limit, 100), category=category)}
 
 @app.get("/languages")
 async def get_supported_languages():
@@ -0,0 +1,77 @@
+"""
+Versioned schema migrations
+Changes that create_all does not make on existing databases (indexes on
+existing tables, new columns) are applied once, in order, and recorded in
+the schema_migrations table
+"""
+
+import logging
+from typing import Callable, List, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+Step = Union[str, Callable[[Connection], None]]
+
+
+def _pad_sqlite_timestamps(connection: Connection):
+    """
+    SQLite keeps datetimes as text: func.now() stored them without the
+    microseconds SQLAlchemy writes and binds, which breaks their ordering
+    against bound values (keyset pagination)
+    """
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(
+            "UPDATE conversations SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"
+        ))
+
+
+# (version, name, steps): SQL statements or functions of the connection.
+# Versions only ever grow, applied migrations are never edited
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "conversation history index", [
+        # Serves the history query: both filters, then the time order, read backwards
+        "CREATE INDEX IF NOT EXISTS ix_conversations_user_session_time "
+        "ON conversations (user_id, session_id, timestamp)",
+    ]),
+    (2, "conversation timestamps with microseconds", [_pad_sqlite_timestamps]),
+]
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    """Versions recorded in schema_migrations, creating the table if needed"""
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        return [row[0] for row in connection.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Apply the migrations not recorded yet, each in its own transaction; returns their versions"""
+    done = set(applied_versions(engine))
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as connection:
+                for step in steps:
+                    if callable(step):
+                        step(connection)
+                    else:
+                        connection.execute(text(step))
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": version, "name": name}
+                )
+        except IntegrityError:
+            # Recorded meanwhile by another worker starting at the same time
+            continue
+        logger.info(f"Migration {version} appliquée : {name}")
+        applied.append(version)
+    return applied
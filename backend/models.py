@@ -27,6 +27,7 @@ class ChatResponse(BaseModel):
     language: str = Field(..., description="Langue de la réponse")
     confidence: float = Field(..., description="Score de confiance de la réponse")
     suggestions: List[str] = Field(default=[], description="Suggestions de questions de suivi")
+    emergency_signs: List[str] = Field(default=[], description="Signes d'urgence détectés dans le message")
 
 class ConversationHistory(BaseModel):
     """Model for conversation history"""
@@ -46,6 +47,7 @@ class ConversationHistory(BaseModel):
 class Conversation(Base):
     """Database model for storing conversations"""
     __tablename__ = "conversations"
+    # History reads use the (user_id, session_id, timestamp) index of backend/migrations.py
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, index=True, nullable=False)
@@ -57,6 +59,18 @@ class Conversation(Base):
     evaluation_score = Column(Float, default=0.8)
     is_encrypted = Column(Boolean, default=False)
 
+class ConversationSummary(Base):
+    """Database model for the rolling summary of a session's older turns"""
+    __tablename__ = "conversation_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, index=True, nullable=False)
+    session_id = Column(String, index=True, nullable=False)
+    summary = Column(Text, nullable=False)  # JSON, encrypted like the conversations
+    last_conversation_id = Column(Integer, default=0)  # last summarised Conversation row
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    is_encrypted = Column(Boolean, default=False)
+
 class User(Base):
     """Database model for users"""
     __tablename__ = "users"
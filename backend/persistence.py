@@ -0,0 +1,241 @@
+"""
+Write-behind persistence of conversations
+Exchanges are queued and written in bulk, every WRITE_BEHIND_BATCH_SIZE rows
+or every WRITE_BEHIND_FLUSH_MS, instead of one commit per request. Queued
+rows stay visible to the history reads of their session until written
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import exc
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import Conversation
+
+logger = logging.getLogger(__name__)
+
+Entry = Tuple[Conversation, asyncio.Future]
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed write may succeed later: lost connection, busy database, exhausted pool"""
+    if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (exc.OperationalError, exc.DisconnectionError, exc.TimeoutError, OSError, asyncio.TimeoutError))
+
+
+class ConversationWriter:
+    """
+    Bounded queue of Conversation rows flushed in one transaction per batch
+
+    A full queue is flushed right away by the request adding to it, so the
+    queue never grows past `max_queue_size` while the database is up; if that
+    flush fails with a transient error the row is queued anyway and counted
+    as backpressure, so the reply already produced is not lost. A batch whose write fails is put
+    back and retried on the next flush. After `max_attempts` failures, or at
+    once for an error retrying cannot fix, its rows are written one by one:
+    rows failing with such an error are logged and dropped, so one bad row
+    never holds back the others. `on_flush` receives each written batch.
+    """
+
+    def __init__(self, session_factory: Callable = None, batch_size: int = None, flush_ms: int = None,
+                 max_queue_size: int = None, on_flush: Callable[[List[Conversation]], None] = None,
+                 max_attempts: int = None):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.batch_size = batch_size or settings.WRITE_BEHIND_BATCH_SIZE
+        self.flush_interval = (settings.WRITE_BEHIND_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self.max_queue_size = max_queue_size or settings.WRITE_BEHIND_MAX_QUEUE
+        self.on_flush = on_flush
+        self.max_attempts = max_attempts or settings.WRITE_BEHIND_MAX_ATTEMPTS
+        self._pending: List[Entry] = []
+        # Taken from the queue, not committed yet
+        self._flushing: List[Entry] = []
+        # Failed writes of the batch at the head of the queue
+        self._attempts = 0
+        self._task: Optional[asyncio.Task] = None
+        self._has_rows: Optional[asyncio.Event] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rows_dropped = 0
+        # Rows queued past max_queue_size while the database was down
+        self.backpressure = 0
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    async def put(self, row: Conversation) -> Conversation:
+        """Queue a row for writing; its timestamp is the time it was queued"""
+        self._ensure_running()
+        while len(self._pending) >= self.max_queue_size:
+            try:
+                await self.flush()
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                self.backpressure += 1
+                logger.warning(f"File d'écriture pleine ({len(self._pending)} échanges) et base indisponible ({e}), échange gardé en attente")
+                break
+        if row.timestamp is None:
+            row.timestamp = datetime.utcnow()
+        self._pending.append((row, asyncio.get_running_loop().create_future()))
+        self._has_rows.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+        return row
+
+    async def written(self, row: Conversation) -> bool:
+        """Wait until a queued row is stored; False if it was discarded instead"""
+        for queued, future in self._pending + self._flushing:
+            if queued is row:
+                return await asyncio.shield(future)
+        return row.id is not None
+
+    def pending(self, user_id: str, session_id: str) -> List[Conversation]:
+        """Rows of a session not stored yet, oldest first"""
+        return [
+            row for row, _ in self._flushing + self._pending
+            if row.user_id == user_id and row.session_id == session_id
+        ]
+
+    def discard(self, user_id: str, session_id: str) -> int:
+        """Drop the queued rows of a session, for a history being deleted"""
+        kept, dropped = [], 0
+        for row, future in self._pending:
+            if row.user_id == user_id and row.session_id == session_id:
+                if not future.done():
+                    future.set_result(False)
+                dropped += 1
+            else:
+                kept.append((row, future))
+        self._pending = kept
+        return dropped
+
+    async def flush(self):
+        """Write every queued row in a single transaction"""
+        if self._flush_lock is None:
+            # Nothing was ever queued
+            return
+        async with self._flush_lock:
+            self._flushing, self._pending = self._pending, []
+            self._has_rows.clear()
+            self._batch_ready.clear()
+            batch = self._flushing
+            if not batch:
+                return
+            try:
+                written, dropped, error = await self._write(batch)
+            finally:
+                self._flushing = []
+            if error is not None:
+                # Retried with the next flush, ahead of the newer rows
+                self._pending = batch[len(written) + len(dropped):] + self._pending
+                self._has_rows.set()
+            if written:
+                self.rows_written += len(written)
+                self.flushes += 1
+            for entries, result in ((written, True), (dropped, False)):
+                for _, future in entries:
+                    if not future.done():
+                        future.set_result(result)
+        if written and self.on_flush is not None:
+            self.on_flush([row for row, _ in written])
+        if error is not None:
+            raise error
+
+    async def _write(self, batch: List[Entry]) -> Tuple[List[Entry], List[Entry], Optional[Exception]]:
+        """
+        Commit a batch, in one transaction while retrying may help, else row
+        by row. Returns the written and the dropped entries, in batch order,
+        and the error that stopped the writes: the entries after them are
+        left to retry
+        """
+        try:
+            await self._commit(batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            self._attempts += 1
+            if is_transient(e) and self._attempts < self.max_attempts:
+                return [], [], e
+            logger.warning(f"Écriture groupée de {len(batch)} échanges en échec ({e}), écriture ligne par ligne")
+        else:
+            self._attempts = 0
+            return batch, [], None
+
+        written, dropped = [], []
+        for entry in batch:
+            try:
+                await self._commit([entry])
+            except Exception as e:
+                if is_transient(e):
+                    return written, dropped, e
+                row = entry[0]
+                logger.error(f"Échange abandonné (utilisateur {row.user_id}, session {row.session_id}) : {e}")
+                self.rows_dropped += 1
+                dropped.append(entry)
+            else:
+                written.append(entry)
+        self._attempts = 0
+        return written, dropped, None
+
+    async def _commit(self, entries: List[Entry]):
+        async with self.session_factory() as db:
+            db.add_all(row for row, _ in entries)
+            await db.commit()
+
+    async def close(self):
+        """Stop the flush loop, then write what is left"""
+        if self._task is not None:
+            # Not in the middle of a write
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"{len(self._pending)} échanges non enregistrés à l'arrêt : {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self),
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "rows_dropped": self.rows_dropped,
+            "backpressure": self.backpressure,
+            "mean_batch": self.rows_written / self.flushes if self.flushes else 0.0,
+        }
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._task.get_loop() is not loop:
+            # Started from another (now gone) event loop
+            self._task = None
+        if self._task is None or self._task.done():
+            self._has_rows, self._batch_ready, self._flush_lock = asyncio.Event(), asyncio.Event(), asyncio.Lock()
+            if self._pending:
+                self._has_rows.set()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._has_rows.wait()
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Écriture groupée des conversations impossible, nouvel essai : {e}")
+                await asyncio.sleep(self.flush_interval)
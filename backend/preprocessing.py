@@ -0,0 +1,117 @@
+"""
+Concurrent request pre-processing
+The inputs of a prompt that do not depend on each other (history, language
+adaptation, knowledge lookup) are prepared at the same time, each within its
+own timeout, and the prompt goes to the model as soon as the critical ones
+are ready
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Sequence
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimeout(Exception):
+    """Raised when a critical stage does not finish within its timeout"""
+
+    def __init__(self, stage: str, retry_after: int = None):
+        self.stage = stage
+        self.retry_after = settings.RETRY_AFTER_SECONDS if retry_after is None else retry_after
+        super().__init__(f"Prétraitement « {stage} » trop lent, réessayez dans {self.retry_after} s")
+
+
+@dataclass
+class Stage:
+    """
+    One pre-processing step, awaited within `timeout` seconds
+
+    A critical stage's error fails the request, its timeout with
+    StageTimeout. Any other stage falls back to
+    `default` when it fails, times out, or is still running `grace` seconds
+    after the critical stages finished.
+    """
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    timeout: float
+    default: Any = None
+    critical: bool = False
+
+
+class PreprocessingPipeline:
+    """Runs the stages of a request concurrently and measures the latency it saves"""
+
+    def __init__(self, grace: float = None):
+        self.grace = settings.PREPROCESS_GRACE_MS / 1000 if grace is None else grace
+        self.requests = 0
+        self.wall_seconds = 0.0
+        self.sequential_seconds = 0.0
+        self.fallbacks = Counter()
+
+    async def run(self, stages: Sequence[Stage]) -> Dict[str, Any]:
+        """Results of the stages by name"""
+        start = time.perf_counter()
+        durations = {}
+        tasks = {stage.name: asyncio.ensure_future(self._timed(stage, durations)) for stage in stages}
+        critical = [tasks[stage.name] for stage in stages if stage.critical]
+        optional = [tasks[stage.name] for stage in stages if not stage.critical]
+        try:
+            if critical:
+                await asyncio.gather(*critical)
+            if optional:
+                await asyncio.wait(optional, timeout=self.grace if critical else None)
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        results = {}
+        for stage in stages:
+            task = tasks[stage.name]
+            if task.done() and not task.cancelled() and task.exception() is None:
+                results[stage.name] = task.result()
+                continue
+            if not task.done():
+                task.cancel()
+                durations[stage.name] = time.perf_counter() - start
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Prétraitement « {stage.name} » abandonné : {task.exception()!r}")
+            self.fallbacks[stage.name] += 1
+            results[stage.name] = stage.default
+
+        wall = time.perf_counter() - start
+        sequential = sum(durations.values())
+        self.requests += 1
+        self.wall_seconds += wall
+        self.sequential_seconds += sequential
+        logger.debug(f"Prétraitement en {wall * 1000:.1f} ms au lieu de {sequential * 1000:.1f} ms")
+        return results
+
+    @staticmethod
+    async def _timed(stage: Stage, durations: Dict[str, float]) -> Any:
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(stage.run(), stage.timeout)
+        except asyncio.TimeoutError:
+            if stage.critical:
+                raise StageTimeout(stage.name) from None
+            raise
+        finally:
+            durations[stage.name] = time.perf_counter() - start
+
+    def stats(self) -> Dict:
+        """Mean pre-processing latency, what running the stages one after another would have cost, and the fallbacks"""
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            "mean_ms": self.wall_seconds / requests * 1000,
+            "mean_sequential_ms": self.sequential_seconds / requests * 1000,
+            "mean_saved_ms": (self.sequential_seconds - self.wall_seconds) / requests * 1000,
+            "fallbacks": dict(self.fallbacks),
+        }
@@ -0,0 +1,221 @@
+"""
+Chat-template prompt assembly
+Renders each message with the checkpoint's chat template and keeps its
+token ids, so a prompt is built by concatenating cached id segments
+instead of re-tokenising the whole conversation on every request
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Zephyr template, as in tinyllama-lora-checkpoint/chat_template.jinja
+DEFAULT_CHAT_TEMPLATE = (
+    "{% for message in messages %}\n"
+    "{% if message['role'] == 'user' %}\n"
+    "{{ '<|user|>\n' + message['content'] + eos_token }}\n"
+    "{% elif message['role'] == 'system' %}\n"
+    "{{ '<|system|>\n' + message['content'] + eos_token }}\n"
+    "{% elif message['role'] == 'assistant' %}\n"
+    "{{ '<|assistant|>\n'  + message['content'] + eos_token }}\n"
+    "{% endif %}\n"
+    "{% if loop.last and add_generation_prompt %}\n"
+    "{{ '<|assistant|>' }}\n"
+    "{% endif %}\n"
+    "{% endfor %}"
+)
+
+Message = Tuple[str, str]  # (role, content)
+
+
+def load_chat_template(tokenizer, path: str = None) -> str:
+    """Template of the tokenizer, else the checkpoint's template file, else the default one"""
+    template = getattr(tokenizer, "chat_template", None)
+    if template:
+        return template
+    path = path or settings.CHAT_TEMPLATE_PATH
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    logger.warning(f"Modèle de conversation introuvable ({path}), modèle par défaut utilisé")
+    return DEFAULT_CHAT_TEMPLATE
+
+
+class PromptBuilder:
+    """
+    Token ids of chat-formatted prompts
+
+    The template renders every message independently, so the ids of a
+    message only depend on its role and content: they are cached in an LRU
+    and reused for the system prompts, the stored history turns and the
+    generation prompt.
+    """
+
+    def __init__(self, tokenizer, template: str = None, cache_size: int = None):
+        self.tokenizer = tokenizer
+        self.eos_token = getattr(tokenizer, "eos_token", None) or "</s>"
+        self.bos_ids = [tokenizer.bos_token_id] if getattr(tokenizer, "bos_token_id", None) is not None else []
+        # Same rendering options as transformers' apply_chat_template
+        environment = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+        self.template = environment.from_string(template or load_chat_template(tokenizer))
+
+        # Segments are tokenised after a newline, as they appear within a prompt, so
+        # tokenizers that prepend a space to a text's first word only do it at its start
+        self._boundary_ids = self._tokenize("\n")
+        self.cache_size = cache_size or settings.PROMPT_SEGMENT_CACHE_SIZE
+        self._segments: "OrderedDict[Tuple[str, str, bool], List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        with_prompt = self.render([("user", "")], add_generation_prompt=True)
+        self.generation_prompt = with_prompt[len(self.render([("user", "")])):]
+        self.generation_prompt_ids = self.encode(self.generation_prompt)
+
+    def render(self, messages: Sequence[Message], add_generation_prompt: bool = False) -> str:
+        return self.template.render(
+            messages=[{"role": role, "content": content} for role, content in messages],
+            eos_token=self.eos_token,
+            add_generation_prompt=add_generation_prompt,
+        )
+
+    def encode(self, text: str, start: bool = False) -> List[int]:
+        """Ids of a piece of prompt text, tokenised as it would be after a newline unless it starts the prompt"""
+        if start:
+            return self._tokenize(text)
+        ids = self._tokenize("\n" + text)
+        if ids[:len(self._boundary_ids)] == self._boundary_ids:
+            return ids[len(self._boundary_ids):]
+        return self._tokenize(text)
+
+    def message_ids(self, role: str, content: str, start: bool = False) -> List[int]:
+        """Cached ids of one rendered message"""
+        key = (role, content, start)
+        with self._lock:
+            ids = self._segments.get(key)
+            if ids is not None:
+                self._segments.move_to_end(key)
+                self.hits += 1
+                return ids
+            self.misses += 1
+
+        ids = self.encode(self.render([(role, content)]), start)
+        with self._lock:
+            self._segments[key] = ids
+            if len(self._segments) > self.cache_size:
+                self._segments.popitem(last=False)
+        return ids
+
+    def system_ids(self, system_prompt: str) -> List[int]:
+        """Start of every prompt: BOS and the system message"""
+        return self.bos_ids + self.message_ids("system", system_prompt, start=True)
+
+    def conversation_ids(self, messages: Sequence[Message]) -> List[int]:
+        ids = []
+        for role, content in messages:
+            ids += self.message_ids(role, content)
+        return ids
+
+    def build(self, system_prompt: str, messages: Sequence[Message]) -> List[int]:
+        """Whole prompt: system message, conversation, then the assistant's turn"""
+        return self.system_ids(system_prompt) + self.conversation_ids(messages) + self.generation_prompt_ids
+
+    def count(self, role: str, content: str) -> int:
+        """Tokens of one rendered message, counted once per message thanks to the segment cache"""
+        return len(self.message_ids(role, content))
+
+    def truncate(self, role: str, content: str, max_tokens: int) -> str:
+        """Start of `content` such that its rendered message takes at most `max_tokens`"""
+        overhead = self.count(role, "")
+        ids = self.encode(content)[:max(0, max_tokens - overhead)]
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+    def fit(
+        self,
+        system_prompt: str,
+        message: str,
+        turns: Sequence[Dict],
+        budget: int,
+        user_context: Optional[str] = None,
+        knowledge: Sequence[str] = (),
+        summary: Optional[str] = None,
+        summarize: Optional[Callable[[Sequence[Dict]], str]] = None,
+    ) -> List[Message]:
+        """
+        Messages to put between the system prompt and the assistant's turn so
+        the whole prompt takes at most `budget` tokens.
+
+        The current message is always kept, cut if it alone exceeds the budget.
+        The rest is kept by decreasing usefulness while it fits: the latest
+        turn, the summary of older turns, the user context, the knowledge block (the first of `knowledge`
+        that fits, they are given from the most to the least complete) and the
+        older turns, newest first. Turns are only dropped from the oldest, so
+        the kept ones stay contiguous. `summarize` gives the summary extended
+        with the dropped turns, which replaces `summary` so they are not lost;
+        older turns make room for it if needed.
+        """
+        fixed = len(self.system_ids(system_prompt)) + len(self.generation_prompt_ids)
+        if fixed + self.count("user", message) > budget:
+            logger.warning(f"Message trop long pour le budget de {budget} tokens, tronqué")
+            message = self.truncate("user", message, budget - fixed)
+        remaining = budget - fixed - self.count("user", message)
+
+        def turn_cost(turn: Dict) -> int:
+            return self.count("user", turn["message"]) + self.count("assistant", turn["response"])
+
+        kept = 0
+        if turns and turn_cost(turns[-1]) <= remaining:
+            remaining -= turn_cost(turns[-1])
+            kept = 1
+
+        if summary and self.count("system", summary) <= remaining:
+            remaining -= self.count("system", summary)
+        else:
+            summary = None
+        if user_context and self.count("system", user_context) <= remaining:
+            remaining -= self.count("system", user_context)
+        else:
+            user_context = None
+
+        block = []
+        for text in knowledge:
+            if self.count("system", text) <= remaining:
+                remaining -= self.count("system", text)
+                block.append(("system", text))
+                break
+
+        while kept and kept < len(turns) and turn_cost(turns[-kept - 1]) <= remaining:
+            remaining -= turn_cost(turns[-kept - 1])
+            kept += 1
+
+        if summarize is not None and kept < len(turns):
+            room = remaining + (self.count("system", summary) if summary else 0)
+            while True:
+                extended = summarize(turns[:len(turns) - kept])
+                if not extended or self.count("system", extended) <= room or kept <= 1:
+                    break
+                room += turn_cost(turns[len(turns) - kept])
+                kept -= 1
+            if not extended or self.count("system", extended) <= room:
+                summary = extended or None
+            else:
+                logger.warning(f"{len(turns) - kept} échanges hors du budget de {budget} tokens, ni gardés ni résumés")
+
+        context = [("system", text) for text in (summary, user_context) if text]
+        for turn in turns[len(turns) - kept:]:
+            context += [("user", turn["message"]), ("assistant", turn["response"])]
+        return context + block + [("user", message)]
+
+    def stats(self) -> dict:
+        return {"segments": len(self._segments), "hits": self.hits, "misses": self.misses}
+
+    def _tokenize(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
@@ -0,0 +1,84 @@
+"""
+Quantized CPU inference modes
+Shrinks the Linear layers of the model, which dominate memory traffic
+when decoding on CPU-only nodes
+"""
+
+import logging
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "int8", "int4")
+
+
+class Int4WeightOnlyLinear(nn.Module):
+    """
+    Linear layer storing its weight as packed 4-bit integers with one scale
+    and offset per group of `group_size` input features. The weight is
+    dequantized on the fly, so only memory (not compute) is saved
+    """
+
+    def __init__(self, linear: nn.Linear, group_size: int):
+        super().__init__()
+        weight = linear.weight.detach().float()
+        self.out_features, self.in_features = weight.shape
+        self.group_size = group_size
+
+        groups = weight.reshape(self.out_features, self.in_features // group_size, group_size)
+        w_min = groups.amin(dim=-1, keepdim=True)
+        scale = ((groups.amax(dim=-1, keepdim=True) - w_min) / 15).clamp(min=1e-8)
+        q = ((groups - w_min) / scale).round().clamp(0, 15).to(torch.uint8).reshape(self.out_features, self.in_features)
+        if self.in_features % 2:
+            # Two weights per byte: an odd row gets an unused high nibble
+            q = F.pad(q, (0, 1))
+
+        self.register_buffer("packed", q[:, 0::2] | (q[:, 1::2] << 4))
+        self.register_buffer("scale", scale.half())
+        self.register_buffer("offset", w_min.half())
+        self.bias = None if linear.bias is None else nn.Parameter(linear.bias.detach(), requires_grad=False)
+
+    def dequantize(self, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        q = torch.stack([self.packed & 0x0F, self.packed >> 4], dim=-1).reshape(self.out_features, -1)
+        q = q[:, :self.in_features].reshape(self.out_features, -1, self.group_size)
+        weight = q.to(dtype) * self.scale.to(dtype) + self.offset.to(dtype)
+        return weight.reshape(self.out_features, self.in_features)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.linear(x, self.dequantize(x.dtype), self.bias)
+
+
+def quantize_model(model: nn.Module, mode: str = None) -> nn.Module:
+    """Apply the configured quantization mode to a loaded model, in place"""
+    mode = (mode or settings.QUANTIZATION).lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Mode de quantification inconnu : {mode} (attendu : {', '.join(QUANTIZATION_MODES)})")
+    if mode == "none":
+        return model
+    if next(model.parameters()).device.type != "cpu":
+        logger.warning(f"Quantification {mode} réservée à l'inférence CPU, modèle laissé tel quel")
+        return model
+
+    if mode == "int8":
+        # Weights stored as int8, activations quantized per batch at run time
+        model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    else:
+        _replace_linears(model, settings.QUANT_GROUP_SIZE)
+
+    logger.info(f"Modèle quantifié en {mode}")
+    return model
+
+
+def _replace_linears(module: nn.Module, group_size: int):
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear):
+            # Layers whose width is not a multiple of the group size stay in full precision
+            if child.in_features % group_size == 0:
+                setattr(module, name, Int4WeightOnlyLinear(child, group_size))
+        else:
+            _replace_linears(child, group_size)
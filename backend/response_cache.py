@@ -0,0 +1,190 @@
+"""
+Response cache for repeated questions
+Answers to context-free questions are kept in memory (LRU with a TTL) and
+optionally in a SQLite file, so that the same question asked again skips
+generation entirely
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_message(message: str) -> str:
+    """Case, spacing, apostrophe and punctuation insensitive form of a message"""
+    text = unicodedata.normalize("NFKC", message).casefold().replace("’", "'")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def cache_key(message: str, message_type: str, language: str, context_hash: str) -> str:
+    """Key of an answer: the normalised question and everything else the answer depends on"""
+    raw = "\x1f".join([normalize_message(message), message_type, language, context_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of generated answers
+
+    The memory tier is an LRU bounded by `max_entries`; the optional disk
+    tier keeps answers across restarts and refills the memory tier on a hit.
+    Both tiers expire entries `ttl_seconds` after they were written.
+    The event loop uses get_async and put_async, which do the disk tier
+    I/O in a worker thread.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: int = None, disk_path: str = None):
+        self.max_entries = max_entries or settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = settings.RESPONSE_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.disk_path = settings.RESPONSE_CACHE_DISK_PATH if disk_path is None else disk_path
+        # key -> (response, expiry time)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = self._open_disk() if self.disk_path else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached answer for `key`, or None on a miss or an expired entry"""
+        now = time.time()
+        response = self._memory_get(key, now)
+        return response if response is not None else self._disk_lookup(key, now)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """get() for the event loop: only a memory miss waits for the disk tier, in a worker thread"""
+        now = time.time()
+        response = self._memory_get(key, now)
+        if response is not None or self._disk is None:
+            return response if response is not None else self._disk_lookup(key, now)
+        return await asyncio.to_thread(self._disk_lookup, key, now)
+
+    def put(self, key: str, response: str):
+        """Store an answer in both tiers"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, response, expires_at)
+        self._disk_put(key, response, expires_at)
+
+    async def put_async(self, key: str, response: str):
+        """put() for the event loop: the disk tier is written in a worker thread"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, response, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_put, key, response, expires_at)
+
+    def record_bypass(self):
+        """Count a request that could not use the cache"""
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM responses")
+                self._disk.commit()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk": bool(self._disk),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions,
+        }
+
+    def _store(self, key: str, response: str, expires_at: float):
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _open_disk(self) -> Optional[sqlite3.Connection]:
+        try:
+            connection = sqlite3.connect(self.disk_path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            connection.commit()
+            return connection
+        except sqlite3.Error as e:
+            logger.warning(f"Cache de réponses sur disque désactivé ({self.disk_path}) : {e}")
+            return None
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            return None
+
+    def _disk_lookup(self, key: str, now: float) -> Optional[str]:
+        """Answer from the disk tier, copied to the memory tier; counts the miss otherwise"""
+        with self._lock:
+            entry = self._disk_get(key, now)
+            if entry is not None:
+                self._store(key, *entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def _disk_put(self, key: str, response: str, expires_at: float):
+        if self._disk is None:
+            return
+        with self._lock:
+            try:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at)
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Écriture du cache de réponses sur disque impossible : {e}")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        if self._disk is None:
+            return None
+        try:
+            row = self._disk.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Lecture du cache de réponses sur disque impossible : {e}")
+            return None
+        return (row[0], row[1]) if row else None
@@ -0,0 +1,122 @@
+"""
+Semantic answer cache
+Paraphrases of an already well answered question ("j'ai de la fièvre depuis
+hier" / "fièvre depuis un jour") are matched by embedding similarity, so the
+stored answer is returned without running the language model
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MessageEmbedder:
+    """Small sentence embedding model run on CPU, mean pooled and L2 normalised"""
+
+    def __init__(self, model_name: str = None, memo_size: int = 256):
+        self.model_name = model_name or settings.EMBEDDING_MODEL_NAME
+        self.tokenizer = None
+        self.model = None
+        # A message is embedded for the lookup and again when its answer is stored
+        self._memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memo_size = memo_size
+
+    def load(self):
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModel.from_pretrained(self.model_name).to("cpu").eval()
+
+    def embed(self, text: str) -> np.ndarray:
+        """Unit-length embedding of one message"""
+        vector = self._memo.get(text)
+        if vector is None:
+            vector = self.embed_batch([text])[0]
+            self._memo[text] = vector
+            if len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return vector
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors="pt")
+        with torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return torch.nn.functional.normalize(pooled, dim=-1).numpy().astype(np.float32)
+
+
+class SemanticCache:
+    """
+    Flat nearest-neighbour index of answered questions
+
+    Embeddings are rows of one NumPy matrix searched with a single matrix
+    product; once `max_entries` is reached the oldest entries are overwritten.
+    """
+
+    def __init__(self, threshold: float = None, max_entries: int = None):
+        self.threshold = settings.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = max_entries or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self._vectors: Optional[np.ndarray] = None
+        self._languages = np.empty(self.max_entries, dtype=object)
+        self._messages: List[Optional[str]] = [None] * self.max_entries
+        self._responses: List[Optional[str]] = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def search(self, vector: np.ndarray, language: str) -> Optional[Tuple[str, str, float]]:
+        """Closest stored (message, response, similarity) in `language`, if any"""
+        with self._lock:
+            if not self._size:
+                return None
+            similarities = self._vectors[:self._size] @ vector
+            similarities[self._languages[:self._size] != language] = -1.0
+            best = int(similarities.argmax())
+            if similarities[best] < 0:
+                return None
+            return self._messages[best], self._responses[best], float(similarities[best])
+
+    def lookup(self, vector: np.ndarray, language: str) -> Optional[str]:
+        """Stored answer of a question similar enough to `vector`, or None"""
+        match = self.search(vector, language)
+        if match is None or match[2] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f"Cache sémantique : réponse de « {match[0]} » réutilisée (similarité {match[2]:.3f})")
+        return match[1]
+
+    def add(self, vector: np.ndarray, language: str, message: str, response: str):
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[-1]), dtype=np.float32)
+            row = self._next
+            self._vectors[row] = vector
+            self._languages[row] = language
+            self._messages[row] = message
+            self._responses[row] = response
+            self._next = (row + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,111 @@
+"""
+Per-session KV cache store
+Keeps the attention cache of each conversation's last turn so that a
+follow-up turn only prefills the tokens that were not seen yet
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from . import kv_cache
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SessionEntry:
+    """Tokens already encoded for a session and their cache (batch size 1)"""
+    token_ids: List[int]
+    past: kv_cache.LegacyCache
+    nbytes: int
+
+
+class SessionKVCache:
+    """
+    LRU store of session caches bounded by a total byte budget
+
+    Lookups match the longest common token prefix between the stored
+    sequence and the new prompt, so any divergence (edited history, a
+    different system prompt) degrades to a partial hit or a clean miss.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = settings.SESSION_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self._entries: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, session_key: str, token_ids: List[int], past: kv_cache.LegacyCache):
+        """Store the cache of a session, evicting least recently used sessions if needed"""
+        size = kv_cache.nbytes(past)
+        with self._lock:
+            self._remove(session_key)
+            if size > self.max_bytes:
+                logger.info(f"Cache de session {session_key} trop volumineux ({size} octets), ignoré")
+                return
+            self._entries[session_key] = SessionEntry(list(token_ids), past, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def take(self, session_key: str, prompt_ids: List[int]) -> Optional[kv_cache.PrefixCache]:
+        """
+        Remove a session's cache and return the part of it that is a prefix of
+        `prompt_ids`, or None on a miss. The caller stores the updated cache
+        once the turn is generated
+        """
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None:
+                self._remove(session_key)
+
+        common = _common_prefix_length(entry.token_ids, prompt_ids) if entry is not None else 0
+        # At least one prompt token has to be prefilled to get next-token logits
+        common = min(common, len(prompt_ids) - 1)
+        if common <= 0:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        past = tuple((key[:, :, :common], value[:, :, :common]) for key, value in entry.past)
+        return kv_cache.PrefixCache(prompt_ids[:common], past)
+
+    def invalidate(self, session_key: str):
+        """Forget a session, e.g. when its history is deleted"""
+        with self._lock:
+            self._remove(session_key)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, session_key: str):
+        entry = self._entries.pop(session_key, None)
+        if entry is not None:
+            self.total_bytes -= entry.nbytes
+
+
+def _common_prefix_length(a: List[int], b: List[int]) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
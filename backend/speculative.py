@@ -0,0 +1,108 @@
+"""
+Prompt-lookup speculative decoding
+Drafts the next tokens by matching the end of a sequence against earlier
+text (the prompt itself and the medical knowledge base) so the model can
+verify several tokens in a single forward pass instead of one per pass
+"""
+
+import json
+import logging
+import threading
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Knowledge base fields that are identifiers rather than text worth copying
+SKIPPED_FIELDS = {"id", "category", "languages"}
+
+
+def knowledge_texts(path: str = None) -> List[str]:
+    """All free-text fields of the medical knowledge base"""
+    with open(path or settings.MEDICAL_KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
+        knowledge = json.load(f)
+    return list(_walk_texts(knowledge))
+
+
+def _walk_texts(node) -> Iterator[str]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key not in SKIPPED_FIELDS:
+                yield from _walk_texts(value)
+    elif isinstance(node, list):
+        if node and all(isinstance(item, str) for item in node):
+            # Symptom and indication lists read as one comma separated phrase
+            yield ", ".join(node)
+        else:
+            for item in node:
+                yield from _walk_texts(item)
+    elif isinstance(node, str) and node:
+        yield node
+
+
+class PromptLookupDrafter:
+    """
+    N-gram draft proposer
+
+    The last `max_ngram` down to `min_ngram` tokens of a sequence are looked
+    up, longest first, in the sequence itself and then in the indexed
+    documents; the tokens that followed the match become the draft.
+    """
+
+    def __init__(self, num_tokens: int = None, max_ngram: int = None, min_ngram: int = None):
+        self.num_tokens = num_tokens or settings.SPECULATIVE_NUM_TOKENS
+        self.max_ngram = max_ngram or settings.SPECULATIVE_MAX_NGRAM
+        self.min_ngram = min_ngram or settings.SPECULATIVE_MIN_NGRAM
+        self._documents: List[List[int]] = []
+        # n-gram -> (document, index right after its last occurrence)
+        self._index: Dict[Tuple[int, ...], Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+        # Acceptance metrics
+        self.steps = 0
+        self.drafted_tokens = 0
+        self.accepted_tokens = 0
+        self.generated_tokens = 0
+
+    def add_document(self, token_ids: Sequence[int]):
+        """Index a tokenised text so its phrases can be drafted"""
+        token_ids = list(token_ids)
+        doc = len(self._documents)
+        self._documents.append(token_ids)
+        for n in range(self.min_ngram, self.max_ngram + 1):
+            # Only n-grams with at least one following token are useful
+            for end in range(n, len(token_ids)):
+                self._index[tuple(token_ids[end - n:end])] = (doc, end)
+
+    def draft(self, context: Sequence[int]) -> List[int]:
+        """Tokens likely to follow `context`, possibly none"""
+        for n in range(min(self.max_ngram, len(context) - 1), self.min_ngram - 1, -1):
+            pattern = list(context[-n:])
+            # Most recent earlier occurrence in the sequence itself
+            for start in range(len(context) - n - 1, -1, -1):
+                if context[start:start + n] == pattern:
+                    return list(context[start + n:start + n + self.num_tokens])
+            match = self._index.get(tuple(pattern))
+            if match is not None:
+                doc, end = match
+                return self._documents[doc][end:end + self.num_tokens]
+        return []
+
+    def record(self, drafted: int, accepted: int, generated: int):
+        """Account for one verification of one sequence"""
+        with self._lock:
+            self.steps += 1
+            self.drafted_tokens += drafted
+            self.accepted_tokens += accepted
+            self.generated_tokens += generated
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._documents),
+            "steps": self.steps,
+            "drafted_tokens": self.drafted_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "acceptance_rate": self.accepted_tokens / self.drafted_tokens if self.drafted_tokens else 0.0,
+            "tokens_per_step": self.generated_tokens / self.steps if self.steps else 0.0,
+        }
@@ -0,0 +1,101 @@
+"""
+Rolling conversation summaries
+Extractive summary of the turns that left the prompt window: the symptoms,
+danger signs, conditions and medications of the knowledge base mentioned in
+them. It is updated incrementally, one batch of turns at a time, and keeps a
+bounded size whatever the length of the session
+"""
+
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from .config import settings
+from .emergency import EMERGENCY_SIGN_LABELS
+from .keywords import KeywordEngine, keyword_engine
+
+logger = logging.getLogger(__name__)
+
+# Summary sections, in prompt order
+SECTIONS = {
+    "symptoms": "symptômes signalés",
+    "signs": "signes d'urgence signalés",
+    "conditions": "affections évoquées",
+    "medications": "médicaments évoqués",
+}
+
+
+def empty_summary() -> Dict:
+    return {"turns": 0, **{section: [] for section in SECTIONS}}
+
+
+class ConversationSummarizer:
+    """
+    Extracts knowledge base entities from conversation turns
+
+    Symptoms and danger signs are taken from the user's messages only;
+    conditions and medications from both sides of the exchange. Each
+    section keeps its `max_items` most recent entities.
+    """
+
+    def __init__(self, path: str = None, max_items: int = None):
+        self.path = path or settings.MEDICAL_KNOWLEDGE_PATH
+        self.max_items = max_items or settings.SUMMARY_MAX_ITEMS
+        self.engine = None
+        self.names: Dict[str, str] = {}
+
+    def load(self):
+        """Build the entity matcher from the knowledge base file"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            knowledge = json.load(f)
+
+        keyword_sets: Dict[str, List[str]] = {}
+        for condition in knowledge.get("conditions", []):
+            category = f"conditions:{condition['id']}"
+            keyword_sets[category] = [condition["name"], *condition.get("languages", {}).values()]
+            self.names[category] = condition["name"]
+            for symptom in condition.get("symptoms", []):
+                keyword_sets[f"symptoms:{symptom}"] = [symptom]
+                self.names[f"symptoms:{symptom}"] = symptom
+        for medication in knowledge.get("medications", []):
+            category = f"medications:{medication['id']}"
+            keyword_sets[category] = [medication["name"], medication["id"]]
+            self.names[category] = medication["name"]
+        self.engine = KeywordEngine(keyword_sets)
+        logger.info(f"Résumés de conversation : {len(keyword_sets)} entités de la base de connaissances")
+
+    def update(self, summary: Optional[Dict], turns: Iterable[Dict]) -> Dict:
+        """Summary extended with `turns`, oldest first; the given summary is left untouched"""
+        summary = json.loads(json.dumps(summary)) if summary else empty_summary()
+        for turn in turns:
+            found = {section: [] for section in SECTIONS}
+            message = self.engine.scan(turn["message"])
+            exchange = self.engine.scan(f"{turn['message']}\n{turn['response']}")
+            for category in message.categories():
+                if category.startswith("symptoms:"):
+                    found["symptoms"].append(self.names[category])
+            for category in exchange.categories():
+                section = category.split(":", 1)[0]
+                if section in ("conditions", "medications"):
+                    found[section].append(self.names[category])
+            signs = keyword_engine.scan(turn["message"])
+            found["signs"] = [label["fr"] for sign, label in EMERGENCY_SIGN_LABELS.items() if signs.has(f"emergency:{sign}")]
+
+            for section, entities in found.items():
+                for entity in entities:
+                    # Most recent last, so the oldest mentions are dropped first
+                    if entity in summary[section]:
+                        summary[section].remove(entity)
+                    summary[section].append(entity)
+                summary[section] = summary[section][-self.max_items:]
+            summary["turns"] += 1
+        return summary
+
+    def render(self, summary: Optional[Dict]) -> str:
+        """Prompt text of a summary, empty when it holds nothing"""
+        if not summary:
+            return ""
+        parts = [f"{label} : {', '.join(summary[section])}" for section, label in SECTIONS.items() if summary.get(section)]
+        if not parts:
+            return ""
+        return f"Résumé des {summary['turns']} échanges précédents : " + " ; ".join(parts)
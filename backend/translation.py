@@ -0,0 +1,378 @@
+"""
+Translation backends and translation memory
+Translations go through a persistent SQLite translation memory first; only
+the segments it has never seen reach the backend, by default a local
+phrase-table engine that works without network access. The sentences of
+patient messages are only kept when TRANSLATION_MEMORY_STORE_MESSAGES is set
+"""
+
+import asyncio
+import hashlib
+import hmac
+import inspect
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from itertools import permutations
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from cryptography.fernet import InvalidToken
+
+from .config import settings
+from .privacy import cipher_suite, encryption_key
+
+logger = logging.getLogger(__name__)
+
+# Codes of the supported languages for online translation services
+ISO_CODES = {"fr": "fr", "en": "en", "wolof": "wo", "hausa": "ha", "swahili": "sw"}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_TOKENS = re.compile(r"\w+(?:['’-]\w+)*|[^\w\s]")
+_NO_SPACE_BEFORE = re.compile(r"\s+([.,!?;:])")
+
+# Origin of the rows written by TranslationService.prewarm, the only ones kept by default
+PREWARM_ORIGIN = "knowledge"
+
+
+def segments(text: str) -> List[str]:
+    """Sentences of a text, the unit stored in the translation memory"""
+    return [segment for segment in _SENTENCE_END.split(" ".join(text.split())) if segment]
+
+
+class TranslationBackend:
+    """Translates batches of segments; None marks a segment it cannot translate"""
+
+    name = "none"
+
+    async def translate_batch(self, texts: Sequence[str], source: str, target: str) -> List[Optional[str]]:
+        return [None] * len(texts)
+
+
+def term_key(term: str) -> Tuple[str, ...]:
+    """Case and punctuation spacing insensitive form of a term"""
+    return tuple(token.casefold() for token in _TOKENS.findall(term))
+
+
+class Glossary:
+    """
+    Medical terms in several languages, compiled once into lookup tables
+
+    Entries map language codes to the same term, or to a list of synonyms
+    whose first one is used as translation; every pair of their languages
+    becomes a translation. Later calls to add_terms win over earlier ones,
+    but a term naming two concepts within one call is ambiguous: it is
+    only kept as a translation. Spelt the same in two languages, it is
+    only looked up with its source language.
+    """
+
+    def __init__(self):
+        # (source, target) -> term key -> translation
+        self.tables: Dict[Tuple[str, str], Dict[Tuple[str, ...], str]] = {}
+        # target -> term key in any language -> translation
+        self._by_target: Dict[str, Dict[Tuple[str, ...], str]] = {}
+        # (source, term key) of the ambiguous terms, with None as source for lookups from any language
+        self.ambiguous: Set[Tuple[Optional[str], Tuple[str, ...]]] = set()
+        self.max_words = 1
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.tables.values())
+
+    def add_terms(self, terms: Iterable[Dict[str, Union[str, List[str]]]]) -> int:
+        """Add entries, returning the number of translation pairs added"""
+        added = 0
+        # (language or None for any, term key) -> index of the entry naming it first
+        concepts: Dict[Tuple[Optional[str], Tuple[str, ...]], int] = {}
+        for concept, entry in enumerate(terms):
+            names = {language: [value] if isinstance(value, str) else list(value) for language, value in entry.items()}
+            for source, target in permutations(names, 2):
+                for name in names[source]:
+                    key = term_key(name)
+                    if not key or (source, key) in self.ambiguous:
+                        continue
+                    if concepts.setdefault((source, key), concept) != concept:
+                        logger.warning(f"Terme ambigu ignoré dans le glossaire ({source}) : {name}")
+                        self._drop(source, key)
+                        continue
+                    self.tables.setdefault((source, target), {})[key] = names[target][0]
+                    if concepts.setdefault((None, key), concept) != concept:
+                        self._drop(None, key)
+                    elif (None, key) not in self.ambiguous:
+                        self._by_target.setdefault(target, {})[key] = names[target][0]
+                    self.max_words = max(self.max_words, len(key))
+                    added += 1
+        return added
+
+    def _drop(self, source: Optional[str], key: Tuple[str, ...]):
+        """Stop looking up an ambiguous term from any language, and from `source` unless None"""
+        self.ambiguous.update({(source, key), (None, key)})
+        for (table_source, _), table in self.tables.items():
+            if table_source == source:
+                table.pop(key, None)
+        for table in self._by_target.values():
+            table.pop(key, None)
+
+    def load(self, glossary_path: str = None, knowledge_path: str = None, extra_terms: Iterable[Dict[str, str]] = ()):
+        """Names of the knowledge base conditions in each language, `extra_terms`, then the glossary file, which wins"""
+        with open(knowledge_path or settings.MEDICAL_KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
+            knowledge = json.load(f)
+        added = self.add_terms(condition.get("languages", {}) for condition in knowledge.get("conditions", []))
+        added += self.add_terms(extra_terms)
+        with open(glossary_path or settings.MEDICAL_GLOSSARY_PATH, "r", encoding="utf-8") as f:
+            added += self.add_terms(json.load(f)["terms"])
+        logger.info(f"Glossaire médical : {added} paires de termes")
+
+    def lookup(self, term: str, target: str, source: str = None) -> Optional[str]:
+        """Translation of a whole term; with no source, the term may be in any language"""
+        table = self.tables.get((source, target), {}) if source else self._by_target.get(target, {})
+        return table.get(term_key(term))
+
+
+class PhraseTableBackend(TranslationBackend):
+    """
+    Offline dictionary translation over the glossary
+
+    Known phrases are replaced longest first. A segment is only translated
+    when its known phrases cover at least `min_coverage` of its words, so
+    sentences the table knows little about are left to the caller.
+    """
+
+    name = "local"
+
+    def __init__(self, glossary: Glossary = None, min_coverage: float = None):
+        self.glossary = Glossary() if glossary is None else glossary
+        self.min_coverage = settings.TRANSLATION_MIN_COVERAGE if min_coverage is None else min_coverage
+
+    async def translate_batch(self, texts: Sequence[str], source: str, target: str) -> List[Optional[str]]:
+        return [self.translate(text, source, target) for text in texts]
+
+    def translate(self, text: str, source: str, target: str) -> Optional[str]:
+        table = self.glossary.tables.get((source, target))
+        if not table:
+            return None
+        tokens = _TOKENS.findall(text)
+        words = [token.casefold() for token in tokens]
+        output, covered, total, i = [], 0, sum(token[0].isalnum() for token in tokens), 0
+        while i < len(tokens):
+            for size in range(min(self.glossary.max_words, len(tokens) - i), 0, -1):
+                translation = table.get(tuple(words[i:i + size]))
+                if translation is not None:
+                    output.append(translation)
+                    covered += size
+                    i += size
+                    break
+            else:
+                output.append(tokens[i])
+                i += 1
+        if not total or covered / total < self.min_coverage:
+            return None
+        return _NO_SPACE_BEFORE.sub(r"\1", " ".join(output))
+
+
+class GoogleBackend(TranslationBackend):
+    """Online translation with googletrans; needs network access"""
+
+    name = "google"
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    async def translate_batch(self, texts: Sequence[str], source: str, target: str) -> List[Optional[str]]:
+        try:
+            result = self.translator.translate(list(texts), src=ISO_CODES.get(source, source), dest=ISO_CODES.get(target, target))
+            if inspect.isawaitable(result):
+                result = await result
+            return [item.text for item in result]
+        except Exception as e:
+            logger.warning(f"Traduction en ligne impossible : {e}")
+            return [None] * len(texts)
+
+
+BACKENDS = {"none": TranslationBackend, "local": PhraseTableBackend, "google": GoogleBackend}
+
+
+def create_backend(name: str = None, glossary: Glossary = None) -> TranslationBackend:
+    """Backend of the given name; the local one uses `glossary`, or loads its own"""
+    name = name or settings.TRANSLATION_BACKEND
+    if name != "local":
+        return BACKENDS[name]()
+    if glossary is None:
+        glossary = Glossary()
+        try:
+            glossary.load()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Glossaire médical indisponible : {e}")
+    return PhraseTableBackend(glossary)
+
+
+class TranslationMemory:
+    """
+    Translated segments kept in SQLite, looked up before any backend call
+
+    With `encrypt`, segments are stored as a keyed hash and translations
+    encrypted, with the key of the conversations
+    """
+
+    def __init__(self, path: str = None, encrypt: bool = None):
+        self.path = path or settings.TRANSLATION_MEMORY_PATH
+        self.encrypt = settings.ENCRYPT_CONVERSATIONS if encrypt is None else encrypt
+        self._lock = threading.Lock()
+        try:
+            self._connection = self._open(self.path)
+        except sqlite3.Error as e:
+            logger.warning(f"Mémoire de traduction sur disque indisponible ({self.path}), gardée en mémoire : {e}")
+            self._connection = self._open(":memory:")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "source_lang TEXT NOT NULL, target_lang TEXT NOT NULL, source_text TEXT NOT NULL, "
+            "translation TEXT NOT NULL, origin TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (source_lang, target_lang, source_text))"
+        )
+        connection.commit()
+        return connection
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        if not self.encrypt:
+            return text
+        return "hmac:" + hmac.new(encryption_key, text.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _seal(self, translation: str) -> str:
+        return cipher_suite.encrypt(translation.encode("utf-8")).decode() if self.encrypt else translation
+
+    def _unseal(self, stored: str) -> Optional[str]:
+        if not self.encrypt:
+            return stored
+        try:
+            return cipher_suite.decrypt(stored.encode()).decode("utf-8")
+        except InvalidToken:
+            # Written with another key
+            return None
+
+    def get_many(self, texts: Sequence[str], source: str, target: str) -> Dict[str, str]:
+        """Stored translations of the given segments, by segment"""
+        keys = {self._key(text): text for text in texts}
+        unique = list(keys)
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT source_text, translation FROM translations WHERE source_lang = ? AND target_lang = ? "
+                    f"AND source_text IN ({', '.join('?' * len(chunk))})",
+                    (source, target, *chunk)
+                ).fetchall()
+                for key, stored in rows:
+                    translation = self._unseal(stored)
+                    if translation is not None:
+                        found[keys[key]] = translation
+            self.hits += sum(text in found for text in texts)
+            self.misses += sum(text not in found for text in texts)
+        return found
+
+    def put_many(self, translations: Iterable[Tuple[str, str, str, str]], origin: str) -> int:
+        """Store (source, target, text, translation) rows, replacing older translations"""
+        now = time.time()
+        rows = [
+            (source, target, self._key(text), self._seal(translation), origin, now)
+            for source, target, text, translation in translations
+        ]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._connection.commit()
+        return len(rows)
+
+    def purge(self, keep_messages: bool) -> int:
+        """
+        Delete the rows translated from messages unless `keep_messages`, and,
+        when encrypting, the rows an unencrypted memory left in clear
+        """
+        conditions = [] if keep_messages else [f"origin != '{PREWARM_ORIGIN}'"]
+        if self.encrypt:
+            conditions.append("source_text NOT LIKE 'hmac:%'")
+        if not conditions:
+            return 0
+        with self._lock:
+            deleted = self._connection.execute(f"DELETE FROM translations WHERE {' OR '.join(conditions)}").rowcount
+            self._connection.commit()
+        if deleted:
+            logger.info(f"Mémoire de traduction : {deleted} traductions de messages supprimées")
+        return deleted
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TranslationService:
+    """
+    Segment translation through the translation memory, then the backend for the misses
+
+    The backend's translations are only stored with `store_messages`: the
+    segments are sentences of patient messages
+    """
+
+    def __init__(self, backend: TranslationBackend = None, memory: TranslationMemory = None, store_messages: bool = None):
+        self.backend = create_backend() if backend is None else backend
+        # An empty memory is falsy, hence the explicit None checks
+        self.memory = TranslationMemory() if memory is None else memory
+        self.store_messages = settings.TRANSLATION_MEMORY_STORE_MESSAGES if store_messages is None else store_messages
+        self.memory.purge(keep_messages=self.store_messages)
+        self.backend_calls = 0
+
+    async def translate(self, text: str, source: str, target: str) -> Optional[str]:
+        """Translation of a text, sentence by sentence; None if no sentence could be translated"""
+        parts = segments(text)
+        translated = await self.translate_batch(parts, source, target)
+        if all(translation is None for translation in translated):
+            return None
+        return " ".join(translation or part for part, translation in zip(parts, translated))
+
+    async def translate_batch(self, texts: Sequence[str], source: str, target: str) -> List[Optional[str]]:
+        if source == target:
+            return list(texts)
+        # SQLite calls block: keep them off the event loop
+        found = await asyncio.to_thread(self.memory.get_many, texts, source, target)
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        if missing:
+            self.backend_calls += 1
+            translated = await self.backend.translate_batch(missing, source, target)
+            new = {text: translation for text, translation in zip(missing, translated) if translation}
+            if self.store_messages:
+                rows = [(source, target, text, translation) for text, translation in new.items()]
+                await asyncio.to_thread(self.memory.put_many, rows, self.backend.name)
+            found.update(new)
+        return [found.get(text) for text in texts]
+
+    def prewarm(self, knowledge_path: str = None) -> int:
+        """Store the condition names of the knowledge base in every pair of their languages"""
+        with open(knowledge_path or settings.MEDICAL_KNOWLEDGE_PATH, "r", encoding="utf-8") as f:
+            knowledge = json.load(f)
+        rows = []
+        for condition in knowledge.get("conditions", []):
+            names = condition.get("languages", {})
+            rows += [(source, target, names[source], names[target]) for source, target in permutations(names, 2)]
+        stored = self.memory.put_many(rows, PREWARM_ORIGIN)
+        logger.info(f"Mémoire de traduction préchauffée : {stored} traductions")
+        return stored
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend.name, "backend_calls": self.backend_calls, **self.memory.stats()}
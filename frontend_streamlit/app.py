@@ -88,6 +88,71 @@ def send_message(message_text, language):
         st.error(f"Erreur lors de l'envoi: {str(e)}")
         return None
 
+def iter_sse_events(response):
+    """Parse a server-sent events stream into (event, data) pairs"""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def stream_message(message_text, language, placeholder):
+    """Send message to the streaming chat API, rendering tokens as they arrive"""
+    if not st.session_state.access_token:
+        st.session_state.access_token = authenticate_user()
+    
+    if not st.session_state.access_token:
+        return None
+    
+    try:
+        headers = {
+            "Authorization": f"Bearer {st.session_state.access_token}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        
+        payload = {
+            "message": message_text,
+            "language": language,
+            "session_id": st.session_state.session_id,
+            "user_context": st.session_state.user_context
+        }
+        
+        with requests.post(
+            f"{API_BASE_URL}/chat/stream",
+            headers=headers,
+            json=payload,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                st.error(f"Erreur API: {response.status_code}")
+                return None
+            
+            text = ""
+            for event, data in iter_sse_events(response):
+                if event == "token":
+                    text += data["text"]
+                    placeholder.markdown(text + "▌")
+                elif event == "done":
+                    placeholder.markdown(data["response"])
+                    return data
+                elif event == "error":
+                    st.error(data["detail"])
+                    return None
+        
+        return None
+            
+    except Exception as e:
+        st.error(f"Erreur lors de l'envoi: {str(e)}")
+        return None
+
 def main():
     """Main Streamlit application"""
     
@@ -212,9 +277,8 @@ def main():
         # Add user message to history
         st.session_state.messages.append({"role": "user", "content": user_input})
         
-        # Send message to API
-        with st.spinner("L'assistant réfléchit..."):
-            response = send_message(user_input, selected_language)
+        # Send message to API, showing the answer while it is generated
+        response = stream_message(user_input, selected_language, st.empty())
         
         if response:
             # Add bot response to history
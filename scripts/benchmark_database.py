@@ -0,0 +1,154 @@
+"""
+Benchmark of the sync and async database sessions under concurrent load
+Simulates clients mixing /chat requests (history and summary fetch, model
+latency, save) and /history requests, first with blocking sync sessions on
+the event loop as the endpoints used to, then with async sessions, and
+reports throughput and latency for each
+
+Run from the repository root: python -m scripts.benchmark_database
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, exc, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.config import settings
+from backend.database import async_database_url, pool_options
+from backend.models import Base, Conversation, ConversationSummary
+
+def seed(engine, sessions, turns):
+    """`sessions` sessions of `turns` exchanges each"""
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all(
+            Conversation(user_id="bench", session_id=f"session_{s}", message=f"Question {t} " * 20,
+                         response=f"Réponse {t} " * 60, language="fr", evaluation_score=0.8)
+            for s in range(sessions) for t in range(turns)
+        )
+        db.commit()
+
+def history_query(session_id):
+    return (
+        select(Conversation)
+        .where(Conversation.user_id == "bench", Conversation.session_id == session_id)
+        .order_by(Conversation.timestamp.desc(), Conversation.id.desc())
+        .limit(settings.MAX_CONVERSATION_LENGTH)
+    )
+
+def summary_query(session_id):
+    return select(ConversationSummary).where(
+        ConversationSummary.user_id == "bench", ConversationSummary.session_id == session_id
+    )
+
+def exchange(session_id):
+    return Conversation(user_id="bench", session_id=session_id, message="Nouvelle question " * 20,
+                        response="Nouvelle réponse " * 60, language="fr", evaluation_score=0.8)
+
+def sync_request(factory):
+    """One request through blocking sync sessions, as the endpoints used to run them"""
+    async def run(kind, session_id, model_latency):
+        with factory() as db:
+            db.scalars(history_query(session_id)).all()
+            if kind == "history":
+                return
+            db.scalars(summary_query(session_id)).first()
+            await asyncio.sleep(model_latency)
+            db.add(exchange(session_id))
+            db.commit()
+    return run
+
+def async_request(factory):
+    """One request through async sessions"""
+    async def run(kind, session_id, model_latency):
+        async with factory() as db:
+            (await db.scalars(history_query(session_id))).all()
+            if kind == "history":
+                return
+            (await db.scalars(summary_query(session_id))).first()
+            await asyncio.sleep(model_latency)
+            db.add(exchange(session_id))
+            await db.commit()
+    return run
+
+async def load(request, args):
+    """Run `args.requests` requests from `args.concurrency` clients; returns the wall time and the latencies"""
+    rng = random.Random(0)
+    plan = [
+        ("chat" if rng.random() < args.chat_share else "history", f"session_{rng.randrange(args.sessions)}")
+        for _ in range(args.requests)
+    ]
+    latencies = []
+
+    async def client(worker):
+        for kind, session_id in plan[worker::args.concurrency]:
+            start = time.perf_counter()
+            await request(kind, session_id, args.model_latency_ms / 1000)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(worker) for worker in range(args.concurrency)))
+    return time.perf_counter() - start, sorted(latencies)
+
+def report(label, wall, latencies):
+    print(f"{label} : {len(latencies) / wall:.0f} req/s, latence moyenne {statistics.mean(latencies):.1f} ms, "
+          f"p50 {latencies[len(latencies) // 2]:.1f} ms, p99 {latencies[int(0.99 * len(latencies))]:.1f} ms")
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=None, help="Base à utiliser (par défaut une base SQLite temporaire)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=24,
+                        help="Clients simultanés ; au-delà de DB_POOL_SIZE + DB_MAX_OVERFLOW, les sessions synchrones bloquent la boucle")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20, help="Échanges déjà stockés par session")
+    parser.add_argument("--chat-share", type=float, default=0.5, help="Part des requêtes /chat, le reste étant /history")
+    parser.add_argument("--model-latency-ms", type=float, default=20.0, help="Durée simulée de la génération d'une réponse /chat")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.database_url or f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        print(f"🚀 Benchmark des sessions de base de données ({args.requests} requêtes, {args.concurrency} clients)...")
+        engine = create_engine(url, **pool_options(url))
+        seed(engine, args.sessions, args.turns)
+        async_engine = create_async_engine(async_database_url(url), **pool_options(url))
+
+        sync_factory = sessionmaker(bind=engine, autoflush=False)
+        async_factory = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        try:
+            sync_result = asyncio.run(load(sync_request(sync_factory), args))
+        except exc.TimeoutError:
+            # Waiting for a connection blocks the loop, so no request can give one back
+            sync_result = None
+        async_wall, async_latencies = asyncio.run(load(async_request(async_factory), args))
+        asyncio.run(async_engine.dispose())
+        if args.database_url is None:
+            engine.dispose()
+        else:
+            # Leave a shared database as it was
+            with sessionmaker(bind=engine)() as db:
+                db.query(Conversation).filter(Conversation.user_id == "bench").delete()
+                db.commit()
+            engine.dispose()
+
+    print("\n" + "="*60)
+    if sync_result is None:
+        print(f"🐢 Sessions synchrones : bloquées, pool épuisé ({settings.DB_POOL_SIZE} + {settings.DB_MAX_OVERFLOW} connexions)")
+    else:
+        report("🐢 Sessions synchrones", *sync_result)
+    report("⚡ Sessions asynchrones", async_wall, async_latencies)
+    if sync_result is not None:
+        print(f"📈 Débit : x{sync_result[0] / async_wall:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
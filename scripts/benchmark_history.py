@@ -0,0 +1,116 @@
+"""
+Benchmark of the conversation history query on SQLite
+Fills a database with synthetic conversations (10M rows by default), then
+times the history query with the default SQLite settings and the
+single-column indexes, and again after the migrations and with the
+production profile of backend/database.py
+
+Run from the repository root: python -m scripts.benchmark_history
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, select, text
+
+from backend.config import settings
+from backend.database import use_sqlite_profile
+from backend.migrations import migrate
+from backend.models import Base, Conversation
+
+def fill(path, rows, sessions, users, batch=100000):
+    """`rows` conversations spread over `sessions` sessions of `users` users, in time order"""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    rng = random.Random(0)
+    start = 1_700_000_000
+    for offset in range(0, rows, batch):
+        connection.executemany(
+            "INSERT INTO conversations (user_id, session_id, message, response, language, timestamp, evaluation_score, is_encrypted) "
+            "VALUES (?, ?, ?, ?, 'fr', datetime(?, 'unixepoch'), 0.8, 0)",
+            (
+                (f"user_{session % users}", f"session_{session}", f"Question {i}", f"Réponse {i}", start + i)
+                for i in range(offset, min(rows, offset + batch))
+                for session in (rng.randrange(sessions),)
+            )
+        )
+        connection.commit()
+        print(f"\r📝 {min(rows, offset + batch)} / {rows} lignes", end="", flush=True)
+    print()
+    connection.close()
+
+def history_query(user_id, session_id):
+    """The query of MedicalChatbot.get_conversation_history"""
+    return (
+        select(Conversation)
+        .where(Conversation.user_id == user_id, Conversation.session_id == session_id)
+        .order_by(Conversation.timestamp.desc(), Conversation.id.desc())
+        .limit(settings.MAX_CONVERSATION_LENGTH)
+    )
+
+def time_history(engine, sessions, users, queries):
+    """Latencies in ms of the history query for random sessions"""
+    rng = random.Random(1)
+    latencies = []
+    with engine.connect() as connection:
+        sample = history_query("user_0", "session_0").compile(engine, compile_kwargs={"literal_binds": True})
+        plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sample}")).all()
+        for _ in range(queries):
+            session = rng.randrange(sessions)
+            start = time.perf_counter()
+            connection.execute(history_query(f"user_{session % users}", f"session_{session}")).all()
+            latencies.append((time.perf_counter() - start) * 1000)
+    return sorted(latencies), " ; ".join(row[-1] for row in plan)
+
+def report(label, latencies, plan):
+    print(f"{label} : moyenne {statistics.mean(latencies):.2f} ms, p50 {latencies[len(latencies) // 2]:.2f} ms, "
+          f"p99 {latencies[int(0.99 * len(latencies))]:.2f} ms")
+    print(f"   plan : {plan}")
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000, help="Sessions ; plus elles sont longues, plus le tri de l'ancien plan coûte")
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--directory", default=None, help="Dossier de la base générée (par défaut un dossier temporaire)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        path = os.path.join(directory, "history.db")
+        url = f"sqlite:///{path}"
+        print(f"🚀 Benchmark de l'historique ({args.rows} lignes, {args.sessions} sessions)...")
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+        fill(path, args.rows, args.sessions, args.users)
+
+        before, before_plan = time_history(engine, args.sessions, args.users, args.queries)
+        engine.dispose()
+
+        start = time.perf_counter()
+        migrate(engine)
+        migration_time = time.perf_counter() - start
+        engine.dispose()
+        tuned = create_engine(url)
+        use_sqlite_profile(tuned)
+        after, after_plan = time_history(tuned, args.sessions, args.users, args.queries)
+        tuned.dispose()
+
+    print("\n" + "="*60)
+    report("🐢 Index simples, réglages par défaut", before, before_plan)
+    report("⚡ Index composite, profil de production", after, after_plan)
+    print(f"🏗️ Migration (création de l'index) : {migration_time:.1f} s")
+    print(f"📈 Latence moyenne : x{statistics.mean(before) / statistics.mean(after):.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Benchmark of language identification
+Compares the throughput and accuracy of the n-gram language identifier
+with langdetect on a few thousand short messages in every supported language
+
+Run from the repository root: python -m scripts.benchmark_language_id
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+
+from backend.language_id import LanguageIdentifier
+
+# langdetect codes of the supported languages; it has no Wolof nor Hausa
+LANGDETECT_CODES = {"fr": "fr", "en": "en", "sw": "swahili"}
+
+def synthetic_messages(count, seed=0):
+    """
+    Messages of 3 to 12 consecutive words taken from the sample texts, with
+    their language. The profiles are built from the same texts, so the
+    accuracy of the n-gram identifier is optimistic; throughput is not affected
+    """
+    rng = random.Random(seed)
+    with open('data/language_samples.json', 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+    words = {language: " ".join(texts).split() for language, texts in samples.items()}
+    messages = []
+    for _ in range(count):
+        language = rng.choice(sorted(words))
+        size = rng.randint(3, 12)
+        start = rng.randrange(len(words[language]) - size)
+        messages.append((" ".join(words[language][start:start + size]), language))
+    return messages
+
+def report(label, elapsed, predictions, messages):
+    correct = defaultdict(int)
+    totals = defaultdict(int)
+    for predicted, (_, language) in zip(predictions, messages):
+        totals[language] += 1
+        correct[language] += predicted == language
+    accuracy = ", ".join(f"{language} {correct[language] / totals[language]:.0%}" for language in sorted(totals))
+    print(f"{label} : {len(messages) / elapsed:,.0f} messages/s, exactitude {sum(correct.values()) / len(messages):.1%} ({accuracy})")
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmark de l'identification de langue ({args.messages} messages)...")
+    messages = synthetic_messages(args.messages)
+    texts = [text for text, _ in messages]
+    print("\n" + "="*60)
+
+    try:
+        from langdetect import DetectorFactory, detect
+        from langdetect.lang_detect_exception import LangDetectException
+    except ImportError:
+        print("⚠️ langdetect n'est pas installé, comparaison ignorée")
+    else:
+        DetectorFactory.seed = 0
+
+        def langdetect_language(text):
+            try:
+                return LANGDETECT_CODES.get(detect(text))
+            except LangDetectException:
+                return None
+
+        start = time.perf_counter()
+        predictions = [langdetect_language(text) for text in texts]
+        report("🐢 langdetect", time.perf_counter() - start, predictions, messages)
+
+    identifier = LanguageIdentifier(cache_size=1)
+    identifier.load()
+    start = time.perf_counter()
+    predictions = [identifier.detect(text) for text in texts]
+    report("⚡ n-grammes, message par message", time.perf_counter() - start, predictions, messages)
+
+    identifier = LanguageIdentifier(cache_size=len(texts))
+    identifier.load()
+    start = time.perf_counter()
+    predictions = identifier.detect_batch(texts)
+    report("📦 n-grammes, par lot", time.perf_counter() - start, predictions, messages)
+
+    start = time.perf_counter()
+    predictions = [identifier.detect(text) for text in texts]
+    report("🧠 n-grammes, cache chaud", time.perf_counter() - start, predictions, messages)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
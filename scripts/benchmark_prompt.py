@@ -0,0 +1,101 @@
+"""
+Benchmark of prompt construction
+Replays a conversation turn by turn and compares building each prompt as one
+string tokenised from scratch with assembling it from the cached token ids
+of the PromptBuilder
+
+Run from the repository root: python -m scripts.benchmark_prompt
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from transformers import AutoTokenizer
+
+from backend.config import settings
+from backend.prompt_builder import PromptBuilder
+
+SYSTEM_PROMPT = (
+    "Tu es un assistant médical virtuel bienveillant. Tu aides les patients à comprendre leurs symptômes, "
+    "tu donnes des conseils de premier recours et tu recommandes toujours de consulter un professionnel de santé."
+)
+MESSAGES = [
+    "J'ai de la fièvre et des frissons depuis deux jours, que dois-je faire ?",
+    "Est-ce que je peux prendre du paracétamol ?",
+    "Mon enfant a aussi mal à la tête, est-ce grave ?",
+    "Combien de temps faut-il attendre avant d'aller à l'hôpital ?",
+]
+RESPONSE = (
+    "Je comprends votre inquiétude. Buvez beaucoup d'eau, reposez-vous et surveillez votre température. "
+    "Si la fièvre dépasse 39°C ou dure plus de trois jours, consultez un médecin rapidement."
+)
+
+def conversation(turns):
+    """History and message of each successive turn of a conversation"""
+    history = []
+    for turn in range(turns):
+        message = MESSAGES[turn % len(MESSAGES)] + f" ({turn})"
+        yield list(history), message
+        history.append({"message": message, "response": RESPONSE})
+
+def string_prompt(builder, history, message):
+    """Whole prompt rendered as text, as apply_chat_template would produce it"""
+    messages = [("system", SYSTEM_PROMPT)]
+    for h in history:
+        messages += [("user", h["message"]), ("assistant", h["response"])]
+    messages.append(("user", message))
+    return builder.render(messages, add_generation_prompt=True)
+
+def summary(label, samples):
+    samples = sorted(samples)
+    return (f"{label} : moyenne {statistics.mean(samples):.0f} µs, "
+            f"p50 {samples[len(samples) // 2]:.0f} µs, p99 {samples[int(0.99 * len(samples))]:.0f} µs")
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default=settings.MODEL_NAME, help="Dossier ou nom du tokenizer")
+    parser.add_argument("--turns", type=int, default=20, help="Tours par conversation")
+    parser.add_argument("--conversations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmark de la construction des prompts ({args.conversations} conversations de {args.turns} tours)...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model, use_fast=True)
+    builder = PromptBuilder(tokenizer)
+
+    render_times, tokenize_times, assemble_times = [], [], []
+    mismatches = 0
+    for _ in range(args.conversations):
+        for history, message in conversation(args.turns):
+            start = time.perf_counter()
+            text = string_prompt(builder, history, message)
+            rendered = time.perf_counter()
+            reference = builder.bos_ids + tokenizer(text, add_special_tokens=False)["input_ids"]
+            tokenized = time.perf_counter()
+            render_times.append((rendered - start) * 1e6)
+            tokenize_times.append((tokenized - rendered) * 1e6)
+
+            start = time.perf_counter()
+            messages = []
+            for h in history:
+                messages += [("user", h["message"]), ("assistant", h["response"])]
+            messages.append(("user", message))
+            ids = builder.build(SYSTEM_PROMPT, messages)
+            assemble_times.append((time.perf_counter() - start) * 1e6)
+            mismatches += ids != reference
+
+    full = [render + tokenize for render, tokenize in zip(render_times, tokenize_times)]
+    print("\n" + "="*60)
+    print(summary("📝 Rendu du texte", render_times))
+    print(summary("🔤 Tokenisation complète", tokenize_times))
+    print(summary("🐢 Texte + tokenisation", full))
+    print(summary("⚡ Assemblage des segments", assemble_times))
+    print(f"📈 Accélération moyenne : {statistics.mean(full) / statistics.mean(assemble_times):.1f}x")
+    print(f"🧩 Segments en cache : {builder.stats()}")
+    print(f"{'✅' if not mismatches else '❌'} Prompts différents de la tokenisation complète : {mismatches}")
+    return 0 if not mismatches else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
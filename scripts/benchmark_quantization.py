@@ -0,0 +1,134 @@
+"""
+Benchmark of the quantized CPU inference modes against the fp32 baseline
+Reports generation latency, resident memory and evaluation score deltas
+on the messages of data/test_conversations.json
+
+Run from the repository root: python -m scripts.benchmark_quantization
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+def rss_mb():
+    """Resident memory of this process in MB (peak value without psutil)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load_test_messages():
+    """User messages of the test conversations, with their language"""
+    with open('data/test_conversations.json', 'r', encoding='utf-8') as f:
+        test_data = json.load(f)
+
+    messages = []
+    for conversation in test_data['test_conversations']:
+        for message_data in conversation['messages']:
+            messages.append((message_data['user'], conversation.get('language', 'fr')))
+    return messages
+
+async def run_mode(mode, max_new_tokens):
+    """Load the model in one quantization mode and answer every test message"""
+    from backend.config import settings
+    settings.QUANTIZATION = mode
+    settings.MAX_NEW_TOKENS = max_new_tokens
+    settings.TEMPERATURE = 0  # greedy decoding so that modes are comparable
+
+    from backend.chatbot import MedicalChatbot
+    from backend.evaluation import evaluate_response
+
+    chatbot = MedicalChatbot()
+    start = time.perf_counter()
+    await chatbot.load_model()
+    load_time = time.perf_counter() - start
+    if not chatbot.model_loaded:
+        raise RuntimeError(f"Impossible de charger le modèle en mode {mode}")
+
+    latencies, scores = [], []
+    for message, language in load_test_messages():
+        start = time.perf_counter()
+        response = await chatbot.generate_response(message, language)
+        latencies.append(time.perf_counter() - start)
+        scores.append(evaluate_response(message, response)['score'])
+
+    return {
+        'mode': mode,
+        'load_time': load_time,
+        'rss_mb': rss_mb(),
+        'latencies': latencies,
+        'scores': scores
+    }
+
+def run_in_subprocess(mode, max_new_tokens):
+    """Measure each mode in a fresh process so memory figures do not add up"""
+    result = subprocess.run(
+        [sys.executable, "-m", "scripts.benchmark_quantization", "--worker", mode, "--max-new-tokens", str(max_new_tokens)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(f"❌ Mode {mode} en échec:\n{result.stderr[-2000:]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def report(results):
+    """Print latency, memory and score deltas against the fp32 baseline"""
+    baseline = results.get('none')
+
+    print("\n" + "="*78)
+    print(f"{'Mode':<8}{'Latence moy. (s)':>18}{'p95 (s)':>10}{'RSS (MB)':>12}{'Score moy.':>12}{'Δ score':>10}{'Δ max':>8}")
+    print("="*78)
+    for mode, result in results.items():
+        latencies = sorted(result['latencies'])
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        mean_score = statistics.mean(result['scores'])
+        if baseline:
+            deltas = [s - b for s, b in zip(result['scores'], baseline['scores'])]
+            delta = f"{statistics.mean(deltas):+.3f}"
+            delta_max = f"{max(abs(d) for d in deltas):.3f}"
+        else:
+            delta = delta_max = "n/a"
+        print(f"{mode:<8}{statistics.mean(latencies):>18.2f}{p95:>10.2f}{result['rss_mb']:>12.0f}"
+              f"{mean_score:>12.3f}{delta:>10}{delta_max:>8}")
+
+    if baseline:
+        for mode, result in results.items():
+            if mode != 'none':
+                speedup = statistics.mean(baseline['latencies']) / statistics.mean(result['latencies'])
+                memory = result['rss_mb'] / baseline['rss_mb']
+                print(f"⚡ {mode}: x{speedup:.2f} plus rapide, {memory:.0%} de la mémoire fp32")
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", default="none,int8,int4", help="Modes à comparer, 'none' étant la référence fp32")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_mode(args.worker, args.max_new_tokens))))
+        return 0
+
+    print("🚀 Benchmark des modes de quantification...")
+    results = {}
+    for mode in args.modes.split(","):
+        print(f"⏱️ Mode {mode}...")
+        result = run_in_subprocess(mode, args.max_new_tokens)
+        if result:
+            results[mode] = result
+
+    if not results:
+        return 1
+    report(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Benchmark of the knowledge base retrieval index
+Builds the BM25 index over a synthetic knowledge base of 50k conditions and
+reports build time, incremental reload time (reading the JSON file apart)
+and retrieve() latency. Every query names a condition, so its "maladie"
+term matches all of them: retrieve() scores the whole collection, and
+should stay under a millisecond
+
+Run from the repository root: python -m scripts.benchmark_retrieval
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from backend.knowledge_index import KnowledgeIndex, load_entries
+
+SYMPTOMS = [
+    "fièvre", "frissons", "maux de tête", "nausées", "vomissements", "toux", "diarrhée", "fatigue",
+    "douleur thoracique", "douleur abdominale", "éruption cutanée", "démangeaisons", "vertiges",
+    "difficultés respiratoires", "perte d'appétit", "saignements", "convulsions", "jaunisse",
+    "courbatures", "gorge irritée", "yeux rouges", "perte de poids", "sueurs nocturnes", "palpitations",
+]
+
+def synthetic_knowledge(conditions, seed=0):
+    """Knowledge base with `conditions` random conditions sharing a common symptom vocabulary"""
+    rng = random.Random(seed)
+    with open('data/medical_knowledge.json', 'r', encoding='utf-8') as f:
+        knowledge = json.load(f)
+    knowledge['conditions'] = [
+        {
+            "id": f"condition_{i}",
+            "name": f"Maladie {i}",
+            "category": "synthetic",
+            "symptoms": rng.sample(SYMPTOMS, rng.randint(2, 6)),
+            "description": f"Affection synthétique numéro {i}",
+            "treatment": "Consultation médicale",
+            "prevention": "Hygiène",
+            "languages": {"fr": f"Maladie {i}", "en": f"Disease {i}", "wolof": f"Feebar {i}", "hausa": f"Cuta {i}"}
+        }
+        for i in range(conditions)
+    ]
+    return knowledge
+
+def write_json(path, knowledge):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(knowledge, f, ensure_ascii=False)
+
+def timed_load(index, path):
+    """Time to read the file, and to (re)build the index from it"""
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = load_entries(json.load(f))
+    parsed = time.perf_counter()
+    index.build(entries)
+    return parsed - start, time.perf_counter() - parsed
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conditions", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--changed", type=float, default=0.01, help="Part des entrées modifiées avant le rechargement")
+    args = parser.parse_args()
+
+    print(f"🚀 Benchmark de l'index de connaissances ({args.conditions} affections)...")
+    knowledge = synthetic_knowledge(args.conditions)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'medical_knowledge.json')
+        write_json(path, knowledge)
+
+        index = KnowledgeIndex(path)
+        build_read, build_time = timed_load(index, path)
+
+        rng = random.Random(1)
+        for condition in rng.sample(knowledge['conditions'], int(args.changed * args.conditions)):
+            condition['symptoms'] = rng.sample(SYMPTOMS, 3)
+        write_json(path, knowledge)
+        reload_read, reload_time = timed_load(index, path)
+
+    queries = [
+        f"J'ai {' et '.join(rng.sample(SYMPTOMS, rng.randint(1, 3)))} depuis hier, est-ce la maladie {rng.randrange(args.conditions)} ?"
+        for _ in range(args.queries)
+    ]
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.retrieve(query, "fr", 3)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+
+    print("\n" + "="*60)
+    print(f"📚 Entrées indexées : {len(index)}")
+    print(f"🏗️ Construction : {build_time:.2f} s (+ {build_read:.2f} s de lecture du JSON)")
+    print(f"🔄 Rechargement incrémental ({args.changed:.0%} modifiées) : {reload_time:.2f} s (+ {reload_read:.2f} s de lecture du JSON)")
+    print(f"⏱️ retrieve() : moyenne {statistics.mean(latencies):.0f} µs, "
+          f"p50 {latencies[len(latencies) // 2]:.0f} µs, p99 {latencies[int(0.99 * len(latencies))]:.0f} µs")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
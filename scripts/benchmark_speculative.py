@@ -0,0 +1,77 @@
+"""
+Benchmark of prompt-lookup speculative decoding against plain decoding
+Reports generated tokens per second with and without speculation, the
+draft acceptance rate, and checks that greedy outputs are identical, on
+the messages of data/test_conversations.json
+
+Run from the repository root: python -m scripts.benchmark_speculative
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from scripts.benchmark_quantization import load_test_messages
+
+async def generate_all(chatbot, messages, max_new_tokens):
+    """Raw generations for every message, with the number of tokens and the time spent"""
+    outputs, tokens, elapsed = [], 0, 0.0
+    for message, language in messages:
+        prefix, prompt_ids = await chatbot._build_prompt(message, language, None, None)
+        start = time.perf_counter()
+        text = await chatbot.batcher.submit_ids(prompt_ids, max_new_tokens=max_new_tokens, prefix=prefix)
+        elapsed += time.perf_counter() - start
+        outputs.append(text)
+        tokens += len(chatbot.tokenizer(text, add_special_tokens=False)["input_ids"])
+    return outputs, tokens, elapsed
+
+async def run(max_new_tokens, num_tokens):
+    from backend.config import settings
+    settings.SPECULATIVE_DECODING = True
+    settings.SPECULATIVE_NUM_TOKENS = num_tokens
+    settings.TEMPERATURE = 0  # greedy decoding: both modes must produce the same text
+
+    from backend.chatbot import MedicalChatbot
+
+    chatbot = MedicalChatbot()
+    await chatbot.load_model()
+    if not chatbot.model_loaded:
+        raise RuntimeError(f"Impossible de charger le modèle : {chatbot.load_error}")
+
+    messages = load_test_messages()
+    drafter = chatbot.batcher.drafter
+
+    chatbot.batcher.drafter = None
+    baseline, baseline_tokens, baseline_time = await generate_all(chatbot, messages, max_new_tokens)
+
+    chatbot.batcher.drafter = drafter
+    speculative, speculative_tokens, speculative_time = await generate_all(chatbot, messages, max_new_tokens)
+
+    stats = drafter.stats()
+    identical = sum(a == b for a, b in zip(baseline, speculative))
+
+    print("\n" + "="*60)
+    print(f"{'Mode':<14}{'Tokens':>10}{'Temps (s)':>12}{'Tokens/s':>12}")
+    print("="*60)
+    print(f"{'standard':<14}{baseline_tokens:>10}{baseline_time:>12.2f}{baseline_tokens / baseline_time:>12.1f}")
+    print(f"{'spéculatif':<14}{speculative_tokens:>10}{speculative_time:>12.2f}{speculative_tokens / speculative_time:>12.1f}")
+    print("="*60)
+    print(f"⚡ Accélération : x{baseline_time / speculative_time:.2f}")
+    print(f"🎯 Taux d'acceptation des brouillons : {stats['acceptance_rate']:.1%} "
+          f"({stats['accepted_tokens']}/{stats['drafted_tokens']}), {stats['tokens_per_step']:.2f} tokens par vérification")
+    print(f"{'✅' if identical == len(messages) else '❌'} Réponses identiques : {identical}/{len(messages)}")
+    return identical == len(messages)
+
+def main():
+    """Main benchmark runner"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--num-tokens", type=int, default=5, help="Longueur maximale des brouillons")
+    args = parser.parse_args()
+
+    print("🚀 Benchmark du décodage spéculatif...")
+    return 0 if asyncio.run(run(args.max_new_tokens, args.num_tokens)) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
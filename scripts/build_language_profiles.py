@@ -0,0 +1,38 @@
+"""
+Build the language identification profiles
+Computes the character n-gram profiles of every language of the sample
+texts and writes them where the language identifier loads them from
+
+Run from the repository root: python -m scripts.build_language_profiles
+"""
+
+import argparse
+import json
+import sys
+
+from backend.config import settings
+from backend.language_id import PROFILE_SIZE, build_profiles
+
+def main():
+    """Profile builder entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", default="data/language_samples.json", help="Textes d'exemple par langue")
+    parser.add_argument("--output", default=settings.LANGUAGE_PROFILES_PATH)
+    parser.add_argument("--profile-size", type=int, default=PROFILE_SIZE, help="N-grammes conservés par langue")
+    args = parser.parse_args()
+
+    print(f"🚀 Construction des profils de langue depuis {args.samples}...")
+    with open(args.samples, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+
+    profiles = build_profiles(samples, args.profile_size)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(profiles, f, ensure_ascii=False, separators=(",", ":"))
+
+    for language, profile in profiles['languages'].items():
+        print(f"🌍 {language} : {len(samples[language])} textes, {len(profile['ngrams'])} n-grammes")
+    print(f"✅ Profils écrits dans {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
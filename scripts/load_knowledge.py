@@ -0,0 +1,37 @@
+"""
+Load a knowledge base JSON file into the MedicalKnowledge table and its
+full-text search index; existing entries are updated in place
+
+Run from the repository root: python -m scripts.load_knowledge [path]
+"""
+
+import argparse
+import sys
+import time
+
+from backend.config import settings
+from backend.database import SessionLocal, init_db
+from backend.knowledge_store import bulk_load
+
+def main():
+    """Main loader"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", nargs="?", default=settings.MEDICAL_KNOWLEDGE_PATH)
+    parser.add_argument("--batch-size", type=int, default=settings.KNOWLEDGE_LOAD_BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        print(f"📚 Chargement de {args.path}...")
+        start = time.perf_counter()
+        counts = bulk_load(db, args.path, args.batch_size)
+    finally:
+        db.close()
+
+    print(f"✅ {counts['inserted']} ajoutées, {counts['updated']} mises à jour, {counts['unchanged']} inchangées "
+          f"en {time.perf_counter() - start:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
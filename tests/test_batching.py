@@ -0,0 +1,174 @@
+"""
+Tests for the continuous batching helpers
+"""
+
+import asyncio
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+from backend import kv_cache
+from backend.batching import ContinuousBatcher, sample_next_tokens
+from backend.speculative import PromptLookupDrafter
+
+def make_cache(batch, length, layers=2):
+    """Create a random legacy cache"""
+    return tuple(
+        (torch.randn(batch, 2, length, 4), torch.randn(batch, 2, length, 4))
+        for _ in range(layers)
+    )
+
+class TinyTokenizer:
+    """Token ids as text, enough for the batcher"""
+    eos_token_id = 0
+    pad_token_id = 0
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return " ".join(str(token) for token in token_ids)
+
+def tiny_model():
+    """A randomly initialised two-layer Llama"""
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=128)
+    return LlamaForCausalLM(config).eval()
+
+def greedy(model, prompt_ids, max_new_tokens):
+    """Reference decoding: the whole sequence again at each step, no cache"""
+    ids = list(prompt_ids)
+    with torch.inference_mode():
+        for _ in range(max_new_tokens):
+            token = int(model(input_ids=torch.tensor([ids])).logits[0, -1].argmax())
+            if token == 0:
+                break
+            ids.append(token)
+    return TinyTokenizer().decode(ids[len(prompt_ids):])
+
+class WrongDrafter(PromptLookupDrafter):
+    """Drafts tokens the model rarely predicts, noting the cache length at each step"""
+
+    def __init__(self, batcher):
+        super().__init__(num_tokens=3)
+        self.batcher = batcher
+        # (cache length, tokens of each sequence already in the cache) per step
+        self.lengths = []
+        self._past = None
+
+    def draft(self, context):
+        if self.batcher._past is not self._past:
+            self._past = self.batcher._past
+            self.lengths.append((kv_cache.seq_length(self._past), []))
+        # The pending token is not in the cache yet
+        self.lengths[-1][1].append(len(context) - 1)
+        return [61, 62, 63]
+
+class TestKVCache:
+    """Test cases for cache merging and slicing"""
+
+    def test_merge_left_pads_shorter_cache(self):
+        """Caches of different lengths are left-padded before concatenation"""
+        short, long = make_cache(1, 3), make_cache(2, 5)
+        merged, mask = kv_cache.merge([
+            (short, torch.ones(1, 3, dtype=torch.long)),
+            (long, torch.ones(2, 5, dtype=torch.long)),
+        ])
+
+        assert merged[0][0].shape == (3, 2, 5, 4)
+        assert mask[0].tolist() == [0, 0, 1, 1, 1]
+        assert torch.equal(merged[0][0][0, :, 2:], short[0][0][0])
+
+    def test_select_trims_unused_padding(self):
+        """Dropping the longest row removes the padding columns nobody needs"""
+        merged, mask = kv_cache.merge([
+            (make_cache(1, 2), torch.ones(1, 2, dtype=torch.long)),
+            (make_cache(1, 6), torch.ones(1, 6, dtype=torch.long)),
+        ])
+        selected, mask = kv_cache.select(merged, mask, [0])
+
+        assert kv_cache.seq_length(selected) == 2
+        assert mask.tolist() == [[1, 1]]
+
+    def test_truncate_right_aligns_rows(self):
+        """Rows cut to different lengths are left-padded back together, without columns nobody needs"""
+        cache, mask = make_cache(2, 6), torch.tensor([[0, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1]])
+        truncated, mask = kv_cache.truncate(cache, mask, [6, 3])
+
+        assert mask.tolist() == [[1, 1, 1, 1, 1], [0, 0, 1, 1, 1]]
+        assert torch.equal(truncated[0][0][1, :, 2:], cache[0][0][1, :, :3])
+
+    def test_position_ids_skip_padding(self):
+        """Positions start at zero on the first real token"""
+        mask = torch.tensor([[0, 0, 1, 1], [1, 1, 1, 1]])
+        assert kv_cache.position_ids(mask).tolist() == [[0, 0, 0, 1], [0, 1, 2, 3]]
+
+class TestContinuousBatcher:
+    """Test cases running the scheduler over a real model"""
+
+    def test_batched_generation_matches_greedy(self):
+        """Prompts of different lengths, one after a precomputed prefix, decode as they would alone"""
+        model = tiny_model()
+        batcher = ContinuousBatcher(model, TinyTokenizer(), max_batch_size=4, batch_window_ms=50, temperature=0)
+        prefix = batcher.precompute_prefix([5, 6, 7])
+        assert kv_cache.seq_length(prefix.past) == 3
+
+        async def run():
+            try:
+                return await asyncio.gather(
+                    batcher.submit_ids([3, 9, 12, 4, 8], max_new_tokens=6),
+                    batcher.submit_ids([11, 2], max_new_tokens=4),
+                    batcher.submit_ids([21, 22], max_new_tokens=5, prefix=prefix),
+                )
+            finally:
+                await batcher.close()
+
+        assert asyncio.run(run()) == [
+            greedy(model, [3, 9, 12, 4, 8], 6),
+            greedy(model, [11, 2], 4),
+            greedy(model, [5, 6, 7, 21, 22], 5),
+        ]
+
+    def test_rejected_draft_leaves_no_cache(self):
+        """The cache only grows with accepted tokens, and drafting does not change the greedy output"""
+        model = tiny_model()
+        batcher = ContinuousBatcher(model, TinyTokenizer(), max_batch_size=4, batch_window_ms=50, temperature=0)
+        batcher.drafter = WrongDrafter(batcher)
+
+        async def run():
+            try:
+                return await asyncio.gather(
+                    batcher.submit_ids([3, 9, 12, 4, 8], max_new_tokens=8),
+                    batcher.submit_ids([11, 2], max_new_tokens=8),
+                )
+            finally:
+                await batcher.close()
+
+        assert asyncio.run(run()) == [greedy(model, [3, 9, 12, 4, 8], 8), greedy(model, [11, 2], 8)]
+        assert batcher.drafter.accepted_tokens < batcher.drafter.drafted_tokens
+        # Every step sees a cache exactly as long as the longest sequence it holds
+        assert all(cached == max(seen) for cached, seen in batcher.drafter.lengths)
+
+    def test_stop_string_retires_sequence(self):
+        """A sequence leaves the batch as soon as its text holds the stop string, the others go on"""
+        model = tiny_model()
+        tokens = greedy(model, [3, 9, 12, 4, 8], 8).split()
+        stop = " ".join(tokens[2:4])
+        batcher = ContinuousBatcher(model, TinyTokenizer(), max_batch_size=4, batch_window_ms=50, temperature=0, stop=stop)
+
+        async def run():
+            try:
+                return await asyncio.gather(
+                    batcher.submit_ids([3, 9, 12, 4, 8], max_new_tokens=8),
+                    batcher.submit_ids([11, 2], max_new_tokens=8),
+                )
+            finally:
+                await batcher.close()
+
+        def until_stop(text):
+            return text[:text.index(stop) + len(stop)] if stop in text else text
+
+        stopped, other = asyncio.run(run())
+        assert stopped == until_stop(greedy(model, [3, 9, 12, 4, 8], 8)) and len(stopped.split()) <= 4
+        assert other == until_stop(greedy(model, [11, 2], 8))
+
+def test_greedy_sampling():
+    """Zero temperature picks the most likely token"""
+    logits = torch.tensor([[0.1, 2.0, 0.3], [5.0, 0.0, 1.0]])
+    assert sample_next_tokens(logits, temperature=0, top_p=1.0).tolist() == [1, 0]
@@ -58,6 +58,11 @@ class TestMedicalChatbot:
         # Should add medical disclaimer
         assert "consulter" in processed.lower() or "professionnel" in processed.lower()
     
+    def test_stop_marker_overlap(self, chatbot):
+        """Test that a partial stop marker is held back while streaming"""
+        assert chatbot._stop_marker_overlap("Prenez du repos.\n<|us") == len("<|us")
+        assert chatbot._stop_marker_overlap("Prenez du repos.") == 0
+    
     def test_get_fallback_response(self, chatbot):
         """Test fallback responses"""
         fallback_fr = chatbot._get_fallback_response("fr")
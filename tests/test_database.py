@@ -0,0 +1,22 @@
+"""
+Tests for the database engine configuration
+"""
+
+from backend.database import async_database_url, pool_options
+
+class TestDatabaseConfiguration:
+    """Test cases for the async engine URL and the pool settings"""
+
+    def test_async_drivers(self):
+        """Known backends switch to their async driver, whatever driver the URL names"""
+        assert async_database_url("sqlite:///./medical_chatbot.db") == "sqlite+aiosqlite:///./medical_chatbot.db"
+        assert async_database_url("postgresql://user:secret@db/chatbot") == "postgresql+asyncpg://user:secret@db/chatbot"
+        assert async_database_url("postgresql+psycopg2://user@db/chatbot") == "postgresql+asyncpg://user@db/chatbot"
+        assert async_database_url("mysql+aiomysql://user@db/chatbot") == "mysql+aiomysql://user@db/chatbot"
+
+    def test_pool_sizing(self):
+        """File and server databases get a sized pool, in-memory SQLite keeps its single connection"""
+        assert "pool_size" in pool_options("sqlite:///./medical_chatbot.db")
+        assert "pool_size" in pool_options("postgresql://user@db/chatbot")
+        assert "pool_size" not in pool_options("sqlite://")
+        assert pool_options("sqlite:///:memory:")["connect_args"] == {"check_same_thread": False}
@@ -0,0 +1,79 @@
+"""
+Tests for emergency-sign detection
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+from backend import main
+from backend.emergency import detect_emergency
+from backend.models import ChatRequest, Conversation
+
+class TestEmergencyDetection:
+    """Test cases for the emergency fast path detector"""
+
+    def test_detects_signs_with_localised_answer(self):
+        """Matched signs are reported and the answer is in the request language"""
+        alert = detect_emergency("Mon fils a des CONVULSIONS et a perdu connaissance", "fr")
+
+        assert alert.signs == ["convulsions", "unconscious"]
+        assert "Consultez immédiatement" in alert.response
+
+        alert = detect_emergency("My daughter can't breathe", "en")
+        assert alert.labels == ["Severe breathing difficulties"]
+
+    def test_other_languages(self):
+        """Signs are recognised in local languages too"""
+        assert detect_emergency("Mtoto ana degedege", "swahili").signs == ["convulsions"]
+
+    def test_negated_signs(self):
+        """Signs the message denies do not trigger the fast path"""
+        assert detect_emergency("Pas de convulsion depuis hier", "fr") is None
+        assert detect_emergency("Il n'a pas eu de convulsions et aucune perte de conscience", "fr") is None
+        assert detect_emergency("No seizure and no difficulty breathing", "en") is None
+        assert detect_emergency("He hasn't had a seizure", "en") is None
+
+    def test_negation_stays_in_its_clause(self):
+        """A negation elsewhere in the message leaves the signs it does not govern"""
+        assert detect_emergency("Pas de fièvre mais il convulse", "fr").signs == ["convulsions"]
+        assert detect_emergency("Pas de convulsion hier, mais une convulsion ce matin", "fr").signs == ["convulsions"]
+        assert detect_emergency("Je ne sais pas s'il a eu une convulsion", "fr").signs == ["convulsions"]
+        assert detect_emergency("No seizure, but he passed out", "en").signs == ["unconscious"]
+
+    def test_ordinary_message(self):
+        """Common symptoms do not trigger the fast path"""
+        assert detect_emergency("J'ai de la fièvre et mal à la tête", "fr") is None
+
+class TestEmergencyAnswer:
+    """Test cases for the emergency reply and its follow-up"""
+
+    def test_reply_does_not_wait_for_history(self):
+        """The reply is stored and returned without reading the history; the follow-up reads it without the reply"""
+        request = ChatRequest(message="Mon fils a des convulsions", session_id="s")
+        alert = detect_emergency(request.message, "fr")
+        conversation = Conversation(user_id="user", session_id="s", message=request.message, response=alert.response)
+        load_history = AsyncMock(return_value=[])
+
+        async def run():
+            with patch.object(main, "_load_history", load_history), \
+                    patch.object(main, "_save_exchange", AsyncMock(return_value=({}, conversation))), \
+                    patch.object(main, "_emergency_followup", AsyncMock()) as followup, \
+                    patch.object(main.settings, "EMERGENCY_FOLLOWUP_ENABLED", True), \
+                    patch.object(type(main.chatbot), "model_loaded", True):
+                answer = await main._answer_emergency(None, "user", request, alert)
+                assert not load_history.called
+                await asyncio.sleep(0)
+                return answer, followup
+
+        answer, followup = asyncio.run(run())
+        assert answer.emergency_signs == alert.labels
+        followup.assert_awaited_once_with(conversation, "user", request)
+
+    def test_history_leaves_out_the_reply(self):
+        """The follow-up prompt history skips the exchange being completed, queued or stored"""
+        conversation = Conversation(id=2, user_id="user", session_id="s", message="q2", response="r2")
+        stored = [Conversation(id=1, message="q1", response="r1"), Conversation(id=2, message="q2", response="r2")]
+
+        with patch.object(main.chatbot, "get_conversation_history", AsyncMock(return_value=(stored, 0))), \
+                patch.object(main.settings, "ENCRYPT_CONVERSATIONS", False):
+            history = asyncio.run(main._load_history(None, "user", "s", exclude=conversation))
+        assert [item["message"] for item in history] == ["q1"]
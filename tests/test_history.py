@@ -0,0 +1,126 @@
+"""
+Tests for the keyset-paginated conversation history
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from backend.chatbot import MedicalChatbot
+from backend.config import settings
+from backend.migrations import migrate
+from backend.models import Base, Conversation
+from backend.persistence import ConversationWriter
+
+START = datetime(2024, 1, 1, 8, 0, 0)
+
+def turn(i, session_id="a"):
+    return Conversation(user_id="user", session_id=session_id, message=f"question {i}", response=f"réponse {i}",
+                        language="fr", timestamp=START + timedelta(seconds=i))
+
+async def with_database(test):
+    """Run `test(page, writer)` against a fresh in-memory database of 7 turns, two of them at the same time"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with factory() as db:
+        rows = [turn(i) for i in range(6)] + [turn(5), turn(0, "b")]
+        db.add_all(rows)
+        await db.commit()
+
+    writer = ConversationWriter(factory, batch_size=100, flush_ms=60000)
+    chatbot = SimpleNamespace(conversation_writer=writer)
+
+    async def page(method=MedicalChatbot.get_conversation_page, **options):
+        async with factory() as db:
+            return await method(chatbot, db, "user", "a", **options)
+    try:
+        await test(page, writer)
+    finally:
+        await writer.close()
+        await engine.dispose()
+
+class TestHistoryPages:
+    """Test cases for cursor pagination and incremental sync"""
+
+    def test_pages_follow_the_cursor(self):
+        """Pages cover every turn once, in order, ties broken by id"""
+        async def test(page, writer):
+            seen, after, more = [], None, True
+            while more:
+                rows, more = await page(after=after, limit=3)
+                seen += rows
+                after = (rows[-1].timestamp, rows[-1].id)
+            assert [row.id for row in seen] == [1, 2, 3, 4, 5, 6, 7]
+            assert [len(chunk) for chunk in (seen[:3], seen[3:6], seen[6:])] == [3, 3, 1]
+        asyncio.run(with_database(test))
+
+    def test_since_and_queued_turns(self):
+        """`since` skips older turns and leaves the queued ones until they are written"""
+        async def test(page, writer):
+            await writer.put(turn(9))
+            rows, more = await page(since=START + timedelta(seconds=4), limit=10)
+            assert not more
+            assert [row.message for row in rows] == ["question 5", "question 5"]
+            assert all(row.id is not None for row in rows)
+
+            await writer.flush()
+            rows, more = await page(since=rows[-1].timestamp, limit=10)
+            assert [(row.message, row.id) for row in rows] == [("question 9", 9)]
+        asyncio.run(with_database(test))
+
+    def test_queued_turns_fill_the_last_page(self):
+        """Queued turns only take the room left on the last page"""
+        async def test(page, writer):
+            queued = [await writer.put(turn(i)) for i in (9, 10, 11)]
+            rows, more = await page(limit=2)
+            assert more and not set(queued) & set(rows)
+
+            rows, more = await page(after=(rows[-1].timestamp, rows[-1].id), limit=7)
+            assert not more and len(rows) == 7
+            assert rows[-2:] == queued[:2]
+            assert rows[-1].id is None
+        asyncio.run(with_database(test))
+
+class TestPromptHistory:
+    """Test cases for the latest turns loaded for the prompt"""
+
+    def test_position_in_the_session(self):
+        """The latest turns come with the position of the first one, queued turns included"""
+        async def test(page, writer):
+            queued = await writer.put(turn(9))
+            with patch.object(settings, "MAX_CONVERSATION_LENGTH", 3):
+                rows, first = await page(MedicalChatbot.get_conversation_history)
+                assert first == 5
+                assert [row.message for row in rows] == ["question 5", "question 5", "question 9"]
+                assert rows[-1] is queued
+
+                rows, first = await page(MedicalChatbot.get_conversation_history, include_pending=False)
+                assert first == 4 and len(rows) == 3
+        asyncio.run(with_database(test))
+
+class TestTimestampMigration:
+    """Test cases for the timestamps stored by func.now()"""
+
+    def test_timestamps_padded(self, tmp_path):
+        """Second-precision timestamps compare correctly against bound values once migrated"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'chatbot.db'}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO conversations (user_id, session_id, message, response, language, timestamp) "
+                "VALUES ('user', 'a', 'q', 'r', 'fr', '2024-01-01 08:00:00')"
+            ))
+        query = text("SELECT count(*) FROM conversations WHERE timestamp >= :moment")
+        moment = "2024-01-01 08:00:00.000000"
+
+        with engine.connect() as connection:
+            assert connection.execute(query, {"moment": moment}).scalar() == 0
+        migrate(engine)
+        with engine.connect() as connection:
+            assert connection.execute(query, {"moment": moment}).scalar() == 1
+        engine.dispose()
@@ -0,0 +1,79 @@
+"""
+Tests for the inference executor and its back-pressure errors
+"""
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from backend.batching import ContinuousBatcher
+from backend.chatbot import MedicalChatbot
+from backend.inference import InferenceExecutor, InferenceQueueFull, ModelNotReady
+from backend.main import _unavailable
+
+class Tokenizer:
+    eos_token_id = 0
+    pad_token_id = 0
+
+class TestInferenceExecutor:
+    """Test cases for the dedicated inference thread"""
+
+    def test_runs_off_the_event_loop(self):
+        """Blocking calls run on the inference thread while the loop keeps going"""
+        executor = InferenceExecutor()
+        release = threading.Event()
+
+        async def run():
+            blocked = asyncio.ensure_future(executor.run(lambda: release.wait(5) and threading.current_thread().name))
+            await asyncio.sleep(0.01)
+            # The loop is free while the call blocks
+            assert not blocked.done()
+            release.set()
+            return await blocked
+
+        assert asyncio.run(run()).startswith("inference")
+        executor.shutdown()
+
+class TestBackPressure:
+    """Test cases for the queue bound and the model loading state"""
+
+    def test_queue_full(self):
+        """Requests past the queue bound are refused at once, with a 503 and Retry-After"""
+        batcher = ContinuousBatcher(None, Tokenizer(), max_queue_size=1, executor=InferenceExecutor())
+
+        async def run():
+            await batcher._enqueue([1, 2])
+            assert not batcher.has_capacity()
+            try:
+                with pytest.raises(InferenceQueueFull) as raised:
+                    await batcher._enqueue([3, 4])
+            finally:
+                await batcher.close()
+            return raised.value
+
+        error = asyncio.run(run())
+        response = _unavailable(error)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(error.retry_after)
+
+    def test_model_not_ready_until_loaded(self):
+        """Generation is refused while the weights load, then served"""
+        chatbot = MedicalChatbot()
+        release = threading.Event()
+
+        async def run():
+            with patch.object(MedicalChatbot, "_load_weights", lambda self: release.wait(5)), \
+                    patch("backend.chatbot.settings.WARMUP_ENABLED", False):
+                task = chatbot.start_background_load()
+                await asyncio.sleep(0.01)
+                with pytest.raises(ModelNotReady) as raised:
+                    await chatbot.generate_response("J'ai de la fièvre")
+                release.set()
+                await task
+            return raised.value
+
+        error = asyncio.run(run())
+        assert error.status == MedicalChatbot.LOADING
+        assert _unavailable(error).headers["Retry-After"] == str(error.retry_after)
+        assert chatbot.model_loaded
+        chatbot.executor.shutdown()
@@ -0,0 +1,42 @@
+"""
+Tests for the multi-pattern keyword engine
+"""
+
+from backend.keywords import KeywordEngine
+
+class TestKeywordEngine:
+    """Test cases for single-pass keyword matching"""
+
+    def setup_method(self):
+        """Engine over overlapping keyword sets"""
+        self.engine = KeywordEngine({
+            "fever": ["fièvre", "température"],
+            "pain": ["douleur", "mal"],
+            "care": ["prendre soin", "soin"],
+            "negative": ["sûr"],
+        })
+
+    def test_all_categories_in_one_scan(self):
+        """Every category with a keyword in the text is reported"""
+        matches = self.engine.scan("J'ai mal et de la fièvre, comment prendre soin de moi ?")
+
+        assert sorted(matches.categories()) == ["care", "fever", "pain"]
+        assert matches.keywords("care") == {"prendre soin", "soin"}
+
+    def test_case_and_accent_insensitive(self):
+        """Keywords match whatever the case or the accents typed"""
+        assert self.engine.scan("FIEVRE depuis hier").has("fever")
+        assert self.engine.scan("Temperature élevée").has("fever")
+
+    def test_ambiguous_accents_stay_strict(self):
+        """"sûr" does not match the preposition "sur\""""
+        assert not self.engine.scan("Posez-le sur la table").has("negative")
+        assert self.engine.scan("Je suis SÛR").count("negative") == 1
+
+    def test_occurrences_in_text_order(self):
+        """Each occurrence comes with its position, overlapping ones included"""
+        text = "Prendre soin, puis FIEVRE"
+        found = self.engine.occurrences(text)
+
+        assert found == [(0, "care", "prendre soin"), (8, "care", "soin"), (19, "fever", "fièvre")]
+        assert self.engine.occurrences(text, "fever") == [(19, "fever", "fièvre")]
@@ -0,0 +1,76 @@
+"""
+Tests for the knowledge base retrieval index
+"""
+
+import json
+import os
+from unittest.mock import patch
+from backend.knowledge_index import KnowledgeIndex, load_entries
+
+class TestKnowledgeIndex:
+    """Test cases for BM25 retrieval and reloading"""
+
+    def setup_method(self):
+        """Index the shipped knowledge base"""
+        self.index = KnowledgeIndex('data/medical_knowledge.json')
+        self.index.load()
+
+    def test_symptoms_rank_condition_first(self):
+        """Symptoms match conditions, accents and case aside"""
+        results = self.index.search("J'ai de la FIEVRE et des frissons", k=3)
+
+        assert results[0][0].key == "condition:malaria"
+        assert len(results) <= 3
+
+    def test_language_aliases(self):
+        """Conditions are found by their name in other languages"""
+        assert self.index.search("malaria", k=1)[0][0].key == "condition:malaria"
+        assert "Malaria" in self.index.retrieve("paludisme", "en", 1)[0]
+
+    def test_no_match(self):
+        """Messages sharing no term with the knowledge base retrieve nothing"""
+        assert self.index.retrieve("bonjour", "fr") == []
+
+    def test_dense_postings_rank_alike(self):
+        """Scores are the same whether posting lists are stored densely or not"""
+        messages = ["J'ai de la fièvre et des frissons", "paludisme", "toux et fièvre", "diarrhée chez l'enfant"]
+        indexes = {}
+        for share in (0, 2):
+            with patch("backend.knowledge_index.DENSE_POSTINGS", share):
+                indexes[share] = KnowledgeIndex('data/medical_knowledge.json')
+                indexes[share].load()
+        assert all(docs is None for docs, _ in indexes[0]._postings.values())
+        assert all(docs is not None for docs, _ in indexes[2]._postings.values())
+        for message in messages:
+            dense, sparse = ([(entry.key, round(score, 5)) for entry, score in indexes[share].search(message, k=5)] for share in (0, 2))
+            assert dense == sparse and dense
+
+    def test_reload_when_file_changes(self, tmp_path):
+        """A modified file is picked up by reload_if_changed"""
+        path = tmp_path / "knowledge.json"
+        path.write_text(json.dumps({"conditions": [{"id": "a", "name": "Gale", "symptoms": ["démangeaisons"]}]}), encoding="utf-8")
+        index = KnowledgeIndex(str(path))
+        index.load()
+
+        path.write_text(json.dumps({"conditions": [{"id": "b", "name": "Rougeole", "symptoms": ["éruption"]}]}), encoding="utf-8")
+        os.utime(path, (0, 0))
+
+        assert index.reload_if_changed(min_interval=0)
+        assert index.search("éruption", k=1)[0][0].key == "condition:b"
+
+    def test_incremental_reload_matches_fresh_build(self):
+        """A reload rewrites changed, added and removed entries and scores like a fresh index"""
+        with open('data/medical_knowledge.json', 'r', encoding='utf-8') as f:
+            knowledge = json.load(f)
+        knowledge["conditions"][0]["symptoms"] = ["éruption", "démangeaisons"]
+        removed = knowledge["conditions"].pop()
+        knowledge["conditions"].append({"id": "gale", "name": "Gale", "symptoms": ["démangeaisons nocturnes"]})
+        self.index.build(load_entries(knowledge))
+        fresh = KnowledgeIndex('data/medical_knowledge.json')
+        fresh.build(load_entries(knowledge))
+
+        assert len(self.index) == len(fresh)
+        for message in ("démangeaisons et éruption", "fièvre et toux", removed["name"]):
+            assert [(entry.key, round(score, 4)) for entry, score in self.index.search(message, k=10)] == \
+                [(entry.key, round(score, 4)) for entry, score in fresh.search(message, k=10)]
+        assert "condition:" + removed["id"] not in [entry.key for entry, _ in self.index.search(removed["name"], k=10)]
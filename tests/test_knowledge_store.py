@@ -0,0 +1,91 @@
+"""
+Tests for the database knowledge base loader and its full-text search
+"""
+
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base
+from backend.auth import create_access_token
+from backend.chatbot import MedicalChatbot
+from backend.config import settings
+from backend.knowledge_store import bulk_load, create_knowledge_search, search_knowledge
+from backend.main import _require_admin
+
+class TestKnowledgeStore:
+    """Test cases for bulk upserts and FTS5 search"""
+
+    def setup_method(self):
+        """Fresh in-memory database with the FTS index"""
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        create_knowledge_search(engine)
+        self.db = sessionmaker(bind=engine)()
+
+    def teardown_method(self):
+        self.db.close()
+
+    def test_load_and_search(self):
+        """The shipped knowledge base is searchable, accents aside"""
+        counts = bulk_load(self.db, 'data/medical_knowledge.json', batch_size=2)
+
+        assert counts['inserted'] > 0 and counts['updated'] == 0
+        results = search_knowledge(self.db, "J'ai de la fievre et des frissons")
+        assert results[0]['condition'] == "Paludisme"
+        assert search_knowledge(self.db, "paracétamol", category="medication")[0]['condition'] == "Paracétamol"
+
+    def test_reload_upserts(self, tmp_path):
+        """Loading again updates changed entries in place and keeps the index in sync"""
+        path = tmp_path / "knowledge.json"
+        path.write_text(json.dumps({"conditions": [{"name": "Gale", "symptoms": ["démangeaisons"]}]}), encoding="utf-8")
+        bulk_load(self.db, str(path))
+        assert bulk_load(self.db, str(path)) == {"inserted": 0, "updated": 0, "unchanged": 1}
+
+        path.write_text(json.dumps({"conditions": [{"name": "Gale", "symptoms": ["boutons"]}]}), encoding="utf-8")
+
+        assert bulk_load(self.db, str(path))['updated'] == 1
+        assert search_knowledge(self.db, "démangeaisons") == []
+        assert search_knowledge(self.db, "boutons")[0]['condition'] == "Gale"
+
+class TestAdminAccess:
+    """Test cases for the admin endpoints guard"""
+
+    def test_off_by_default(self):
+        """With no ADMIN_USERS, no login reaches the admin endpoints"""
+        with patch.object(settings, "ADMIN_USERS", []), pytest.raises(HTTPException) as raised:
+            _require_admin(create_access_token(data={"sub": "admin"}))
+        assert raised.value.status_code == 403
+
+    def test_configured_admin(self):
+        """Listed users are let through"""
+        with patch.object(settings, "ADMIN_USERS", ["ops"]):
+            assert _require_admin(create_access_token(data={"sub": "ops"})) == "ops"
+
+class TestPromptKnowledge:
+    """Test cases for the full-text search behind the prompt"""
+
+    def test_search_off_the_event_loop(self):
+        """Prompts built without prepared knowledge run the blocking query on a worker thread"""
+        chatbot = MedicalChatbot.__new__(MedicalChatbot)
+        chatbot.medical_prompts = {"diagnostic": "Médecin"}
+        threads = []
+
+        def search(message):
+            threads.append(threading.current_thread())
+            return []
+
+        async def build():
+            with patch.object(chatbot, "_search_knowledge_lines", search), \
+                    patch.object(chatbot, "_build_context", side_effect=RuntimeError("stop")), \
+                    patch.object(settings, "RETRIEVAL_ENABLED", True), \
+                    patch.object(settings, "KNOWLEDGE_BACKEND", "database"):
+                with pytest.raises(RuntimeError):
+                    await chatbot._build_prompt("fièvre", "fr", [], None, adapted_message="fièvre")
+
+        asyncio.run(build())
+        assert len(threads) == 1 and threads[0] is not threading.main_thread()
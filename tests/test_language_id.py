@@ -0,0 +1,46 @@
+"""
+Tests for character n-gram language identification
+"""
+
+from backend.language_id import LanguageIdentifier, build_profiles
+
+class TestLanguageIdentifier:
+    """Test cases for detection with the shipped profiles"""
+
+    def setup_method(self):
+        """Load the precomputed profiles"""
+        self.identifier = LanguageIdentifier('data/language_profiles.json', cache_size=4)
+        self.identifier.load()
+
+    def test_supported_languages(self):
+        """Messages unseen in the samples are recognised, African languages included"""
+        messages = {
+            "fr": "J'ai très mal au dos depuis ce matin",
+            "en": "My back has been hurting since this morning",
+            "swahili": "Mgongo wangu unauma tangu asubuhi",
+            "hausa": "Bayana yana ciwo tun da safe",
+            "wolof": "Sama ndigg dafay metti ba ci suba",
+        }
+
+        assert self.identifier.detect_batch(list(messages.values())) == list(messages)
+
+    def test_too_short(self):
+        """Messages without enough letters are not identified"""
+        assert self.identifier.detect("ok !") is None
+        assert self.identifier.detect("123") is None
+
+    def test_cache_by_normalised_message(self):
+        """Messages differing only in case and punctuation share a cache entry"""
+        self.identifier.detect("Merci beaucoup docteur")
+        self.identifier.detect("MERCI beaucoup, docteur !")
+
+        assert self.identifier.stats()["hits"] == 1
+        assert self.identifier.stats()["entries"] == 1
+
+    def test_build_profiles(self):
+        """Profiles built from samples identify their languages"""
+        identifier = LanguageIdentifier(cache_size=4)
+        identifier.load_profiles(build_profiles({"a": ["aaa aab aba"], "b": ["bbb bba bab"]}))
+
+        assert identifier.detect("abaa baaa") == "a"
+        assert identifier.detect("babb bbba") == "b"
@@ -0,0 +1,36 @@
+"""
+Tests for the schema migrations and the SQLite profile
+"""
+
+from sqlalchemy import create_engine, text
+from backend.database import use_sqlite_profile
+from backend.migrations import MIGRATIONS, applied_versions, migrate
+from backend.models import Base
+
+class TestMigrations:
+    """Test cases for versioned migrations"""
+
+    def test_applied_once(self, tmp_path):
+        """Migrations run on an existing schema once, then are recorded"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'chatbot.db'}")
+        Base.metadata.create_all(bind=engine)
+
+        assert migrate(engine) == [version for version, _, _ in MIGRATIONS]
+        assert migrate(engine) == []
+        assert applied_versions(engine) == [version for version, _, _ in MIGRATIONS]
+        with engine.connect() as connection:
+            plan = connection.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM conversations WHERE user_id = 'u' AND session_id = 's' "
+                "ORDER BY timestamp DESC, id DESC LIMIT 50"
+            )).all()
+        assert "ix_conversations_user_session_time" in plan[0][-1]
+        assert not any("TEMP B-TREE" in row[-1] for row in plan)
+
+    def test_sqlite_profile(self, tmp_path):
+        """Every connection gets the production pragmas"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'chatbot.db'}")
+        use_sqlite_profile(engine)
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() > 0
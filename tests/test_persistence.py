@@ -0,0 +1,130 @@
+"""
+Tests for the write-behind conversation writer
+"""
+
+import asyncio
+import pytest
+from sqlalchemy import exc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Conversation
+from backend.persistence import ConversationWriter
+
+def exchange(session_id, i):
+    return Conversation(user_id="user", session_id=session_id, message=f"question {i}", response=f"réponse {i}", language="fr")
+
+class FlakyFactory:
+    """Session factory whose first `failures` sessions fail to commit with a lost connection"""
+
+    def __init__(self, factory, failures):
+        self.factory, self.failures = factory, failures
+
+    def __call__(self):
+        session = self.factory()
+        if self.failures > 0:
+            self.failures -= 1
+
+            async def commit():
+                raise exc.OperationalError("COMMIT", {}, ConnectionError("connexion perdue"))
+            session.commit = commit
+        return session
+
+async def with_database(test):
+    """Run `test(writer, count, flushed)` against a fresh in-memory database"""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def count():
+        async with factory() as db:
+            return await db.scalar(select(func.count()).select_from(Conversation))
+
+    flushed = []
+    writer = ConversationWriter(factory, batch_size=3, flush_ms=60000, max_queue_size=5, on_flush=flushed.append)
+    try:
+        await test(writer, count, flushed)
+    finally:
+        await engine.dispose()
+
+class TestConversationWriter:
+    """Test cases for queued, batched conversation writes"""
+
+    def test_batch_written_in_one_flush(self):
+        """Queued rows are visible per session, then written together once the batch is full"""
+        async def test(writer, count, flushed):
+            rows = [await writer.put(exchange("a", i)) for i in range(2)]
+            await writer.put(exchange("b", 0))
+            assert [row.message for row in writer.pending("user", "a")] == ["question 0", "question 1"]
+
+            assert await writer.written(rows[0])
+            assert await count() == 3
+            assert [len(batch) for batch in flushed] == [3]
+            assert rows[1].id is not None and writer.pending("user", "a") == []
+        asyncio.run(with_database(test))
+
+    def test_close_flushes_and_discard_drops(self):
+        """Shutdown writes what is left, except the rows of deleted sessions"""
+        async def test(writer, count, flushed):
+            kept = await writer.put(exchange("a", 0))
+            dropped = await writer.put(exchange("b", 0))
+            assert writer.discard("user", "b") == 1
+            await writer.close()
+
+            assert await count() == 1
+            assert await writer.written(kept) and not await writer.written(dropped)
+        asyncio.run(with_database(test))
+
+    def test_full_queue_flushes_before_growing(self):
+        """The queue never holds more than max_queue_size rows while the database is up, and takes the row anyway while it is down"""
+        async def test(writer, count, flushed):
+            writer.batch_size = 100
+            for i in range(7):
+                await writer.put(exchange("a", i))
+                assert len(writer) <= 5
+            await writer.close()
+            assert await count() == 7
+
+            rows = [await writer.put(exchange("b", i)) for i in range(5)]
+            writer.session_factory = FlakyFactory(writer.session_factory, failures=2)
+            for i in range(5, 7):
+                rows.append(await writer.put(exchange("b", i)))
+            assert len(writer) == 7 and writer.stats()["backpressure"] == 2
+            await writer.close()
+            assert await count() == 14
+            assert all([await writer.written(row) for row in rows])
+        asyncio.run(with_database(test))
+
+    def test_bad_row_dropped(self):
+        """A row that can never be written is dropped, the rest of its batch is written"""
+        async def test(writer, count, flushed):
+            good = await writer.put(exchange("a", 0))
+            bad = await writer.put(Conversation(user_id="user", session_id="a", message=None, response="r"))
+            await writer.put(exchange("a", 1))
+
+            assert await writer.written(good) and not await writer.written(bad)
+            assert await count() == 2
+            assert writer.stats()["rows_dropped"] == 1 and len(writer) == 0
+            # The queue keeps moving
+            row = await writer.put(exchange("a", 2))
+            await writer.flush()
+            assert await writer.written(row)
+        asyncio.run(with_database(test))
+
+    def test_lost_connection_retried(self):
+        """Batches failing with a transient error are kept and retried, never dropped"""
+        async def test(writer, count, flushed):
+            writer.session_factory = FlakyFactory(writer.session_factory, failures=4)
+            rows = [await writer.put(exchange("a", i)) for i in range(2)]
+            for _ in range(2):
+                with pytest.raises(exc.OperationalError):
+                    await writer.flush()
+            assert len(writer) == 2
+            # Third failure: written one by one, and the first row fails again
+            with pytest.raises(exc.OperationalError):
+                await writer.flush()
+            await writer.flush()
+
+            assert all([await writer.written(row) for row in rows])
+            assert await count() == 2 and writer.stats()["rows_dropped"] == 0
+        asyncio.run(with_database(test))
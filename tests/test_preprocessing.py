@@ -0,0 +1,99 @@
+"""
+Tests for the concurrent request pre-processing pipeline
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from backend.preprocessing import PreprocessingPipeline, Stage, StageTimeout
+
+def after(seconds, value):
+    """Stage body returning `value` after `seconds`"""
+    async def run():
+        await asyncio.sleep(seconds)
+        return value
+    return run
+
+async def failing():
+    raise ValueError("indisponible")
+
+class TestPreprocessingPipeline:
+    """Test cases for running pre-processing stages concurrently"""
+
+    def test_stages_run_concurrently(self):
+        """The pipeline takes as long as its slowest stage, and reports the time saved"""
+        pipeline = PreprocessingPipeline(grace=1.0)
+        results = asyncio.run(pipeline.run([
+            Stage("history", after(0.1, ["turn"]), timeout=1.0, critical=True),
+            Stage("message", after(0.1, "adapted"), timeout=1.0),
+            Stage("knowledge", after(0.1, ["block"]), timeout=1.0),
+        ]))
+
+        assert results == {"history": ["turn"], "message": "adapted", "knowledge": ["block"]}
+        stats = pipeline.stats()
+        assert stats["mean_ms"] < 250
+        assert stats["mean_saved_ms"] > 100
+
+    def test_optional_stages_fall_back(self):
+        """Slow or failing optional stages give their default instead of delaying the prompt"""
+        pipeline = PreprocessingPipeline(grace=0.05)
+        results = asyncio.run(pipeline.run([
+            Stage("history", after(0, ["turn"]), timeout=1.0, critical=True),
+            Stage("message", failing, timeout=1.0, default="original"),
+            Stage("knowledge", after(5, ["block"]), timeout=10.0, default=[]),
+            Stage("summary", after(5, "summary"), timeout=0.01, default=""),
+        ]))
+
+        assert results == {"history": ["turn"], "message": "original", "knowledge": [], "summary": ""}
+        assert pipeline.stats()["fallbacks"] == {"message": 1, "knowledge": 1, "summary": 1}
+
+    def test_critical_stage_failure_fails_the_request(self):
+        """Without the history there is no prompt"""
+        pipeline = PreprocessingPipeline(grace=0.05)
+        with pytest.raises(StageTimeout) as raised:
+            asyncio.run(pipeline.run([
+                Stage("history", after(5, []), timeout=0.01, critical=True),
+                Stage("knowledge", after(0, ["block"]), timeout=1.0),
+            ]))
+        assert raised.value.stage == "history"
+
+class TestHistoryTimeout:
+    """Test cases for the chat endpoints when the history is too slow"""
+
+    def setup_method(self):
+        from backend import main
+        self.main = main
+
+        async def no_db():
+            yield None
+        main.app.dependency_overrides[main.get_async_db] = no_db
+
+    def teardown_method(self):
+        self.main.app.dependency_overrides.clear()
+
+    def post(self, path):
+        from fastapi.testclient import TestClient
+        main = self.main
+
+        async def slow_context(db, user_id, session_id):
+            await asyncio.sleep(5)
+        with patch.object(main, "verify_token", lambda token: "user"), \
+                patch.object(main, "_load_context", slow_context), \
+                patch.object(main.settings, "PREPROCESS_HISTORY_TIMEOUT_MS", 10), \
+                patch.object(type(main.chatbot), "model_loaded", True), \
+                patch.object(main.chatbot, "has_capacity", lambda: True):
+            return TestClient(main.app).post(
+                path, json={"message": "Bonjour", "session_id": "s"}, headers={"Authorization": "Bearer token"}
+            )
+
+    def test_chat_answers_503(self):
+        """/chat tells the client to retry instead of failing with a 500"""
+        response = self.post("/chat")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(self.main.settings.RETRY_AFTER_SECONDS)
+
+    def test_stream_answers_503(self):
+        """/chat/stream answers 503 before starting the stream"""
+        response = self.post("/chat/stream")
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
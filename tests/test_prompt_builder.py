@@ -0,0 +1,109 @@
+"""
+Tests for chat-template prompt assembly
+"""
+
+from backend.prompt_builder import PromptBuilder
+
+class WordTokenizer:
+    """Tokenizer giving each word an id, with a space marker before the first word of a text"""
+    bos_token_id = 1
+    eos_token = "</s>"
+    chat_template = None
+
+    def __init__(self):
+        self.vocab = {}
+        self.calls = 0
+
+    def __call__(self, text, add_special_tokens=True):
+        self.calls += 1
+        pieces = ("▁" + text).replace("\n", " \n ").split(" ")
+        return {"input_ids": [self.vocab.setdefault(piece, len(self.vocab) + 3) for piece in pieces if piece]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        words = {id: piece for piece, id in self.vocab.items()}
+        return " ".join(words[id] for id in ids).replace("▁", "")
+
+class TestPromptBuilder:
+    """Test cases for the rendered template and the cached segments"""
+
+    def setup_method(self):
+        self.tokenizer = WordTokenizer()
+        self.builder = PromptBuilder(self.tokenizer, cache_size=16)
+
+    def test_renders_chat_template(self):
+        """Messages use the <|system|>/<|user|>/<|assistant|> layout of the checkpoint"""
+        text = self.builder.render([("system", "Médecin"), ("user", "Bonjour")], add_generation_prompt=True)
+
+        assert text == "<|system|>\nMédecin</s>\n<|user|>\nBonjour</s>\n<|assistant|>\n"
+
+    def test_assembled_ids_match_full_tokenisation(self):
+        """Concatenated segments give the ids of the whole prompt tokenised at once"""
+        messages = [("user", "j'ai mal"), ("assistant", "reposez-vous"), ("user", "merci")]
+        text = self.builder.render([("system", "Médecin")] + messages, add_generation_prompt=True)
+
+        assert self.builder.build("Médecin", messages) == [1] + self.tokenizer(text)["input_ids"]
+
+    def test_segments_are_cached(self):
+        """A stored turn is only tokenised the first time it is used"""
+        self.builder.build("Médecin", [("user", "bonjour")])
+        calls = self.tokenizer.calls
+        self.builder.build("Médecin", [("user", "bonjour"), ("assistant", "salut"), ("user", "ça va")])
+
+        assert self.tokenizer.calls - calls == 2
+        assert self.builder.stats()["hits"] == 2
+
+class TestContextBudget:
+    """Test cases for fitting the context in a token budget"""
+
+    def setup_method(self):
+        self.builder = PromptBuilder(WordTokenizer())
+        self.turns = [{"message": f"question {i}", "response": f"réponse {i}"} for i in range(5)]
+
+    def prompt_size(self, messages):
+        return len(self.builder.build("Médecin", messages))
+
+    def test_everything_fits(self):
+        """With room to spare, all turns, the context and the knowledge are kept in prompt order"""
+        messages = self.builder.fit("Médecin", "merci", self.turns, 1000, user_context="âge 30", knowledge=["paludisme"])
+
+        assert messages[0] == ("system", "âge 30")
+        assert messages[-2:] == [("system", "paludisme"), ("user", "merci")]
+        assert len(messages) == 2 + 2 * len(self.turns) + 1
+
+    def test_oldest_turns_dropped_first(self):
+        """Under a tight budget the most recent turns are kept and the prompt fits"""
+        budget = self.prompt_size([("user", "merci")]) + 2 * self.builder.count("user", "question 4") + 2 * self.builder.count("assistant", "réponse 4")
+        messages = self.builder.fit("Médecin", "merci", self.turns, budget)
+
+        assert messages == [("user", "question 3"), ("assistant", "réponse 3"), ("user", "question 4"), ("assistant", "réponse 4"), ("user", "merci")]
+        assert self.prompt_size(messages) <= budget
+
+    def test_dropped_turns_summarized(self):
+        """Under a tight budget the turns left out go to the summary, which older turns make room for"""
+        def summarize(dropped):
+            return "résumé " + " ".join(turn["message"].split()[1] for turn in dropped)
+        turn_cost = self.builder.count("user", "question 4") + self.builder.count("assistant", "réponse 4")
+        budget = self.prompt_size([("user", "merci")]) + 3 * turn_cost + self.builder.count("system", "résumé")
+
+        messages = self.builder.fit("Médecin", "merci", self.turns, budget, summary="résumé", summarize=summarize)
+
+        assert messages[0] == ("system", "résumé 0 1 2")
+        assert messages[1:] == [("user", "question 3"), ("assistant", "réponse 3"), ("user", "question 4"), ("assistant", "réponse 4"), ("user", "merci")]
+        assert self.prompt_size(messages) <= budget
+
+    def test_shorter_knowledge_block(self):
+        """The most complete knowledge block that fits is used"""
+        full, short = "paludisme : fièvre frissons sueurs", "paludisme"
+        budget = self.prompt_size([("user", "merci")]) + self.builder.count("system", short)
+        messages = self.builder.fit("Médecin", "merci", [], budget, knowledge=[full, short])
+
+        assert messages == [("system", short), ("user", "merci")]
+
+    def test_long_message_truncated(self):
+        """A message larger than the budget is cut to fit"""
+        message = " ".join(f"mot{i}" for i in range(100))
+        budget = self.prompt_size([("user", "")]) + 10
+        messages = self.builder.fit("Médecin", message, self.turns, budget)
+
+        assert len(messages) == 1 and messages[0][1].startswith("mot0 mot1")
+        assert self.prompt_size(messages) <= budget
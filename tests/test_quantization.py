@@ -0,0 +1,69 @@
+"""
+Tests for the quantized inference modes
+"""
+
+import copy
+from unittest.mock import patch
+import pytest
+import torch
+import torch.nn as nn
+from backend.quantization import Int4WeightOnlyLinear, quantize_model
+
+def layer(in_features, out_features=8):
+    torch.manual_seed(0)
+    return nn.Linear(in_features, out_features)
+
+def max_error(quantized, linear, in_features):
+    """Largest output difference against the float layer, relative to the output range"""
+    x = torch.randn(4, in_features)
+    with torch.no_grad():
+        expected = linear(x)
+        return float((quantized(x) - expected).abs().max() / expected.abs().max())
+
+class TestInt4WeightOnlyLinear:
+    """Test cases for 4-bit weight packing"""
+
+    def test_nibbles_round_trip(self):
+        """Packed weights unpack to the same 4-bit levels, within half a step of the float weight"""
+        linear = layer(32)
+        quantized = Int4WeightOnlyLinear(linear, group_size=16)
+
+        assert quantized.packed.shape == (8, 16) and quantized.packed.dtype == torch.uint8
+        step = quantized.scale.float().repeat_interleave(16, dim=1).reshape(8, 32)
+        error = (quantized.dequantize() - linear.weight.detach()).abs()
+        assert bool((error <= step / 2 + 1e-3).all())
+        assert max_error(quantized, linear, 32) < 0.1
+
+    def test_odd_in_features(self):
+        """An odd number of input features pads the last byte instead of failing"""
+        linear = layer(15)
+        quantized = Int4WeightOnlyLinear(linear, group_size=5)
+
+        assert quantized.packed.shape == (8, 8)
+        assert quantized.dequantize().shape == (8, 15)
+        assert max_error(quantized, linear, 15) < 0.1
+
+class TestQuantizeModel:
+    """Test cases for the quantization modes of a whole model"""
+
+    def test_int8(self):
+        """Dynamic int8 quantization stays close to the float model"""
+        reference = nn.Sequential(layer(32))
+        model = quantize_model(copy.deepcopy(reference), "int8")
+
+        assert type(model[0]) is not nn.Linear
+        assert max_error(model, reference, 32) < 0.05
+
+    def test_int4_skips_indivisible_layers(self):
+        """Layers whose width is not a multiple of the group size stay in full precision"""
+        with patch("backend.quantization.settings.QUANT_GROUP_SIZE", 8):
+            model = quantize_model(nn.Sequential(layer(64), nn.ReLU(), layer(8, 4), nn.Linear(4, 2)), "int4")
+
+        assert isinstance(model[0], Int4WeightOnlyLinear)
+        assert isinstance(model[2], Int4WeightOnlyLinear)
+        assert type(model[3]) is nn.Linear
+
+    def test_unknown_mode(self):
+        """Only the listed modes are accepted"""
+        with pytest.raises(ValueError):
+            quantize_model(nn.Sequential(layer(8)), "int2")
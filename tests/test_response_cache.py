@@ -0,0 +1,69 @@
+"""
+Tests for the response cache of repeated questions
+"""
+
+import asyncio
+import threading
+import time
+from backend.response_cache import ResponseCache, cache_key, normalize_message
+
+class TestResponseCache:
+    """Test cases for key normalisation, expiry, eviction and the disk tier"""
+
+    def test_normalized_questions_share_a_key(self):
+        """Case, spacing and punctuation do not change the key"""
+        assert normalize_message("Est-ce que je peux prendre du Paracétamol ?") == \
+            normalize_message("est ce que  je peux prendre du paracétamol")
+        assert cache_key("Fièvre ?", "diagnostic", "fr", "h") == cache_key("fièvre", "diagnostic", "fr", "h")
+        assert cache_key("Fièvre ?", "diagnostic", "fr", "h") != cache_key("Fièvre ?", "diagnostic", "en", "h")
+
+    def test_ttl_expiry(self):
+        """Entries are not served past their time to live"""
+        cache = ResponseCache(max_entries=10, ttl_seconds=0, disk_path="")
+        cache.put("k", "réponse")
+        time.sleep(0.01)
+
+        assert cache.get("k") is None
+        assert cache.misses == 1
+
+    def test_lru_eviction(self):
+        """The least recently used answer is evicted first"""
+        cache = ResponseCache(max_entries=2, ttl_seconds=60, disk_path="")
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.evictions == 1
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """A new cache on the same file serves answers stored by the previous one"""
+        path = str(tmp_path / "responses.db")
+        ResponseCache(max_entries=10, ttl_seconds=60, disk_path=path).put("k", "réponse")
+
+        cache = ResponseCache(max_entries=10, ttl_seconds=60, disk_path=path)
+
+        assert cache.get("k") == "réponse"
+        assert cache.disk_hits == 1
+
+    def test_disk_tier_off_the_event_loop(self, tmp_path):
+        """get_async and put_async only touch the disk tier on a worker thread"""
+        path = str(tmp_path / "responses.db")
+        cache = ResponseCache(max_entries=10, ttl_seconds=60, disk_path=path)
+        threads = []
+        disk_get, disk_put = cache._disk_get, cache._disk_put
+        cache._disk_get = lambda *args: threads.append(threading.current_thread()) or disk_get(*args)
+        cache._disk_put = lambda *args: threads.append(threading.current_thread()) or disk_put(*args)
+
+        async def run():
+            await cache.put_async("k", "réponse")
+            # Served from memory, without reading the disk
+            assert await cache.get_async("k") == "réponse"
+            cache._entries.clear()
+            return await cache.get_async("k"), await cache.get_async("other")
+
+        assert asyncio.run(run()) == ("réponse", None)
+        assert len(threads) == 3 and threading.main_thread() not in threads
+        assert (cache.hits, cache.disk_hits, cache.misses) == (2, 1, 1)
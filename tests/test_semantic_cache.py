@@ -0,0 +1,41 @@
+"""
+Tests for the semantic answer cache index
+"""
+
+import numpy as np
+from backend.semantic_cache import SemanticCache
+
+def unit(*values):
+    """Unit-length float32 vector"""
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+class TestSemanticCache:
+    """Test cases for nearest-neighbour lookups"""
+
+    def test_similar_question_hits(self):
+        """A close enough vector in the same language returns the stored answer"""
+        cache = SemanticCache(threshold=0.9, max_entries=10)
+        cache.add(unit(1, 0, 0), "fr", "j'ai de la fièvre depuis hier", "Buvez beaucoup d'eau.")
+
+        assert cache.lookup(unit(1, 0.1, 0), "fr") == "Buvez beaucoup d'eau."
+        assert cache.lookup(unit(0, 1, 0), "fr") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_language_filter(self):
+        """Answers are only reused for questions in the same language"""
+        cache = SemanticCache(threshold=0.9, max_entries=10)
+        cache.add(unit(1, 0), "fr", "fièvre", "réponse")
+
+        assert cache.lookup(unit(1, 0), "en") is None
+
+    def test_oldest_entries_are_overwritten(self):
+        """The index keeps at most max_entries answers"""
+        cache = SemanticCache(threshold=0.9, max_entries=2)
+        cache.add(unit(1, 0, 0), "fr", "a", "1")
+        cache.add(unit(0, 1, 0), "fr", "b", "2")
+        cache.add(unit(0, 0, 1), "fr", "c", "3")
+
+        assert len(cache) == 2
+        assert cache.lookup(unit(1, 0, 0), "fr") is None
+        assert cache.lookup(unit(0, 0, 1), "fr") == "3"
@@ -0,0 +1,98 @@
+"""
+Tests for the per-session KV cache store
+"""
+
+import asyncio
+import torch
+from backend import kv_cache
+from backend.chatbot import MedicalChatbot
+from backend.config import settings
+from backend.prompt_builder import PromptBuilder
+from backend.session_cache import SessionKVCache
+
+def make_cache(length):
+    """Create a one-layer cache of `length` positions"""
+    return ((torch.randn(1, 2, length, 4), torch.randn(1, 2, length, 4)),)
+
+class WordTokenizer:
+    """Tokenizer giving each word an id"""
+    bos_token_id = 1
+    eos_token = "</s>"
+    chat_template = None
+
+    def __init__(self):
+        self.vocab = {}
+
+    def __call__(self, text, add_special_tokens=True):
+        return {"input_ids": [self.vocab.setdefault(piece, len(self.vocab) + 3) for piece in text.split()]}
+
+class TestSessionKVCache:
+    """Test cases for session cache lookups and eviction"""
+
+    def test_hit_returns_common_prefix(self):
+        """Only the part shared with the new prompt is reused"""
+        store = SessionKVCache(max_bytes=10**6)
+        store.put("u:s", [1, 2, 3, 4], make_cache(4))
+
+        prefix = store.take("u:s", [1, 2, 3, 9, 9])
+
+        assert prefix.token_ids == [1, 2, 3]
+        assert kv_cache.seq_length(prefix.past) == 3
+        assert store.hits == 1
+
+    def test_full_match_leaves_one_token_to_prefill(self):
+        """A prompt equal to the cached tokens still prefills its last token"""
+        store = SessionKVCache(max_bytes=10**6)
+        store.put("u:s", [1, 2, 3], make_cache(3))
+
+        assert store.take("u:s", [1, 2, 3]).token_ids == [1, 2]
+
+    def test_miss(self):
+        """Unknown sessions and diverging prompts fall back to full encoding"""
+        store = SessionKVCache(max_bytes=10**6)
+        store.put("u:s", [5, 6], make_cache(2))
+
+        assert store.take("u:other", [5, 6, 7]) is None
+        assert store.take("u:s", [1, 2, 3]) is None
+        assert store.misses == 2
+
+    def test_lru_eviction_under_byte_budget(self):
+        """Least recently used sessions are evicted to stay under the budget"""
+        entry_size = kv_cache.nbytes(make_cache(10))
+        store = SessionKVCache(max_bytes=2 * entry_size)
+        store.put("a", list(range(10)), make_cache(10))
+        store.put("b", list(range(10)), make_cache(10))
+        store.put("c", list(range(10)), make_cache(10))
+
+        assert len(store) == 2
+        assert store.take("a", list(range(11))) is None
+        assert store.total_bytes <= store.max_bytes
+        assert store.evictions == 1
+
+class TestLongSession:
+    """Test cases for the session cache of conversations longer than the loaded history"""
+
+    def test_prompt_extends_the_cached_one(self):
+        """Past MAX_CONVERSATION_LENGTH turns, each prompt still reuses the previous one but when the window moves"""
+        chatbot = MedicalChatbot.__new__(MedicalChatbot)
+        chatbot.model = None
+        chatbot.summarizer = None
+        chatbot.prefix_caches = {}
+        chatbot.medical_prompts = {"diagnostic": "Médecin"}
+        chatbot.prompt_builder = PromptBuilder(WordTokenizer())
+        chatbot.session_cache = SessionKVCache(max_bytes=10**8)
+
+        turns = [{"id": i + 1, "turn": i, "message": f"question {i}", "response": f"réponse {i}"} for i in range(3 * settings.MAX_CONVERSATION_LENGTH)]
+        reused, previous = [], []
+        for count in range(len(turns)):
+            history = turns[:count][-settings.MAX_CONVERSATION_LENGTH:]
+            message = f"question {count}"
+            prefix, rest = asyncio.run(chatbot._build_prompt(message, "fr", history, None, "u:s", adapted_message=message, knowledge=[]))
+            prompt_ids = (prefix.token_ids if prefix is not None else []) + rest
+            # All of the previous prompt but its generation prompt, where the answer was
+            reused.append(prefix is not None and len(prefix.token_ids) >= len(previous) - len(chatbot.prompt_builder.generation_prompt_ids))
+            chatbot.session_cache.put("u:s", prompt_ids, make_cache(len(prompt_ids)))
+            previous = prompt_ids
+
+        long_session = reused[2 * settings.MAX_CONVERSATION_LENGTH:]
+        assert sum(long_session) >= len(long_session) * (1 - 1 / settings.CONTEXT_TURN_STRIDE) - 1
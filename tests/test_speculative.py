@@ -0,0 +1,36 @@
+"""
+Tests for prompt-lookup draft proposals and their verification
+"""
+
+import torch
+from backend.batching import verify_draft
+from backend.speculative import PromptLookupDrafter
+
+class TestPromptLookupDrafter:
+    """Test cases for n-gram draft proposals"""
+
+    def test_draft_from_context(self):
+        """The tokens that followed the last n-gram earlier in the sequence are proposed"""
+        drafter = PromptLookupDrafter(num_tokens=3, max_ngram=2, min_ngram=1)
+
+        assert drafter.draft([5, 6, 7, 8, 9, 1, 5, 6]) == [7, 8, 9]
+
+    def test_draft_from_documents(self):
+        """Phrases of the indexed documents are proposed when the sequence has no match"""
+        drafter = PromptLookupDrafter(num_tokens=2, max_ngram=2, min_ngram=2)
+        drafter.add_document([10, 11, 12, 13, 14])
+
+        assert drafter.draft([1, 2, 11, 12]) == [13, 14]
+        assert drafter.draft([1, 2, 3]) == []
+
+class TestVerifyDraft:
+    """Test cases for greedy draft verification"""
+
+    def test_keeps_agreeing_prefix(self):
+        """Draft tokens are kept up to the first disagreement, then the model's token follows"""
+        logits = torch.full((4, 10), -1.0)
+        for position, token in enumerate([3, 4, 7, 2]):
+            logits[position, token] = 1.0
+
+        assert verify_draft(logits, [3, 4, 5], temperature=0, top_p=1.0) == [3, 4, 7]
+        assert verify_draft(logits[:3], [3, 4], temperature=0, top_p=1.0) == [3, 4, 7]
@@ -0,0 +1,102 @@
+"""
+Tests for rolling conversation summaries
+"""
+
+from unittest.mock import patch
+from backend.chatbot import MedicalChatbot
+from backend.config import settings
+from backend.prompt_builder import PromptBuilder
+from backend.summary import ConversationSummarizer
+
+class WordTokenizer:
+    """Tokenizer giving each word an id"""
+    bos_token_id = 1
+    eos_token = "</s>"
+    chat_template = None
+
+    def __init__(self):
+        self.vocab = {}
+
+    def __call__(self, text, add_special_tokens=True):
+        return {"input_ids": [self.vocab.setdefault(piece, len(self.vocab) + 3) for piece in text.split()]}
+
+class TestConversationSummarizer:
+    """Test cases for extractive, incremental summaries"""
+
+    def setup_method(self):
+        """Summarise with the entities of the shipped knowledge base"""
+        self.summarizer = ConversationSummarizer('data/medical_knowledge.json', max_items=2)
+        self.summarizer.load()
+
+    def test_extracts_knowledge_entities(self):
+        """Symptoms come from the user, conditions and medications from both sides"""
+        summary = self.summarizer.update(None, [
+            {"message": "J'ai de la fièvre et des frissons", "response": "Cela peut être le paludisme, prenez du paracétamol"},
+        ])
+
+        assert summary["symptoms"] == ["fièvre", "frissons"]
+        assert summary["conditions"] == ["Paludisme"]
+        assert summary["medications"] == ["Paracétamol"]
+        assert self.summarizer.render(summary).startswith("Résumé des 1 échanges précédents")
+
+    def test_incremental_and_bounded(self):
+        """Updates extend the summary without changing the previous one, keeping the latest entities"""
+        first = self.summarizer.update(None, [{"message": "fièvre", "response": ""}])
+        second = self.summarizer.update(first, [
+            {"message": "frissons", "response": ""},
+            {"message": "nausées", "response": ""},
+        ])
+
+        assert first["symptoms"] == ["fièvre"]
+        assert second["symptoms"] == ["frissons", "nausées"]
+        assert second["turns"] == 3
+
+    def test_nothing_to_summarise(self):
+        """Turns without knowledge base entities render no summary"""
+        assert self.summarizer.render(self.summarizer.update(None, [{"message": "Bonjour", "response": "Bonjour"}])) == ""
+
+class TestContextWindow:
+    """Test cases for the prompt window of long sessions"""
+
+    def setup_method(self):
+        self.chatbot = MedicalChatbot.__new__(MedicalChatbot)
+        self.chatbot.summarizer = ConversationSummarizer('data/medical_knowledge.json')
+        self.chatbot.summarizer.load()
+
+    def history(self, turns):
+        """Last MAX_CONVERSATION_LENGTH of `turns` turns, as loaded for the prompt"""
+        return [{"id": i + 1, "turn": i, "message": "fièvre", "response": ""} for i in range(turns)][-settings.MAX_CONVERSATION_LENGTH:]
+
+    def test_window_moves_every_stride_past_the_history_limit(self):
+        """Past MAX_CONVERSATION_LENGTH turns the window still starts at the same turn for CONTEXT_TURN_STRIDE turns"""
+        starts = [self.chatbot._context_window(self.history(turns))[0]["turn"] for turns in range(1, 3 * settings.MAX_CONVERSATION_LENGTH)]
+
+        moves = [turns for turns in range(1, len(starts)) if starts[turns] != starts[turns - 1]]
+        assert all(starts[turns] - starts[turns - 1] == settings.CONTEXT_TURN_STRIDE for turns in moves)
+        assert all(later - earlier == settings.CONTEXT_TURN_STRIDE for earlier, later in zip(moves, moves[1:]))
+        assert moves[-1] > settings.MAX_CONVERSATION_LENGTH + settings.CONTEXT_TURN_STRIDE
+
+    def test_summary_covers_the_turns_before_the_window(self):
+        """Updated after every turn, the summary ends right before the window and only changes when it moves"""
+        summary, updates = None, 0
+        for turns in range(1, 2 * settings.MAX_CONVERSATION_LENGTH):
+            history = self.history(turns)
+            updated = self.chatbot.update_summary(summary, history)
+            if updated is not None:
+                summary, updates = updated, updates + 1
+            start = self.chatbot._context_window(history)[0]["turn"]
+            assert (summary["turns"] if summary else 0) == start
+        assert updates == summary["turns"] // settings.CONTEXT_TURN_STRIDE
+
+    def test_turns_over_budget_summarized(self):
+        """Window turns the token budget leaves out are folded into the summary of the prompt"""
+        self.chatbot.model = None
+        self.chatbot.prompt_builder = PromptBuilder(WordTokenizer())
+        history = [{"id": 1, "turn": 0, "message": "J'ai de la fièvre", "response": "Buvez de l'eau"}] + [
+            {"id": i + 1, "turn": i, "message": f"question {i} " * 10, "response": f"réponse {i} " * 10} for i in range(1, 4)
+        ]
+        with patch.object(settings, "MAX_TOKENS", 100):
+            messages = self.chatbot._build_context("Médecin", "merci", history, None, [])
+
+        assert ("user", history[0]["message"]) not in messages
+        assert messages[0][0] == "system" and "fièvre" in messages[0][1]
@@ -0,0 +1,162 @@
+"""
+Tests for the translation memory and the offline translation backend
+"""
+
+import asyncio
+import json
+import sqlite3
+from backend.config import settings
+from backend.translation import Glossary, PhraseTableBackend, TranslationBackend, TranslationMemory, TranslationService, term_key
+
+class CountingBackend(TranslationBackend):
+    """Backend upper-casing segments and recording what it is asked"""
+    name = "counting"
+
+    def __init__(self):
+        self.requests = []
+
+    async def translate_batch(self, texts, source, target):
+        self.requests.append(list(texts))
+        return [text.upper() for text in texts]
+
+class TestPhraseTableBackend:
+    """Test cases for dictionary translation"""
+
+    def setup_method(self):
+        glossary = Glossary()
+        glossary.add_terms([{"fr": "fièvre", "en": "fever"}, {"fr": "maux de tête", "en": "headache"}, {"fr": "toux", "en": "cough"}])
+        self.backend = PhraseTableBackend(glossary, min_coverage=0.75)
+
+    def test_longest_phrase_first(self):
+        """Multi-word terms are translated as a whole, in both directions"""
+        assert self.backend.translate("Fièvre, maux de tête et toux", "fr", "en") == "fever, headache et cough"
+        assert self.backend.translate("headache", "en", "fr") == "maux de tête"
+
+    def test_low_coverage_left_untranslated(self):
+        """Sentences the table barely knows are not translated"""
+        assert self.backend.translate("J'ai de la fièvre", "fr", "en") is None
+        assert self.backend.translate("fièvre", "fr", "swahili") is None
+
+    def test_glossary_lookup_any_source(self):
+        """Whole terms resolve from whichever language they are written in"""
+        glossary = self.backend.glossary
+        assert glossary.lookup("Maux  de tête", "en") == "headache"
+        assert glossary.lookup("cough", "fr") == "toux"
+        assert glossary.lookup("cough", "fr", source="wolof") is None
+        assert glossary.lookup("mal au dos", "en") is None
+
+    def test_ambiguous_term_only_translated_to(self):
+        """A term naming two concepts is never looked up, but still translated to"""
+        glossary = Glossary()
+        glossary.add_terms([{"fr": "ventre", "en": "stomach", "hausa": "ciki"}, {"fr": "grossesse", "en": "pregnancy", "hausa": "ciki"}])
+        backend = PhraseTableBackend(glossary, min_coverage=0.5)
+
+        assert backend.translate("ciki", "hausa", "fr") is None
+        assert glossary.lookup("ciki", "fr") is None
+        assert glossary.lookup("ciki", "en", source="hausa") is None
+        assert glossary.lookup("ventre", "hausa") == "ciki"
+        assert glossary.lookup("grossesse", "en") == "pregnancy"
+
+    def test_synonyms_share_a_concept(self):
+        """Listed synonyms all translate to the first one, without being ambiguous"""
+        glossary = Glossary()
+        glossary.add_terms([{"fr": ["maux de tête", "mal de tête"], "hausa": "ciwon kai"}])
+        assert glossary.lookup("mal de tête", "hausa") == "ciwon kai"
+        assert glossary.lookup("ciwon kai", "fr") == "maux de tête"
+        assert not glossary.ambiguous
+
+    def test_shipped_glossary_unambiguous(self):
+        """No term of the shipped glossary names two concepts, in its language or across languages"""
+        with open(settings.MEDICAL_GLOSSARY_PATH, "r", encoding="utf-8") as f:
+            terms = json.load(f)["terms"]
+        concepts = {}
+        for concept, entry in enumerate(terms):
+            for language, names in entry.items():
+                for name in [names] if isinstance(names, str) else names:
+                    concepts.setdefault(term_key(name), set()).add(concept)
+        assert {key: found for key, found in concepts.items() if len(found) > 1} == {}
+
+        glossary = Glossary()
+        glossary.add_terms(terms)
+        assert not glossary.ambiguous
+        assert glossary.lookup("ciki", "fr") == "ventre"
+        assert glossary.lookup("kai", "fr") is None
+
+class TestTranslationService:
+    """Test cases for the translation memory in front of the backend"""
+
+    def setup_method(self):
+        self.backend = CountingBackend()
+        self.service = TranslationService(self.backend, TranslationMemory(":memory:", encrypt=False), store_messages=True)
+
+    def test_memory_serves_repeated_segments(self):
+        """Only unseen, deduplicated segments reach the backend"""
+        first = asyncio.run(self.service.translate("Bonjour. Merci.", "fr", "en"))
+        second = asyncio.run(self.service.translate_batch(["Merci.", "Merci.", "Au revoir."], "fr", "en"))
+
+        assert first == "BONJOUR. MERCI."
+        assert second == ["MERCI.", "MERCI.", "AU REVOIR."]
+        assert self.backend.requests == [["Bonjour.", "Merci."], ["Au revoir."]]
+        assert self.service.stats()["hits"] == 2
+
+    def test_prewarm_from_knowledge_base(self):
+        """Condition names are stored for every pair of their languages"""
+        assert self.service.prewarm('data/medical_knowledge.json') > 0
+        assert asyncio.run(self.service.translate_batch(["Paludisme"], "fr", "en")) == ["Malaria"]
+        assert self.backend.requests == []
+
+    def test_messages_not_stored_by_default(self, tmp_path):
+        """Without the opt-in only pre-warmed rows stay, and message rows left by an older run are deleted"""
+        path = str(tmp_path / "memory.db")
+        TranslationMemory(path, encrypt=False).put_many([("fr", "en", "J'ai mal.", "I am in pain.")], "google")
+        service = TranslationService(self.backend, TranslationMemory(path, encrypt=False), store_messages=False)
+        service.prewarm('data/medical_knowledge.json')
+        asyncio.run(service.translate("Merci.", "fr", "en"))
+
+        origins = sqlite3.connect(path).execute("SELECT DISTINCT origin FROM translations").fetchall()
+        assert origins == [("knowledge",)]
+
+    def test_encrypted_memory(self, tmp_path):
+        """Stored messages are only found again through the key, never in clear on disk"""
+        path = str(tmp_path / "memory.db")
+        service = TranslationService(self.backend, TranslationMemory(path, encrypt=True), store_messages=True)
+        asyncio.run(service.translate("Mon enfant tousse.", "fr", "en"))
+
+        assert asyncio.run(service.translate_batch(["Mon enfant tousse."], "fr", "en")) == ["MON ENFANT TOUSSE."]
+        assert len(self.backend.requests) == 1
+        with open(path, "rb") as f:
+            assert b"tousse" not in f.read().lower()
+
+class TestMedicalTermBatch:
+    """Test cases for batched medical-term translation"""
+
+    def setup_method(self):
+        from backend.language_adapter import LanguageAdapter
+        self.adapter = LanguageAdapter()
+        self.backend = CountingBackend()
+        self.adapter.translator = TranslationService(self.backend, TranslationMemory(":memory:"))
+
+    def test_glossary_first_then_one_batch_per_language(self):
+        """Known terms never reach the backend; the deduplicated misses go in a single call"""
+        result = asyncio.run(self.adapter.translate_medical_terms_batch(
+            ["fièvre", "toux", "fièvre", "mal au dos", "mal au dos"], ["en", "wolof"]
+        ))
+
+        assert result["en"] == {"fièvre": "fever", "toux": "cough", "mal au dos": "MAL AU DOS"}
+        assert result["wolof"]["fièvre"] == "tang"
+        assert sorted(self.backend.requests) == [["mal au dos"], ["mal au dos"]]
+
+    def test_ambiguous_terms_left_to_the_translator(self):
+        """Terms naming two concepts are never answered from the glossary"""
+        self.adapter.glossary.add_terms([{"fr": "rhume", "hausa": "mura"}, {"fr": "grippe", "hausa": "mura"}])
+        result = asyncio.run(self.adapter.translate_medical_terms_batch(["ciki", "kai", "mura"], ["fr", "en"], "hausa"))
+
+        assert result["fr"] == {"ciki": "ventre", "kai": "KAI", "mura": "MURA"}
+        assert result["en"] == {"ciki": "stomach", "kai": "KAI", "mura": "MURA"}
+        assert sorted(self.backend.requests) == [["kai", "mura"], ["kai", "mura"]]
+
+    def test_local_terms_unambiguous(self):
+        """The local terms of each language are one concept per English term"""
+        assert not self.adapter.glossary.ambiguous
+        assert self.adapter.glossary.lookup("headache", "wolof") == "bopp bu yar"
+        assert self.adapter.glossary.lookup("stomach", "hausa") == "ciki"